@@ -0,0 +1,61 @@
+"""
+Compares the barrel purchase solvers on synthetic wholesale catalogs of 10
+to 5,000 barrels: solve time, ml bought and gold spent. Runs entirely in
+memory:
+
+    python -m benchmarks.barrel_solver
+"""
+import time
+
+import numpy as np
+
+from src import planning
+from src.api.barrels import Barrel
+
+SIZES = [10, 100, 1000, 5000]
+COLOURS = np.eye(4, dtype=int)
+
+
+def synthetic_catalog(n, rng):
+    """Random barrels, mostly single-colour with some mixed ones."""
+    catalog = []
+    for i in range(n):
+        potion_type = COLOURS[rng.integers(0, 4)].copy()
+        if rng.random() < 0.2:
+            potion_type[rng.integers(0, 4)] = 1
+        ml = int(rng.choice([500, 1000, 2500, 10000]))
+        catalog.append(
+            Barrel(
+                sku=f"BARREL_{i}",
+                ml_per_barrel=ml,
+                potion_type=potion_type.tolist(),
+                price=int(ml / 10 * rng.uniform(0.6, 1.6)),
+                quantity=int(rng.integers(1, 20)),
+            )
+        )
+    return catalog
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    gold, ml_left, budget = 5000, 30000, 1500
+    buyable_ml = [8000, 8000, 6000, 4000]
+    print(
+        f"{'barrels':>8} {'solver':>8} {'time (ms)':>10} "
+        f"{'ml bought':>10} {'gold spent':>11}"
+    )
+    for size in SIZES:
+        catalog = synthetic_catalog(size, rng)
+        by_sku = {barrel.sku: barrel for barrel in catalog}
+        for name, solver in planning.BARREL_PLANNERS.items():
+            start = time.perf_counter()
+            plan = solver(catalog, gold, ml_left, budget, buyable_ml)
+            elapsed = time.perf_counter() - start
+            ml = sum(
+                by_sku[p["sku"]].ml_per_barrel
+                * sum(by_sku[p["sku"]].potion_type)
+                * p["quantity"]
+                for p in plan
+            )
+            spent = sum(by_sku[p["sku"]].price * p["quantity"] for p in plan)
+            print(f"{size:>8} {name:>8} {elapsed * 1000:>10.1f} {ml:>10} {spent:>11}")
@@ -0,0 +1,63 @@
+"""
+Compares the bottling planners on synthetic catalogs of 10 to 10,000 potion
+types: solve time, expected revenue of the plan and ml left unused. Runs
+entirely in memory:
+
+    python -m benchmarks.bottle_planner
+"""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from src import planning
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def synthetic_potions(n, rng):
+    """Random potion types with parts summing to 100, ordered like the bottler query."""
+    cuts = np.sort(rng.integers(0, 101, size=(n, 3)), axis=1)
+    types = np.diff(np.hstack([np.zeros((n, 1)), cuts, np.full((n, 1), 100)]), axis=1)
+    potions = [
+        SimpleNamespace(
+            potion_type=[int(part) for part in types[i]],
+            price=int(rng.integers(20, 60)),
+            recent_amt_sold=int(rng.poisson(2)),
+            favorability=float(rng.choice([0.5, 1.0, 1.5])),
+            brewable_pt=int(rng.integers(1, 30)),
+        )
+        for i in range(n)
+    ]
+    potions.sort(
+        key=lambda p: (p.recent_amt_sold, p.favorability, p.brewable_pt), reverse=True
+    )
+    return potions
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(
+        f"{'potions':>8} {'planner':>11} {'time (ms)':>10} "
+        f"{'revenue':>10} {'ml unused':>10}"
+    )
+    for size in SIZES:
+        potions = synthetic_potions(size, rng)
+        ml_list = [5000, 5000, 5000, 5000]
+        potions_left = 150
+        revenue = dict(
+            zip(
+                (tuple(p.potion_type) for p in potions),
+                planning.expected_revenue(potions),
+            )
+        )
+        for name, planner in planning.BOTTLE_PLANNERS.items():
+            start = time.perf_counter()
+            plan = planner(potions, ml_list, potions_left)
+            elapsed = time.perf_counter() - start
+            value = sum(revenue[tuple(p["potion_type"])] * p["quantity"] for p in plan)
+            used = sum(part * p["quantity"] for p in plan for part in p["potion_type"])
+            print(
+                f"{size:>8} {name:>11} {elapsed * 1000:>10.1f} {value:>10.0f} "
+                f"{sum(ml_list) - used:>10}"
+            )
@@ -0,0 +1,105 @@
+"""
+Times /bottler/deliver for payloads of 1 to 1,000 line items, comparing the
+single bulk statement against the previous one-INSERT-per-potion loop.
+
+Both paths write real ledger rows, so run this against a scratch database
+and call /admin/reset afterwards:
+
+    python -m benchmarks.bottler_deliver
+"""
+import asyncio
+import itertools
+import time
+
+import sqlalchemy
+
+from src import database as db
+from src.api import bottler
+
+SIZES = [1, 10, 100, 1000]
+ROUNDS = 5
+
+
+def per_potion_deliver(potions_delivered):
+    """The delivery path before bulk inserts, kept as the baseline."""
+    with db.engine.begin() as connection:
+        total_ml = [0, 0, 0, 0]
+        for potion in potions_delivered:
+            for i in range(4):
+                total_ml[i] += potion.potion_type[i] * potion.quantity
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potion_records (sku, qty_change)
+                    SELECT sku, :quantity FROM potion_index
+                        WHERE red_pct = :red
+                          AND green_pct = :green
+                          AND blue_pct = :blue
+                          AND dark_pct = :dark
+                    """
+                ),
+                {
+                    "quantity": potion.quantity,
+                    "red": potion.potion_type[0],
+                    "green": potion.potion_type[1],
+                    "blue": potion.potion_type[2],
+                    "dark": potion.potion_type[3],
+                },
+            )
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO ml_records (red, green, blue, dark)
+                     VALUES (:red * -1, :green * -1, :blue * -1, :dark * -1)
+                """
+            ),
+            dict(zip(["red", "green", "blue", "dark"], total_ml)),
+        )
+
+
+async def best_of(fn, payload):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = fn(payload)
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def main():
+    # Deliveries are idempotent on order_id, so every call needs a fresh one.
+    order_ids = itertools.count(time.time_ns())
+    with db.engine.begin() as connection:
+        potion_types = (
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT ARRAY[red_pct, green_pct, blue_pct, dark_pct]
+                      FROM potion_index
+                    """
+                )
+            )
+            .scalars()
+            .all()
+        )
+    print(f"{'items':>6} {'per-potion (ms)':>16} {'bulk (ms)':>10} {'speedup':>8}")
+    for size in SIZES:
+        payload = [
+            bottler.PotionInventory(
+                potion_type=potion_types[i % len(potion_types)], quantity=1
+            )
+            for i in range(size)
+        ]
+        loop = await best_of(per_potion_deliver, payload)
+        bulk = await best_of(
+            lambda p: bottler.post_deliver_bottles(p, next(order_ids)), payload
+        )
+        print(
+            f"{size:>6} {loop * 1000:>16.1f} {bulk * 1000:>10.1f} {loop / bulk:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Compares three ways a customer can buy an N-item cart against a running
+shop: one /carts/{id}/items/{sku} call per item, one batch /carts/{id}/items
+call, and the single /carts/purchase call. Reports carts/s for each.
+
+    python -m benchmarks.cart_batch --carts 500 --items 6 --concurrency 16
+
+Needs httpx and API_KEY set to the shop's key. The carts are real and most
+checkouts sell potions, so run it against a scratch database.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import dotenv
+import httpx
+
+CUSTOMER = {"customer_name": "bench", "character_class": "Bench", "level": 1}
+
+
+async def per_item(client, skus):
+    cart_id = (await client.post("/carts/", json=CUSTOMER)).json()["cart_id"]
+    for sku in skus:
+        await client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": 1})
+    return await client.post(f"/carts/{cart_id}/checkout", json={"payment": "bench"})
+
+
+async def batch(client, skus):
+    cart_id = (await client.post("/carts/", json=CUSTOMER)).json()["cart_id"]
+    await client.post(
+        f"/carts/{cart_id}/items", json=[{"sku": sku, "quantity": 1} for sku in skus]
+    )
+    return await client.post(f"/carts/{cart_id}/checkout", json={"payment": "bench"})
+
+
+async def purchase(client, skus):
+    return await client.post(
+        "/carts/purchase",
+        json={
+            "customer": CUSTOMER,
+            "items": [{"sku": sku, "quantity": 1} for sku in skus],
+            "payment": "bench",
+        },
+    )
+
+
+async def run(client, path, carts, concurrency, skus):
+    """Buys carts carts with at most concurrency in flight; returns carts/s."""
+    remaining = iter(range(carts))
+
+    async def worker():
+        for _ in remaining:
+            response = await path(client, skus)
+            # Running out of stock part way through is fine; errors are not.
+            if response.status_code not in (200, 409):
+                response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return carts / (time.perf_counter() - start)
+
+
+async def main(url, carts, items, concurrency):
+    dotenv.load_dotenv()
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=url, headers=headers, limits=limits
+    ) as client:
+        catalog = (await client.get("/catalog/")).json()
+        skus = [potion["sku"] for potion in catalog][:items]
+        if len(skus) < items:
+            raise SystemExit(f"the catalog only lists {len(skus)} potions")
+        print(f"{'path':>10} {'carts/s':>8} {'requests/cart':>14}")
+        for name, path, requests in [
+            ("per item", per_item, items + 2),
+            ("batch", batch, 3),
+            ("purchase", purchase, 1),
+        ]:
+            rate = await run(client, path, carts, concurrency, skus)
+            print(f"{name:>10} {rate:>8.1f} {requests:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--carts", type=int, default=500)
+    parser.add_argument("--items", type=int, default=6, help="distinct skus per cart")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.carts, args.items, args.concurrency))
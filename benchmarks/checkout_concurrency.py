@@ -0,0 +1,90 @@
+"""
+Fires hundreds of checkouts at once against limited stock of one potion and
+checks that none oversell: the potion's balance must never go negative and
+must still equal its ledger total. Reports checkout throughput.
+
+Writes real carts and ledger rows, so run it against a scratch database:
+
+    python -m benchmarks.checkout_concurrency --carts 500 --stock 200
+"""
+import argparse
+import asyncio
+import time
+
+import sqlalchemy
+from fastapi import HTTPException
+
+from src import database as db
+from src.api import bottler, carts
+
+
+async def main(n_carts, stock, potion_type):
+    await bottler.post_deliver_bottles(
+        [bottler.PotionInventory(potion_type=potion_type, quantity=stock)],
+        time.time_ns(),
+    )
+    async with db.async_engine.begin() as connection:
+        sku, before = (
+            await connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT potion_index.sku, potion_balances.quantity
+                      FROM potion_index
+                      JOIN potion_balances ON potion_balances.sku = potion_index.sku
+                     WHERE ARRAY[red_pct, green_pct, blue_pct, dark_pct] = :potion_type
+                    """
+                ),
+                {"potion_type": potion_type},
+            )
+        ).one()
+
+    cart_ids = []
+    for i in range(n_carts):
+        customer = carts.Customer(
+            customer_name=f"bench-{i}", character_class="Bench", level=1
+        )
+        cart_id = (await carts.create_cart(customer))["cart_id"]
+        await carts.set_item_quantity(cart_id, sku, carts.CartItem(quantity=1))
+        cart_ids.append(cart_id)
+
+    async def attempt(cart_id):
+        try:
+            await carts.checkout(cart_id, carts.CartCheckout(payment="bench"))
+            return True
+        except HTTPException:
+            return False
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(attempt(cart_id) for cart_id in cart_ids))
+    elapsed = time.perf_counter() - start
+
+    async with db.async_engine.begin() as connection:
+        after = (
+            await connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT (SELECT quantity FROM potion_balances WHERE sku = :sku)
+                               AS balance,
+                           (SELECT SUM(qty_change) FROM potion_records WHERE sku = :sku)
+                               AS ledger
+                    """
+                ),
+                {"sku": sku},
+            )
+        ).one()
+
+    sold = sum(outcomes)
+    print(f"{n_carts} checkouts in {elapsed:.2f}s ({n_carts / elapsed:.0f}/s)")
+    print(f"sold {sold}, rejected {n_carts - sold}, stock {before} -> {after.balance}")
+    assert after.balance >= 0, "potion balance went negative"
+    assert after.balance == after.ledger, "balance drifted from the ledger"
+    assert sold == min(n_carts, before), "checkouts sold the wrong number of potions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--carts", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--potion-type", type=int, nargs=4, default=[100, 0, 0, 0])
+    args = parser.parse_args()
+    asyncio.run(main(args.carts, args.stock, args.potion_type))
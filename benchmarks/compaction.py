@@ -0,0 +1,86 @@
+"""
+Times the full-ledger aggregates (the ones reconcile and compaction check)
+at growing ledger sizes, before and after compaction, and checks that every
+total is identical afterwards.
+
+Seeds back-dated rows that net to zero, so balances are unaffected, but it
+writes to the ledgers; run it against a scratch database:
+
+    python -m benchmarks.compaction --rows 1000 10000 100000 1000000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+
+from src import compaction
+from src import database as db
+
+
+def seed(connection, rows):
+    # Pairs of +1/-1 rows a month old, spread over every sku.
+    connection.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO potion_records (sku, qty_change, timestamp)
+            SELECT skus.sku[1 + i % array_length(skus.sku, 1)],
+                   CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END,
+                   now() - INTERVAL '30 days'
+              FROM generate_series(0, :rows - 1) AS i,
+                   (SELECT array_agg(sku) AS sku FROM potion_index) AS skus;
+            INSERT INTO ml_records (red, green, blue, dark, timestamp)
+            SELECT s, s, s, s, now() - INTERVAL '30 days'
+              FROM generate_series(0, :rows - 1) AS i,
+                   LATERAL (SELECT CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END AS s) AS sign;
+            INSERT INTO gold_records (change_in_gold, timestamp)
+            SELECT CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END, now() - INTERVAL '30 days'
+              FROM generate_series(0, :rows - 1) AS i;
+            INSERT INTO capacity_records (potion_units, ml_units, timestamp)
+            SELECT s, s, now() - INTERVAL '30 days'
+              FROM generate_series(0, :rows - 1) AS i,
+                   LATERAL (SELECT CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END AS s) AS sign;
+            """
+        ),
+        {"rows": rows},
+    )
+
+
+def time_totals(repeat):
+    best = float("inf")
+    with db.engine.connect() as connection:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = compaction.totals(connection)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes, repeat):
+    print(
+        f"{'rows':>10} {'before ms':>10} {'after ms':>10} {'folded':>10} {'fold s':>8}"
+    )
+    for rows in sizes:
+        with db.engine.begin() as connection:
+            seed(connection, rows)
+        before_seconds, before = time_totals(repeat)
+        start = time.perf_counter()
+        with db.engine.begin() as connection:
+            folded = compaction.compact(
+                connection, datetime.now(timezone.utc) - timedelta(days=7)
+            )
+        fold_seconds = time.perf_counter() - start
+        after_seconds, after = time_totals(repeat)
+        assert after == before, (before, after)
+        print(
+            f"{rows:>10} {before_seconds * 1000:>10.1f} {after_seconds * 1000:>10.1f} "
+            f"{sum(folded.values()):>10} {fold_seconds:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
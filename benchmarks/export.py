@@ -0,0 +1,105 @@
+"""
+Streams a 10M-row export of gold_records in process, as the export endpoint
+does, and checks that resident memory stays bounded while it runs. Reports
+rows/s, MB/s and how far RSS rose above where it started.
+
+Seeds back-dated gold rows that net to zero, all stamped with one instant a
+month ago, and deletes them again when it is done, so the ledger and the
+gold balance end as they started. Still, it writes to the ledger; run it
+against a scratch database:
+
+    python -m benchmarks.export --rows 10000000 --format csv
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+
+from src import database as db
+from src import export
+
+
+def seed(rows, seeded_at):
+    with db.engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO gold_records (change_in_gold, timestamp)
+                SELECT CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END, :seeded_at
+                  FROM generate_series(0, :rows - 1) AS i
+                """
+            ),
+            {"rows": rows, "seeded_at": seeded_at},
+        )
+
+
+def unseed(seeded_at):
+    with db.engine.begin() as connection:
+        # The seeded rows net to zero, so the gold balance is left alone, as
+        # compaction does.
+        connection.execute(sqlalchemy.text("SET LOCAL potionshop.compacting = 'on'"))
+        return connection.execute(
+            sqlalchemy.text("DELETE FROM gold_records WHERE timestamp = :seeded_at"),
+            {"seeded_at": seeded_at},
+        ).rowcount
+
+
+def rss_mb():
+    """Current resident set size of this process, from /proc."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def run(format, since, until):
+    rows = chunks = size = 0
+    start_rss = peak_rss = rss_mb()
+    start = time.perf_counter()
+    async for chunk in export.stream(
+        export.export_tables.gold_records, format, since, until
+    ):
+        chunks += 1
+        size += len(chunk)
+        rows += chunk.count("\n")
+        peak_rss = max(peak_rss, rss_mb())
+    elapsed = time.perf_counter() - start
+    if format == export.export_formats.csv:
+        rows -= 1
+    return rows, chunks, size, elapsed, start_rss, peak_rss
+
+
+def main(rows, format, max_rss_growth):
+    seeded_at = datetime.now(timezone.utc) - timedelta(days=30)
+    start = time.perf_counter()
+    try:
+        seed(rows, seeded_at)
+        print(f"seeded {rows} rows in {time.perf_counter() - start:.1f}s")
+        # Only the seeded rows; the rest of the ledger is pruned.
+        exported, chunks, size, elapsed, start_rss, peak_rss = asyncio.run(
+            run(format, seeded_at, seeded_at + timedelta(seconds=1))
+        )
+    finally:
+        print(f"removed {unseed(seeded_at)} seeded rows")
+    growth = peak_rss - start_rss
+    print(f"{exported} rows in {chunks} chunks, {size / 1e6:.0f} MB in {elapsed:.1f}s")
+    print(f"{exported / elapsed:.0f} rows/s, {size / 1e6 / elapsed:.1f} MB/s")
+    print(f"RSS {start_rss:.0f} MB at start, {peak_rss:.0f} MB peak (+{growth:.0f} MB)")
+    bounded = growth <= max_rss_growth
+    print("bounded" if bounded else f"RSS grew more than {max_rss_growth} MB")
+    return bounded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument(
+        "--format", type=export.export_formats, default=export.export_formats.ndjson
+    )
+    parser.add_argument("--max-rss-growth", type=float, default=100.0, help="MB")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.rows, args.format, args.max_rss_growth) else 1)
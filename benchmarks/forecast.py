@@ -0,0 +1,103 @@
+"""
+Times the demand forecast on synthetic histories of 10,000 to 10,000,000
+cart lines: a full fit, an incremental refit with one more tick of rows, and
+predicting the weights for a tick. Runs entirely in memory:
+
+    python -m benchmarks.forecast
+"""
+import time
+
+import numpy as np
+
+from src import forecast, game_clock
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+SKUS = [f"potion_{i}" for i in range(24)]
+CLASSES = ["Warrior", "Wizard", "Rogue", "Cleric", "Druid", "Ranger", "Paladin"]
+TICK_SECONDS = 7200
+LINES_PER_TICK = 40
+
+
+def synthetic_history(lines, rng):
+    """Ticks, visits and cart lines for enough ticks to hold lines cart lines."""
+    ticks = lines // LINES_PER_TICK + 1
+    tick_times = np.arange(ticks, dtype=np.float64) * TICK_SECONDS
+    days = [game_clock.DAYS[tick // 12 % len(game_clock.DAYS)] for tick in range(ticks)]
+    hours = [tick % 12 * 2 for tick in range(ticks)]
+    visit_times = np.repeat(tick_times, len(CLASSES))
+    visit_classes = CLASSES * ticks
+    visit_counts = rng.poisson(8, size=len(visit_times))
+    sale_times = rng.uniform(0, ticks * TICK_SECONDS, size=lines)
+    sale_skus = [SKUS[i] for i in rng.integers(0, len(SKUS), size=lines)]
+    sale_classes = [CLASSES[i] for i in rng.integers(0, len(CLASSES), size=lines)]
+    sale_quantities = rng.integers(1, 5, size=lines)
+    return (
+        (tick_times, days, hours),
+        (visit_times, visit_classes, visit_counts),
+        (sale_times, sale_skus, sale_classes, sale_quantities),
+    )
+
+
+def fit(model, history, until):
+    ticks, visits, sales = history
+    model.decay(until)
+    model.add_ticks(*ticks)
+    model.add_visits(*visits)
+    model.add_sales(*sales)
+
+
+def last_tick(history):
+    """The rows of history's last tick, as an incremental refit would read them."""
+    (tick_times, days, hours), visits, sales = history
+    since = tick_times[-1]
+    visit_rows = visits[0] >= since
+    sale_rows = sales[0] >= since
+    return (
+        (tick_times[-1:], days[-1:], hours[-1:]),
+        tuple(np.asarray(column)[visit_rows] for column in visits),
+        tuple(np.asarray(column)[sale_rows] for column in sales),
+    )
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(
+        f"{'cart lines':>11} {'fit (ms)':>10} {'refit (ms)':>11} {'predict (ms)':>13}"
+    )
+    for size in SIZES:
+        history = synthetic_history(size, rng)
+        until = float(history[0][0][-1] + TICK_SECONDS)
+
+        model = forecast.DemandModel()
+        start = time.perf_counter()
+        fit(model, history, until)
+        fitted = time.perf_counter() - start
+
+        # The same model again, minus its last tick, then that tick alone.
+        incremental = forecast.DemandModel()
+        (tick_times, days, hours), visits, sales = history
+        before = tick_times[-1]
+        fit(
+            incremental,
+            (
+                (tick_times[:-1], days[:-1], hours[:-1]),
+                tuple(np.asarray(column)[visits[0] < before] for column in visits),
+                tuple(np.asarray(column)[sales[0] < before] for column in sales),
+            ),
+            before,
+        )
+        new_rows = last_tick(history)
+        start = time.perf_counter()
+        fit(incremental, new_rows, until)
+        refitted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for day in game_clock.DAYS:
+            for hour in range(0, 24, 2):
+                model.weights(day, hour, ticks=2, visitors={"Wizard": 5, "Rogue": 3})
+        predicted = (time.perf_counter() - start) / (len(game_clock.DAYS) * 12)
+
+        print(
+            f"{size:>11} {fitted * 1000:>10.1f} {refitted * 1000:>11.2f} "
+            f"{predicted * 1000:>13.3f}"
+        )
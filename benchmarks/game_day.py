@@ -0,0 +1,266 @@
+"""
+Replays a full simulated game day against a running shop and reports p50/p99
+latency and throughput per endpoint.
+
+Every tick posts the time and the tick's visits, then customers create carts,
+read the catalog, set items and check out while the bottler plans and
+delivers, the inventory is audited and past orders are searched. Barrel and
+capacity plans are bought on the first tick. With --ledger-rows the ledgers
+and cart history are first seeded to that size, back-dated and netting to
+zero, so the SQL runs against realistic volumes:
+
+    python -m benchmarks.game_day --ledger-rows 1000000 --customers 200 --concurrency 32
+
+Needs httpx, a local Postgres the shop points at (POSTGRES_URI) and API_KEY
+set to the shop's key. It writes real rows, so use a scratch database.
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+import dotenv
+import httpx
+import numpy as np
+import sqlalchemy
+
+from benchmarks import compaction
+from src import database as db
+from src import game_clock
+
+CLASSES = ["Warrior", "Wizard", "Rogue", "Cleric", "Druid", "Bard"]
+
+WHOLESALE_CATALOG = [
+    {
+        "sku": f"{size}_{colour}_BARREL",
+        "ml_per_barrel": ml,
+        "potion_type": potion_type,
+        "price": price,
+        "quantity": 10,
+    }
+    for colour, potion_type in [
+        ("RED", [1, 0, 0, 0]),
+        ("GREEN", [0, 1, 0, 0]),
+        ("BLUE", [0, 0, 1, 0]),
+        ("DARK", [0, 0, 0, 1]),
+    ]
+    for size, ml, price in [
+        ("SMALL", 500, 100),
+        ("MEDIUM", 2500, 250),
+        ("LARGE", 10000, 500),
+    ]
+]
+
+
+def seed(ledger_rows):
+    """Grows each ledger, carts and cart_items by ledger_rows rows."""
+    with db.engine.begin() as connection:
+        compaction.seed(connection, ledger_rows)
+        connection.execute(
+            sqlalchemy.text(
+                """
+                WITH new_carts AS (
+                    INSERT INTO carts (customer_name, customer_class, level, timestamp)
+                    SELECT 'seed-' || i, 'Seed', i % 20, now() - INTERVAL '30 days'
+                      FROM generate_series(0, :rows - 1) AS i
+                 RETURNING id
+                )
+                INSERT INTO cart_items (cart_id, sku, quantity, timestamp)
+                SELECT new_carts.id,
+                       skus.sku[1 + new_carts.id % array_length(skus.sku, 1)],
+                       1,
+                       now() - INTERVAL '30 days'
+                  FROM new_carts,
+                       (SELECT array_agg(sku) AS sku FROM potion_index) AS skus
+                """
+            ),
+            {"rows": ledger_rows},
+        )
+
+
+class Recorder:
+    """Latencies in seconds and error counts, keyed by endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, endpoint, request, expected=(200,)):
+        start = time.perf_counter()
+        response = await request
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[endpoint] += 1
+        return response
+
+    def report(self, elapsed):
+        print(
+            f"{'endpoint':<36} {'requests':>8} {'errors':>6} "
+            f"{'p50 ms':>8} {'p99 ms':>8} {'req/s':>8}"
+        )
+        for endpoint, latencies in sorted(self.latencies.items()):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(
+                f"{endpoint:<36} {len(latencies):>8} {self.errors[endpoint]:>6} "
+                f"{p50:>8.1f} {p99:>8.1f} {len(latencies) / elapsed:>8.1f}"
+            )
+
+
+async def customer(client, recorder, tick, i):
+    """One customer: browse the catalog, fill a cart and check out."""
+    cart_id = (
+        await recorder.call(
+            "POST /carts/",
+            client.post(
+                "/carts/",
+                json={
+                    "customer_name": f"bench-{tick}-{i}",
+                    "character_class": CLASSES[i % len(CLASSES)],
+                    "level": i % 20 + 1,
+                },
+            ),
+        )
+    ).json()["cart_id"]
+    potions = (await recorder.call("GET /catalog/", client.get("/catalog/"))).json()
+    if not potions:
+        return
+    potion = potions[i % len(potions)]
+    await recorder.call(
+        "POST /carts/{cart_id}/items/{sku}",
+        client.post(
+            f"/carts/{cart_id}/items/{potion['sku']}",
+            json={"quantity": min(potion["quantity"], i % 3 + 1)},
+        ),
+    )
+    # Customers race for the same stock, so a rejected checkout is expected.
+    await recorder.call(
+        "POST /carts/{cart_id}/checkout",
+        client.post(f"/carts/{cart_id}/checkout", json={"payment": "bench"}),
+        expected=(200, 409),
+    )
+
+
+async def restock(client, recorder, order_id, first_tick):
+    """The shop's own side of a tick: buy, bottle and audit."""
+    if first_tick:
+        plan = (
+            await recorder.call(
+                "POST /barrels/plan",
+                client.post("/barrels/plan", json=WHOLESALE_CATALOG),
+            )
+        ).json()
+        delivered = [
+            {**barrel, "quantity": purchase["quantity"]}
+            for purchase in plan
+            for barrel in WHOLESALE_CATALOG
+            if barrel["sku"] == purchase["sku"]
+        ]
+        await recorder.call(
+            "POST /barrels/deliver/{order_id}",
+            client.post(f"/barrels/deliver/{order_id}", json=delivered),
+        )
+        capacity = (
+            await recorder.call("POST /inventory/plan", client.post("/inventory/plan"))
+        ).json()
+        await recorder.call(
+            "POST /inventory/deliver/{order_id}",
+            client.post(f"/inventory/deliver/{order_id}", json=capacity),
+        )
+    bottles = (
+        await recorder.call("POST /bottler/plan", client.post("/bottler/plan"))
+    ).json()
+    await recorder.call(
+        "POST /bottler/deliver/{order_id}",
+        client.post(f"/bottler/deliver/{order_id}", json=bottles),
+    )
+    await recorder.call("GET /inventory/audit", client.get("/inventory/audit"))
+
+
+async def search(client, recorder, searches):
+    """Pages through past orders, as the shop's owner would."""
+    for i in range(searches):
+        response = await recorder.call(
+            "GET /carts/search/",
+            client.get(
+                "/carts/search/",
+                params={"customer_name": f"bench-{i}" if i % 2 else ""},
+            ),
+        )
+        if response.json().get("next"):
+            await recorder.call(
+                "GET /carts/search/",
+                client.get(
+                    "/carts/search/", params={"search_page": response.json()["next"]}
+                ),
+            )
+
+
+async def main(url, customers, concurrency, searches, day):
+    dotenv.load_dotenv()
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    limits = httpx.Limits(max_connections=concurrency)
+    timeout = httpx.Timeout(60.0)
+    recorder = Recorder()
+    order_id = time.time_ns()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with gate:
+            await coroutine
+
+    async with httpx.AsyncClient(
+        base_url=url, headers=headers, limits=limits, timeout=timeout
+    ) as client:
+        start = time.perf_counter()
+        for tick, hour in enumerate(range(0, 24, 2)):
+            await recorder.call(
+                "POST /info/current_time",
+                client.post("/info/current_time", json={"day": day, "hour": hour}),
+            )
+            await recorder.call(
+                "POST /carts/visits/{visit_id}",
+                client.post(
+                    f"/carts/visits/{order_id + tick}",
+                    json=[
+                        {
+                            "customer_name": f"bench-{tick}-{i}",
+                            "character_class": CLASSES[i % len(CLASSES)],
+                            "level": i % 20 + 1,
+                        }
+                        for i in range(customers)
+                    ],
+                ),
+            )
+            await asyncio.gather(
+                limited(restock(client, recorder, order_id + tick, tick == 0)),
+                limited(search(client, recorder, searches)),
+                *(
+                    limited(customer(client, recorder, tick, i))
+                    for i in range(customers)
+                ),
+            )
+        elapsed = time.perf_counter() - start
+    print(f"game day of {customers} customers per tick in {elapsed:.1f}s")
+    recorder.report(elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument(
+        "--ledger-rows",
+        type=int,
+        default=0,
+        help="seed each ledger with this many back-dated rows first (1k to 10M)",
+    )
+    parser.add_argument("--customers", type=int, default=100, help="per tick")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--searches", type=int, default=10, help="per tick")
+    parser.add_argument("--day", default=game_clock.DAYS[0], choices=game_clock.DAYS)
+    args = parser.parse_args()
+    if args.ledger_rows:
+        seed(args.ledger_rows)
+    asyncio.run(
+        main(args.url, args.customers, args.concurrency, args.searches, args.day)
+    )
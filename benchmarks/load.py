@@ -0,0 +1,71 @@
+"""
+Measures requests/sec on /catalog/ and /carts/{id}/items/{sku} against a
+running shop under increasing concurrency. Run it against a build with sync
+handlers and one with async handlers to compare the two:
+
+    python -m benchmarks.load --url http://127.0.0.1:3000 --requests 2000
+
+Needs httpx, and API_KEY set to the shop's key. Point it at a scratch
+database: the cart requests create real carts.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import dotenv
+import httpx
+
+CONCURRENCY = [1, 8, 32, 128]
+
+
+async def run(client, concurrency, total, request):
+    """Issues total requests with at most concurrency in flight; returns req/s."""
+    remaining = iter(range(total))
+
+    async def worker():
+        for i in remaining:
+            response = await request(client, i)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(url, total, sku):
+    dotenv.load_dotenv()
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    limits = httpx.Limits(max_connections=max(CONCURRENCY))
+    async with httpx.AsyncClient(
+        base_url=url, headers=headers, limits=limits
+    ) as client:
+        cart_id = (
+            await client.post(
+                "/carts/",
+                json={"customer_name": "load", "character_class": "Bench", "level": 1},
+            )
+        ).json()["cart_id"]
+
+        def catalog(client, i):
+            return client.get("/catalog/")
+
+        def set_item(client, i):
+            return client.post(
+                f"/carts/{cart_id}/items/{sku}", json={"quantity": i % 5 + 1}
+            )
+
+        print(f"{'concurrency':>11} {'catalog req/s':>14} {'set item req/s':>15}")
+        for concurrency in CONCURRENCY:
+            catalog_rps = await run(client, concurrency, total, catalog)
+            set_item_rps = await run(client, concurrency, total, set_item)
+            print(f"{concurrency:>11} {catalog_rps:>14.0f} {set_item_rps:>15.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--sku", default="RED", help="an existing potion sku")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.requests, args.sku))
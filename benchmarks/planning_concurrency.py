@@ -0,0 +1,127 @@
+"""
+Fires barrel, bottler and capacity plans from several processes at once at
+a shop running with multiple workers (serve.py), without delivering any of
+them, and checks that together they never spend more gold or ml than the
+shop had. Reports plans/s.
+
+    WEB_CONCURRENCY=4 python serve.py &
+    python -m benchmarks.planning_concurrency --processes 8 --rounds 20
+
+Needs httpx, API_KEY set to the shop's key, and POSTGRES_URI pointing at the
+shop's database to read the starting balances. The plans reserve gold and
+ml until they expire (PLAN_RESERVATION_SECONDS), so use a scratch database.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import dotenv
+import httpx
+import sqlalchemy
+
+from benchmarks.game_day import WHOLESALE_CATALOG
+from src import database as db
+
+BARRELS = {barrel["sku"]: barrel for barrel in WHOLESALE_CATALOG}
+
+
+async def plan_rounds(url, rounds):
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    plans = {"barrels": [], "bottler": [], "capacity": []}
+    async with httpx.AsyncClient(base_url=url, headers=headers, timeout=60.0) as client:
+        for _ in range(rounds):
+            barrels, bottles, capacity = await asyncio.gather(
+                client.post("/barrels/plan", json=WHOLESALE_CATALOG),
+                client.post("/bottler/plan"),
+                client.post("/inventory/plan"),
+            )
+            for response in (barrels, bottles, capacity):
+                response.raise_for_status()
+            plans["barrels"].append(barrels.json())
+            plans["bottler"].append(bottles.json())
+            plans["capacity"].append(capacity.json())
+    return plans
+
+
+def worker(args):
+    dotenv.load_dotenv()
+    url, rounds, barrier = args
+    barrier.wait()
+    return asyncio.run(plan_rounds(url, rounds))
+
+
+def available():
+    """Gold and ml per colour the shop has, less what is already reserved."""
+    with db.engine.begin() as connection:
+        row = connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT gold - (SELECT COALESCE(SUM(plan_reservations.gold), 0)
+                                 FROM plan_reservations
+                                WHERE expires_at > now()) AS gold,
+                       ARRAY[red, green, blue, dark] AS ml,
+                       (SELECT ARRAY[
+                                COALESCE(SUM(ml_out[1]), 0),
+                                COALESCE(SUM(ml_out[2]), 0),
+                                COALESCE(SUM(ml_out[3]), 0),
+                                COALESCE(SUM(ml_out[4]), 0)
+                               ]
+                          FROM plan_reservations
+                         WHERE expires_at > now()) AS ml_reserved
+                  FROM gold_balance, ml_balance
+                """
+            )
+        ).one()
+    return row.gold, [ml - used for ml, used in zip(row.ml, row.ml_reserved)]
+
+
+def main(url, processes, rounds):
+    gold, ml = available()
+    manager = multiprocessing.Manager()
+    barrier = manager.Barrier(processes)
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(worker, [(url, rounds, barrier)] * processes)
+    elapsed = time.perf_counter() - start
+
+    gold_planned = sum(
+        BARRELS[purchase["sku"]]["price"] * purchase["quantity"]
+        for plans in results
+        for plan in plans["barrels"]
+        for purchase in plan
+    ) + sum(
+        (plan["potion_capacity"] + plan["ml_capacity"]) * 1000
+        for plans in results
+        for plan in plans["capacity"]
+    )
+    ml_planned = [
+        sum(
+            bottle["potion_type"][i] * bottle["quantity"]
+            for plans in results
+            for plan in plans["bottler"]
+            for bottle in plan
+        )
+        for i in range(4)
+    ]
+    total_plans = processes * rounds * 3
+    print(f"{total_plans} plans from {processes} processes in {elapsed:.2f}s")
+    print(f"{total_plans / elapsed:.1f} plans/s")
+    print(f"gold planned {gold_planned} of {gold} available")
+    print(f"ml planned {ml_planned} of {ml} available")
+    consistent = gold_planned <= max(gold, 0) and all(
+        planned <= max(have, 0) for planned, have in zip(ml_planned, ml)
+    )
+    print("consistent" if consistent else "OVERSPENT")
+    return consistent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if main(args.url, args.processes, args.rounds) else 1)
@@ -0,0 +1,80 @@
+"""
+Measures /carts/visits ingestion for ticks of 10 to 100,000 customers: how
+long the endpoint takes to return once the tick is queued, and the rate at
+which buffered visits are flushed to customer_visits with COPY, next to the
+previous one-INSERT-per-customer executemany.
+
+Writes real visit rows, so run it against a scratch database:
+
+    python -m benchmarks.visits_ingest
+"""
+import asyncio
+import time
+
+import sqlalchemy
+
+from src import database as db
+from src import visits
+from src.api import carts
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def tick(size):
+    return [
+        carts.Customer(
+            customer_name=f"bench-{i}", character_class="Bench", level=i % 20
+        )
+        for i in range(size)
+    ]
+
+
+async def executemany_insert(customers):
+    """The ingestion path before buffering, kept as the baseline."""
+    async with db.async_engine.begin() as connection:
+        await connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO customer_visits (name, class, level)
+                     VALUES (:name, :class, :level)
+                """
+            ),
+            [
+                {
+                    "name": customer.customer_name,
+                    "class": customer.character_class,
+                    "level": customer.level,
+                }
+                for customer in customers
+            ],
+        )
+
+
+async def main():
+    visits.start()
+    print(
+        f"{'customers':>10} {'return (ms)':>12} "
+        f"{'COPY rows/s':>12} {'executemany rows/s':>19}"
+    )
+    for size in SIZES:
+        customers = tick(size)
+
+        start = time.perf_counter()
+        await carts.post_visits(0, customers)
+        queued = time.perf_counter() - start
+        await visits.flush()
+        copy_rate = size / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await executemany_insert(customers)
+        executemany_rate = size / (time.perf_counter() - start)
+
+        print(
+            f"{size:>10} {queued * 1000:>12.1f} "
+            f"{copy_rate:>12.0f} {executemany_rate:>19.0f}"
+        )
+    await visits.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+-- Running balances of the four *_records ledgers, kept up to date by triggers
+-- so audit and the planners read one row instead of re-aggregating history.
+-- 0006_partition_ledgers re-creates the ledgers with these triggers on them.
+
+create table public.potion_balances (
+    sku text not null,
+    quantity integer not null default 0,
+    constraint potion_balances_pkey primary key (sku),
+    constraint potion_balances_sku_fkey foreign key (sku) references potion_index (sku) on update cascade
+);
+
+create table public.ml_balance (
+    id boolean not null default true,
+    red integer not null default 0,
+    green integer not null default 0,
+    blue integer not null default 0,
+    dark integer not null default 0,
+    constraint ml_balance_pkey primary key (id),
+    constraint ml_balance_single_row check (id)
+);
+
+create table public.gold_balance (
+    id boolean not null default true,
+    gold integer not null default 0,
+    constraint gold_balance_pkey primary key (id),
+    constraint gold_balance_single_row check (id)
+);
+
+create table public.capacity_balance (
+    id boolean not null default true,
+    potion_units integer not null default 0,
+    ml_units integer not null default 0,
+    constraint capacity_balance_pkey primary key (id),
+    constraint capacity_balance_single_row check (id)
+);
+
+-- Seeded from the ledgers as they stand. The triggers are created after, in
+-- the same transaction, so no row is counted twice or missed.
+insert into public.potion_balances (sku, quantity)
+select sku, sum(qty_change)
+  from public.potion_records
+ group by sku;
+
+insert into public.ml_balance (red, green, blue, dark)
+select coalesce(sum(red), 0), coalesce(sum(green), 0),
+       coalesce(sum(blue), 0), coalesce(sum(dark), 0)
+  from public.ml_records;
+
+insert into public.gold_balance (gold)
+select coalesce(sum(change_in_gold), 0) from public.gold_records;
+
+insert into public.capacity_balance (potion_units, ml_units)
+select coalesce(sum(potion_units), 0), coalesce(sum(ml_units), 0)
+  from public.capacity_records;
+
+-- Every insert into (or delete from) a *_records ledger is applied to its
+-- running balance in the same transaction, so reads never re-aggregate history.
+create function public.apply_potion_record() returns trigger language plpgsql as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into potion_balances (sku, quantity)
+         values (new.sku, new.qty_change)
+    on conflict (sku)
+      do update
+            set quantity = potion_balances.quantity + excluded.quantity;
+  else
+    update potion_balances set quantity = quantity - old.qty_change where sku = old.sku;
+  end if;
+  return null;
+end;
+$$;
+
+create function public.apply_ml_record() returns trigger language plpgsql as $$
+begin
+  if tg_op = 'INSERT' then
+    update ml_balance
+       set red = red + new.red, green = green + new.green,
+           blue = blue + new.blue, dark = dark + new.dark;
+  else
+    update ml_balance
+       set red = red - old.red, green = green - old.green,
+           blue = blue - old.blue, dark = dark - old.dark;
+  end if;
+  return null;
+end;
+$$;
+
+create function public.apply_gold_record() returns trigger language plpgsql as $$
+begin
+  if tg_op = 'INSERT' then
+    update gold_balance set gold = gold + new.change_in_gold;
+  else
+    update gold_balance set gold = gold - old.change_in_gold;
+  end if;
+  return null;
+end;
+$$;
+
+create function public.apply_capacity_record() returns trigger language plpgsql as $$
+begin
+  if tg_op = 'INSERT' then
+    update capacity_balance
+       set potion_units = potion_units + new.potion_units,
+           ml_units = ml_units + new.ml_units;
+  else
+    update capacity_balance
+       set potion_units = potion_units - old.potion_units,
+           ml_units = ml_units - old.ml_units;
+  end if;
+  return null;
+end;
+$$;
+
+create trigger potion_records_balance after insert or delete on public.potion_records
+  for each row execute function public.apply_potion_record();
+
+create trigger ml_records_balance after insert or delete on public.ml_records
+  for each row execute function public.apply_ml_record();
+
+create trigger gold_records_balance after insert or delete on public.gold_records
+  for each row execute function public.apply_gold_record();
+
+create trigger capacity_records_balance after insert or delete on public.capacity_records
+  for each row execute function public.apply_capacity_record();
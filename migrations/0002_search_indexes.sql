@@ -0,0 +1,12 @@
+-- Case-insensitive substring search on /carts/search/ and keyset seeks on its
+-- default sort order.
+
+create extension if not exists pg_trgm;
+
+create index carts_customer_name_trgm_idx on public.carts
+  using gin (lower(customer_name) gin_trgm_ops);
+
+create index cart_items_sku_trgm_idx on public.cart_items
+  using gin (lower(sku) gin_trgm_ops);
+
+create index cart_items_timestamp_item_id_idx on public.cart_items (timestamp, item_id);
@@ -0,0 +1,2 @@
+-- Bottler deliveries resolve potion types to SKUs through this index.
+create index potion_index_potion_type_idx on public.potion_index (red_pct, green_pct, blue_pct, dark_pct);
@@ -0,0 +1,9 @@
+-- Responses of the delivery endpoints by order_id, so a retried delivery is
+-- answered with the first response instead of being applied twice.
+create table public.delivery_receipts (
+    endpoint text not null,
+    order_id bigint not null,
+    response text not null,
+    timestamp timestamp with time zone not null default now(),
+    constraint delivery_receipts_pkey primary key (endpoint, order_id)
+);
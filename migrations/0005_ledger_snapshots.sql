@@ -0,0 +1,89 @@
+-- Compaction (src/compaction.py) folds old ledger rows into snapshot rows and
+-- keeps the originals in *_records_archive. The snapshot columns must exist
+-- before 0006_partition_ledgers copies the ledgers into partitioned tables.
+
+alter table public.potion_records add column snapshot boolean not null default false;
+
+alter table public.ml_records add column snapshot boolean not null default false;
+
+alter table public.gold_records add column snapshot boolean not null default false;
+
+alter table public.capacity_records add column snapshot boolean not null default false;
+
+create table public.potion_records_archive (like public.potion_records);
+
+create table public.ml_records_archive (like public.ml_records);
+
+create table public.gold_records_archive (like public.gold_records);
+
+create table public.capacity_records_archive (like public.capacity_records);
+
+-- Compaction sets potionshop.compacting, since folding rows leaves every
+-- total unchanged.
+create or replace function public.apply_potion_record() returns trigger language plpgsql as $$
+begin
+  if current_setting('potionshop.compacting', true) = 'on' then
+    return null;
+  end if;
+  if tg_op = 'INSERT' then
+    insert into potion_balances (sku, quantity)
+         values (new.sku, new.qty_change)
+    on conflict (sku)
+      do update
+            set quantity = potion_balances.quantity + excluded.quantity;
+  else
+    update potion_balances set quantity = quantity - old.qty_change where sku = old.sku;
+  end if;
+  return null;
+end;
+$$;
+
+create or replace function public.apply_ml_record() returns trigger language plpgsql as $$
+begin
+  if current_setting('potionshop.compacting', true) = 'on' then
+    return null;
+  end if;
+  if tg_op = 'INSERT' then
+    update ml_balance
+       set red = red + new.red, green = green + new.green,
+           blue = blue + new.blue, dark = dark + new.dark;
+  else
+    update ml_balance
+       set red = red - old.red, green = green - old.green,
+           blue = blue - old.blue, dark = dark - old.dark;
+  end if;
+  return null;
+end;
+$$;
+
+create or replace function public.apply_gold_record() returns trigger language plpgsql as $$
+begin
+  if current_setting('potionshop.compacting', true) = 'on' then
+    return null;
+  end if;
+  if tg_op = 'INSERT' then
+    update gold_balance set gold = gold + new.change_in_gold;
+  else
+    update gold_balance set gold = gold - old.change_in_gold;
+  end if;
+  return null;
+end;
+$$;
+
+create or replace function public.apply_capacity_record() returns trigger language plpgsql as $$
+begin
+  if current_setting('potionshop.compacting', true) = 'on' then
+    return null;
+  end if;
+  if tg_op = 'INSERT' then
+    update capacity_balance
+       set potion_units = potion_units + new.potion_units,
+           ml_units = ml_units + new.ml_units;
+  else
+    update capacity_balance
+       set potion_units = potion_units - old.potion_units,
+           ml_units = ml_units - old.ml_units;
+  end if;
+  return null;
+end;
+$$;
@@ -0,0 +1,183 @@
+-- Range-partitions the ledgers and customer_visits by month on timestamp, so
+-- time-bounded reads (recent sales, compaction, history) only touch the
+-- partitions they need and old months can be detached or dropped whole.
+--
+-- Partition keys must be part of every unique constraint, so the primary keys
+-- become (id, timestamp). cart_items stays unpartitioned: its (cart_id, sku)
+-- key is what set_item_quantity upserts on.
+--
+-- Rows before this month land in a *_history partition; later months are
+-- created ahead of time by ensure_monthly_partitions, which the migration
+-- runner calls on every run. Anything beyond them goes to *_default.
+
+create function public.ensure_monthly_partitions(parent regclass, months integer)
+returns void language plpgsql as $$
+declare
+  month_start timestamptz := date_trunc('month', now());
+  parent_name text := (select relname from pg_class where oid = parent);
+begin
+  for i in 0..months loop
+    execute format(
+      'create table if not exists public.%I partition of %s for values from (%L) to (%L)',
+      parent_name || '_' || to_char(month_start, 'YYYY_MM'),
+      parent,
+      month_start,
+      month_start + interval '1 month'
+    );
+    month_start := month_start + interval '1 month';
+  end loop;
+end;
+$$;
+
+-- potion_records
+
+alter table public.potion_records rename to potion_records_unpartitioned;
+alter table public.potion_records_unpartitioned
+  rename constraint potion_records_pkey to potion_records_unpartitioned_pkey;
+
+create table public.potion_records (
+    sku text not null,
+    qty_change integer not null,
+    timestamp timestamp with time zone not null default now(),
+    id integer generated by default as identity not null,
+    day_of_week text not null default to_char(now(), 'fmDay'::text),
+    snapshot boolean not null default false,
+    constraint potion_records_pkey primary key (id, timestamp),
+    constraint potion_records_sku_fkey foreign key (sku) references potion_index (sku) on update cascade
+) partition by range (timestamp);
+
+create table public.potion_records_history partition of public.potion_records
+  for values from (minvalue) to (date_trunc('month', now()));
+select public.ensure_monthly_partitions('public.potion_records', 3);
+create table public.potion_records_default partition of public.potion_records default;
+
+-- The balance trigger is created after the copy, so balances are untouched.
+insert into public.potion_records (sku, qty_change, timestamp, id, day_of_week, snapshot)
+select sku, qty_change, timestamp, id, day_of_week, snapshot
+  from public.potion_records_unpartitioned;
+select setval(pg_get_serial_sequence('public.potion_records', 'id'), coalesce(max(id), 0) + 1, false)
+  from public.potion_records;
+drop table public.potion_records_unpartitioned;
+
+create trigger potion_records_balance after insert or delete on public.potion_records
+  for each row execute function public.apply_potion_record();
+
+-- ml_records
+
+alter table public.ml_records rename to ml_records_unpartitioned;
+alter table public.ml_records_unpartitioned
+  rename constraint ml_inventory_pkey to ml_records_unpartitioned_pkey;
+
+create table public.ml_records (
+    id bigint generated by default as identity not null,
+    red integer not null default 0,
+    green integer not null default 0,
+    blue integer not null default 0,
+    dark integer not null default 0,
+    timestamp timestamp with time zone not null default now(),
+    snapshot boolean not null default false,
+    constraint ml_inventory_pkey primary key (id, timestamp)
+) partition by range (timestamp);
+
+create table public.ml_records_history partition of public.ml_records
+  for values from (minvalue) to (date_trunc('month', now()));
+select public.ensure_monthly_partitions('public.ml_records', 3);
+create table public.ml_records_default partition of public.ml_records default;
+
+insert into public.ml_records (id, red, green, blue, dark, timestamp, snapshot)
+select id, red, green, blue, dark, timestamp, snapshot
+  from public.ml_records_unpartitioned;
+select setval(pg_get_serial_sequence('public.ml_records', 'id'), coalesce(max(id), 0) + 1, false)
+  from public.ml_records;
+drop table public.ml_records_unpartitioned;
+
+create trigger ml_records_balance after insert or delete on public.ml_records
+  for each row execute function public.apply_ml_record();
+
+-- gold_records
+
+alter table public.gold_records rename to gold_records_unpartitioned;
+alter table public.gold_records_unpartitioned
+  rename constraint gold_transactions_pkey to gold_records_unpartitioned_pkey;
+
+create table public.gold_records (
+    id bigint generated by default as identity not null,
+    change_in_gold integer not null default 100,
+    timestamp timestamp with time zone not null default now(),
+    day_of_week text not null default to_char(now(), 'fmDay' :: text),
+    snapshot boolean not null default false,
+    constraint gold_transactions_pkey primary key (id, timestamp)
+) partition by range (timestamp);
+
+create table public.gold_records_history partition of public.gold_records
+  for values from (minvalue) to (date_trunc('month', now()));
+select public.ensure_monthly_partitions('public.gold_records', 3);
+create table public.gold_records_default partition of public.gold_records default;
+
+insert into public.gold_records (id, change_in_gold, timestamp, day_of_week, snapshot)
+select id, change_in_gold, timestamp, day_of_week, snapshot
+  from public.gold_records_unpartitioned;
+select setval(pg_get_serial_sequence('public.gold_records', 'id'), coalesce(max(id), 0) + 1, false)
+  from public.gold_records;
+drop table public.gold_records_unpartitioned;
+
+create trigger gold_records_balance after insert or delete on public.gold_records
+  for each row execute function public.apply_gold_record();
+
+-- capacity_records
+
+alter table public.capacity_records rename to capacity_records_unpartitioned;
+alter table public.capacity_records_unpartitioned
+  rename constraint capacity_units_pkey to capacity_records_unpartitioned_pkey;
+
+create table public.capacity_records (
+    id bigint generated by default as identity not null,
+    potion_units integer not null default 1,
+    ml_units integer not null default 1,
+    timestamp timestamp with time zone not null default now(),
+    snapshot boolean not null default false,
+    constraint capacity_units_pkey primary key (id, timestamp)
+) partition by range (timestamp);
+
+create table public.capacity_records_history partition of public.capacity_records
+  for values from (minvalue) to (date_trunc('month', now()));
+select public.ensure_monthly_partitions('public.capacity_records', 3);
+create table public.capacity_records_default partition of public.capacity_records default;
+
+insert into public.capacity_records (id, potion_units, ml_units, timestamp, snapshot)
+select id, potion_units, ml_units, timestamp, snapshot
+  from public.capacity_records_unpartitioned;
+select setval(pg_get_serial_sequence('public.capacity_records', 'id'), coalesce(max(id), 0) + 1, false)
+  from public.capacity_records;
+drop table public.capacity_records_unpartitioned;
+
+create trigger capacity_records_balance after insert or delete on public.capacity_records
+  for each row execute function public.apply_capacity_record();
+
+-- customer_visits
+
+alter table public.customer_visits rename to customer_visits_unpartitioned;
+alter table public.customer_visits_unpartitioned
+  rename constraint customer_visits_pkey to customer_visits_unpartitioned_pkey;
+
+create table public.customer_visits (
+    id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    name text not null,
+    class text not null,
+    day_of_week text not null default to_char(now(), 'fmDay'::text),
+    level integer not null,
+    constraint customer_visits_pkey primary key (id, timestamp)
+) partition by range (timestamp);
+
+create table public.customer_visits_history partition of public.customer_visits
+  for values from (minvalue) to (date_trunc('month', now()));
+select public.ensure_monthly_partitions('public.customer_visits', 3);
+create table public.customer_visits_default partition of public.customer_visits default;
+
+insert into public.customer_visits (id, timestamp, name, class, day_of_week, level)
+select id, timestamp, name, class, day_of_week, level
+  from public.customer_visits_unpartitioned;
+select setval(pg_get_serial_sequence('public.customer_visits', 'id'), coalesce(max(id), 0) + 1, false)
+  from public.customer_visits;
+drop table public.customer_visits_unpartitioned;
@@ -0,0 +1,9 @@
+-- get_bottle_plan sums each bottled sku's sales over the last four hours;
+-- this answers the (sku, timestamp range) probe from the index alone.
+create index cart_items_sku_timestamp_idx on public.cart_items (sku, timestamp) include (quantity);
+
+-- reconcile, compaction and the per-sku potion totals group the ledger by sku.
+create index potion_records_sku_idx on public.potion_records (sku) include (qty_change);
+
+-- /carts/search/ sorted by customer_name walks carts in name order.
+create index carts_customer_name_idx on public.carts (customer_name);
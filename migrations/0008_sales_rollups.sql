@@ -0,0 +1,20 @@
+-- Potions sold per sku per hour, kept up to date by checkout. The bottler
+-- reads sales velocity as a range sum over a handful of these rows instead
+-- of re-aggregating cart_items on every plan.
+create table public.sales_rollups (
+    sku text not null,
+    hour timestamp with time zone not null,
+    day_of_week text not null,
+    quantity integer not null default 0,
+    constraint sales_rollups_pkey primary key (sku, hour),
+    constraint sales_rollups_sku_fkey foreign key (sku) references potion_index (sku) on update cascade
+);
+
+-- Per-weekday velocity reads every hour of one weekday.
+create index sales_rollups_day_of_week_idx on public.sales_rollups (day_of_week, sku) include (quantity);
+
+-- Seeded from cart history, which is what the planner counted until now.
+insert into public.sales_rollups (sku, hour, day_of_week, quantity)
+select sku, date_trunc('hour', timestamp), min(day_of_week), sum(quantity)
+  from public.cart_items
+ group by sku, date_trunc('hour', timestamp);
@@ -0,0 +1,38 @@
+-- Version of the reference tables (potion_index, potion_strategy and
+-- magic_numbers) cached in each process by src/refdata.py. Any change to them
+-- bumps it and sends the new version on the refdata channel; NOTIFY is only
+-- delivered on commit, so listeners always reload committed data.
+create table public.refdata_version (
+    id boolean not null default true,
+    version bigint not null default 1,
+    constraint refdata_version_pkey primary key (id),
+    constraint refdata_version_single_row check (id)
+);
+
+insert into public.refdata_version default values;
+
+create function public.bump_refdata_version() returns bigint language plpgsql as $$
+declare
+  new_version bigint;
+begin
+  update refdata_version set version = version + 1 returning version into new_version;
+  perform pg_notify('refdata', new_version::text);
+  return new_version;
+end;
+$$;
+
+create function public.refdata_changed() returns trigger language plpgsql as $$
+begin
+  perform bump_refdata_version();
+  return null;
+end;
+$$;
+
+create trigger potion_index_refdata after insert or update or delete or truncate
+  on public.potion_index for each statement execute function public.refdata_changed();
+
+create trigger potion_strategy_refdata after insert or update or delete or truncate
+  on public.potion_strategy for each statement execute function public.refdata_changed();
+
+create trigger magic_numbers_refdata after insert or update or delete or truncate
+  on public.magic_numbers for each statement execute function public.refdata_changed();
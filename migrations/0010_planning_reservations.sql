@@ -0,0 +1,30 @@
+-- What each plan handed out but not yet delivered will spend or add. Plans
+-- run one at a time under an advisory lock and subtract these from the
+-- balances, so two workers planning at once never spend the same gold or ml.
+-- A delivery removes its kind's oldest reservation in the same transaction
+-- as its ledger rows; plans that are never delivered expire.
+create table public.plan_reservations (
+    id bigint generated by default as identity not null,
+    kind text not null,
+    gold integer not null default 0,
+    ml_in integer[] not null default '{0,0,0,0}',
+    ml_out integer[] not null default '{0,0,0,0}',
+    potions_in integer not null default 0,
+    expires_at timestamp with time zone not null,
+    constraint plan_reservations_pkey primary key (id)
+);
+
+create index plan_reservations_kind_idx on public.plan_reservations (kind, id);
+
+-- Every process keeps the catalog cached; any change to potion stock tells
+-- them all to drop it. Notifications are sent on commit and repeats within a
+-- transaction are folded into one.
+create function public.potion_balances_changed() returns trigger language plpgsql as $$
+begin
+  perform pg_notify('catalog', '');
+  return null;
+end;
+$$;
+
+create trigger potion_balances_catalog after insert or update or delete or truncate
+  on public.potion_balances for each statement execute function public.potion_balances_changed();
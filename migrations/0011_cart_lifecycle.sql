@@ -0,0 +1,62 @@
+-- Carts are open until they are checked out or, left untouched for too long,
+-- abandoned by the sweeper (src/sweeper.py). Only open carts keep their lines
+-- in cart_items: checkout moves them to cart_item_history and the sweeper
+-- deletes an abandoned cart's, so cart_items stays the size of the carts in
+-- flight.
+alter table public.carts
+  add column state text not null default 'open',
+  add column closed_at timestamp with time zone,
+  add constraint carts_state_check check (state in ('open', 'checked_out', 'abandoned'));
+
+-- The sweeper looks for the oldest open carts.
+create index carts_open_timestamp_idx on public.carts (timestamp) where state = 'open';
+
+-- Line items of checked-out carts, without the columns only an open cart needs.
+create table public.cart_item_history (
+    item_id bigint not null,
+    cart_id bigint not null,
+    sku text not null,
+    quantity integer not null,
+    timestamp timestamp with time zone not null,
+    constraint cart_item_history_pkey primary key (item_id),
+    constraint cart_item_history_cart_id_fkey foreign key (cart_id) references carts (id),
+    constraint cart_item_history_sku_fkey foreign key (sku) references potion_index (sku) on update cascade
+);
+
+-- The same access paths search has on cart_items.
+create index cart_item_history_timestamp_item_id_idx on public.cart_item_history (timestamp, item_id);
+
+create index cart_item_history_sku_trgm_idx on public.cart_item_history
+  using gin (lower(sku) gin_trgm_ops);
+
+-- Every line item, open or checked out: what search, the demand forecast and
+-- the simulator read.
+create view public.cart_lines as
+select item_id, cart_id, sku, quantity, timestamp from public.cart_items
+union all
+select item_id, cart_id, sku, quantity, timestamp from public.cart_item_history;
+
+-- Carts from before this migration were never marked. Search has always
+-- listed their lines as orders, so the ones with lines count as checked out
+-- and the rest as abandoned. Carts from the last hour may still be in use and
+-- are left open.
+with stale as (
+    select id from public.carts where timestamp < now() - interval '1 hour'
+),
+moved as (
+    delete from public.cart_items
+     where cart_id in (select id from stale)
+ returning item_id, cart_id, sku, quantity, timestamp
+),
+history as (
+    insert into public.cart_item_history (item_id, cart_id, sku, quantity, timestamp)
+    select item_id, cart_id, sku, quantity, timestamp from moved
+)
+update public.carts
+   set state = case
+                 when exists (select 1 from moved where moved.cart_id = carts.id)
+                 then 'checked_out'
+                 else 'abandoned'
+               end,
+       closed_at = now()
+ where id in (select id from stale);
@@ -0,0 +1,67 @@
+-- Days are game days, as reported by /info/current_time, rather than the
+-- server's weekday (see src/game_clock.py).
+
+-- Every tick, so the clock survives restarts.
+create table public.game_ticks (
+    id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    day text not null,
+    hour integer not null,
+    constraint game_ticks_pkey primary key (id)
+);
+
+create index game_ticks_timestamp_idx on public.game_ticks (timestamp);
+
+-- The game day of the latest tick, or null before the first one.
+create function public.game_day() returns text language sql stable as $$
+  select day from public.game_ticks order by timestamp desc limit 1
+$$;
+
+-- potion_strategy keeps its rows: each weekday becomes the game day in the
+-- same position. The positional mapping is intentional: Sunday's strategy
+-- becomes Edgeday's, Monday's Bloomday's and so on, so the meaning of every
+-- existing row changes without any row being rewritten.
+alter type public."day of week" rename value 'Sunday' to 'Edgeday';
+alter type public."day of week" rename value 'Monday' to 'Bloomday';
+alter type public."day of week" rename value 'Tuesday' to 'Arcanaday';
+alter type public."day of week" rename value 'Wednesday' to 'Hearthday';
+alter type public."day of week" rename value 'Thursday' to 'Crownday';
+alter type public."day of week" rename value 'Friday' to 'Blesseday';
+alter type public."day of week" rename value 'Saturday' to 'Soulday';
+
+-- The text day_of_week columns are mapped the same way, so the rows already
+-- written line up with potion_strategy and the rollups. From now on they
+-- default to the game day, and are null for rows written before the first
+-- tick rather than the wall-clock weekday.
+do $$
+declare
+  target text;
+begin
+  foreach target in array array[
+    'customer_visits', 'carts', 'cart_items', 'gold_records', 'potion_records',
+    'gold_records_archive', 'potion_records_archive', 'sales_rollups'
+  ] loop
+    execute format(
+      $sql$
+      update public.%I
+         set day_of_week = days.game_day
+        from (values ('Sunday', 'Edgeday'), ('Monday', 'Bloomday'),
+                     ('Tuesday', 'Arcanaday'), ('Wednesday', 'Hearthday'),
+                     ('Thursday', 'Crownday'), ('Friday', 'Blesseday'),
+                     ('Saturday', 'Soulday')) as days (weekday, game_day)
+       where day_of_week = days.weekday
+      $sql$,
+      target
+    );
+    execute format(
+      'alter table public.%I alter column day_of_week drop not null', target
+    );
+    if target not like '%\_archive' and target <> 'sales_rollups' then
+      execute format(
+        'alter table public.%I alter column day_of_week set default public.game_day()',
+        target
+      );
+    end if;
+  end loop;
+end;
+$$;
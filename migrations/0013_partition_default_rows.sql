@@ -0,0 +1,56 @@
+-- A month's partition can't be created while its default partition holds rows
+-- in that month: the new bounds would conflict with them. That happens when
+-- nothing created the month's partition ahead of time and its rows went to
+-- *_default. ensure_monthly_partitions now moves those rows: it detaches the
+-- default partition, creates the month's partition, moves the month's rows
+-- into it through the parent and re-attaches the default.
+--
+-- Moving rows leaves every ledger total unchanged, so the balance triggers are
+-- bypassed as they are during compaction. Callers run concurrently (every
+-- worker and the migration runner), so each parent is locked while its
+-- partitions are checked.
+create or replace function public.ensure_monthly_partitions(parent regclass, months integer)
+returns void language plpgsql as $$
+declare
+  month_start timestamptz := date_trunc('month', now());
+  parent_name text := (select relname from pg_class where oid = parent);
+  default_name text := parent_name || '_default';
+  partition_name text;
+  stranded boolean;
+begin
+  perform pg_advisory_xact_lock(hashtext('ensure_monthly_partitions:' || parent::text));
+  for i in 0..months loop
+    partition_name := parent_name || '_' || to_char(month_start, 'YYYY_MM');
+    if to_regclass(format('public.%I', partition_name)) is null then
+      execute format(
+        'select exists (select from public.%I where timestamp >= %L and timestamp < %L)',
+        default_name, month_start, month_start + interval '1 month'
+      ) into stranded;
+      if stranded then
+        execute format('alter table %s detach partition public.%I', parent, default_name);
+      end if;
+      execute format(
+        'create table public.%I partition of %s for values from (%L) to (%L)',
+        partition_name, parent, month_start, month_start + interval '1 month'
+      );
+      if stranded then
+        perform set_config('potionshop.compacting', 'on', true);
+        execute format(
+          $sql$
+          with moved as (
+              delete from public.%I
+               where timestamp >= %L and timestamp < %L
+           returning *
+          )
+          insert into %s select * from moved
+          $sql$,
+          default_name, month_start, month_start + interval '1 month', parent
+        );
+        perform set_config('potionshop.compacting', 'off', true);
+        execute format('alter table %s attach partition public.%I default', parent, default_name);
+      end if;
+    end if;
+    month_start := month_start + interval '1 month';
+  end loop;
+end;
+$$;
@@ -0,0 +1,9 @@
+-- A delivery releases the reservation of the plan it delivers rather than
+-- the oldest of its kind: plan is src/reservations.py plan_key() of the
+-- plan's lines, which the delivery lists again. Reservations made before
+-- this have no key and simply expire.
+alter table public.plan_reservations add column plan text not null default '';
+
+drop index public.plan_reservations_kind_idx;
+
+create index plan_reservations_kind_plan_idx on public.plan_reservations (kind, plan, id);
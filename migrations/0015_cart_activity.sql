@@ -0,0 +1,17 @@
+-- Carts are abandoned once left untouched for the TTL, not once they are that
+-- old: every item change bumps updated_at, and the sweeper reads it.
+alter table public.carts add column updated_at timestamp with time zone;
+
+update public.carts
+   set updated_at = greatest(
+           timestamp,
+           (select max(timestamp) from public.cart_items where cart_id = carts.id)
+       );
+
+alter table public.carts
+  alter column updated_at set default now(),
+  alter column updated_at set not null;
+
+drop index public.carts_open_timestamp_idx;
+
+create index carts_open_updated_at_idx on public.carts (updated_at) where state = 'open';
@@ -0,0 +1,4 @@
+-- get_bottle_plan reads recent sales from sales_rollups now, so nothing probes
+-- cart_items by (sku, timestamp) any more; the index only slowed every item
+-- upsert.
+drop index if exists public.cart_items_sku_timestamp_idx;
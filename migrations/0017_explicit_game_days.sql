@@ -0,0 +1,19 @@
+-- Every insert now writes day_of_week from the process's game clock, so the
+-- game_day() default, a game_ticks lookup per inserted row (the COPY of a
+-- visit batch included), goes. Compaction's snapshot rows span many days
+-- and are left without one.
+do $$
+declare
+  target text;
+begin
+  foreach target in array array[
+    'customer_visits', 'carts', 'cart_items', 'gold_records', 'potion_records'
+  ] loop
+    execute format(
+      'alter table public.%I alter column day_of_week drop default', target
+    );
+  end loop;
+end;
+$$;
+
+drop function public.game_day();
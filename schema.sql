@@ -1,3 +1,6 @@
+-- Baseline schema. Later changes are versioned in migrations/ and applied
+-- with `python -m src.migrate`.
+
 create table
   public.potion_index (
     sku text not null default 'COLOR'::text,
@@ -103,7 +106,7 @@ create table
     per_bottle_limit integer not null default,
     constraint magic_numbers_pkey primary key (id)
   ) tablespace pg_default;
- 
+
 INSERT INTO gold_records DEFAULT VALUES;
 
 INSERT INTO capacity_records DEFAULT VALUES;
\ No newline at end of file
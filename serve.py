@@ -0,0 +1,42 @@
+"""
+Production entry point: several uvicorn worker processes sharing one port,
+without reload. main.py remains the single-process development server.
+
+    WEB_CONCURRENCY=4 DB_MAX_CONNECTIONS=40 python serve.py
+
+Each worker gets its share of DB_MAX_CONNECTIONS as its pool, unless
+DB_POOL_SIZE / DB_MAX_OVERFLOW are set explicitly. Workers coordinate
+through Postgres: planning takes an advisory lock and reserves what it
+spends, and cache invalidations are sent with NOTIFY.
+"""
+import os
+
+import dotenv
+import uvicorn
+
+
+def worker_pool(workers, max_connections):
+    """Pool size and overflow per worker so all workers stay within max_connections."""
+    # Each worker also holds its own LISTEN connection, outside the pool.
+    per_worker = max(max_connections // workers - 1, 2)
+    pool_size = max(per_worker * 2 // 3, 1)
+    return pool_size, per_worker - pool_size
+
+
+if __name__ == "__main__":
+    dotenv.load_dotenv()
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+    pool_size, max_overflow = worker_pool(
+        workers, int(os.environ.get("DB_MAX_CONNECTIONS", 20 * workers))
+    )
+    # Workers are spawned with this environment, so src.database sees it.
+    os.environ.setdefault("DB_POOL_SIZE", str(pool_size))
+    os.environ.setdefault("DB_MAX_OVERFLOW", str(max_overflow))
+    uvicorn.run(
+        "src.api.server:app",
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", 3000)),
+        workers=workers,
+        log_level="info",
+        proxy_headers=True,
+    )
@@ -1,8 +1,21 @@
+import logging
+from datetime import datetime
+
 import sqlalchemy
-from fastapi import APIRouter, Depends, Request
-from pydantic import BaseModel
+from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from src import database as db
-from src.api import auth
+from src import (
+    compaction,
+    export,
+    game_clock,
+    metrics,
+    queries,
+    receipts,
+    refdata,
+    sweeper,
+)
+from src.api import auth, catalog
 
 router = APIRouter(
     prefix="/admin",
@@ -10,6 +23,126 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = logging.getLogger(__name__)
+
+# Reset is announced on this channel once it commits, so every process drops
+# the receipts and catalog it has cached.
+RESET_CHANNEL = "admin_reset"
+
+RESET = queries.register(
+    "admin.reset",
+    """
+    DELETE FROM gold_records;
+    INSERT INTO gold_records (day_of_week) VALUES (CAST(:day AS text));
+    DELETE FROM capacity_records;
+    INSERT INTO capacity_records DEFAULT VALUES;
+    DELETE FROM potion_records;
+    DELETE FROM ml_records;
+    DELETE FROM delivery_receipts;
+    DELETE FROM plan_reservations;
+    DELETE FROM potion_records_archive;
+    DELETE FROM ml_records_archive;
+    DELETE FROM gold_records_archive;
+    DELETE FROM capacity_records_archive;
+    SELECT pg_notify(:channel, '');
+    """,
+)
+LOCK_LEDGERS = queries.register(
+    "admin.reconcile.lock",
+    """
+    LOCK TABLE potion_records, ml_records, gold_records, capacity_records
+       IN SHARE MODE
+    """,
+)
+POTION_DRIFT = queries.register(
+    "admin.reconcile.potion_drift",
+    """
+    SELECT sku,
+           COALESCE(ledger.quantity, 0) AS ledger,
+           COALESCE(potion_balances.quantity, 0) AS balance
+      FROM (
+            SELECT sku, SUM(qty_change) AS quantity
+              FROM potion_records
+             GROUP BY sku
+           ) AS ledger
+     FULL JOIN potion_balances USING (sku)
+     WHERE COALESCE(ledger.quantity, 0) <> COALESCE(potion_balances.quantity, 0)
+    """,
+)
+TOTALS = queries.register(
+    "admin.reconcile.totals",
+    """
+    SELECT ARRAY[
+                COALESCE(SUM(red), 0),
+                COALESCE(SUM(green), 0),
+                COALESCE(SUM(blue), 0),
+                COALESCE(SUM(dark), 0)
+           ] AS ml_ledger,
+           (SELECT ARRAY[red, green, blue, dark] FROM ml_balance) AS ml_balance,
+           (SELECT COALESCE(SUM(change_in_gold), 0) FROM gold_records) AS gold_ledger,
+           (SELECT gold FROM gold_balance) AS gold_balance,
+           (SELECT ARRAY[COALESCE(SUM(potion_units), 0), COALESCE(SUM(ml_units), 0)]
+              FROM capacity_records) AS capacity_ledger,
+           (SELECT ARRAY[potion_units, ml_units] FROM capacity_balance)
+               AS capacity_balance
+      FROM ml_records
+    """,
+)
+# Tables that grow with play, each summed over its partitions.
+STORAGE_TABLES = [
+    "carts",
+    "cart_items",
+    "cart_item_history",
+    "customer_visits",
+    "sales_rollups",
+    "potion_records",
+    "ml_records",
+    "gold_records",
+    "capacity_records",
+]
+TABLE_SIZES = queries.register(
+    "admin.table_sizes",
+    """
+    SELECT tables.name,
+           CAST(SUM(pg_class.reltuples) FILTER (WHERE pg_class.reltuples > 0)
+                AS bigint) AS estimated_rows,
+           CAST(SUM(pg_table_size(tree.relid)) AS bigint) AS table_bytes,
+           CAST(SUM(pg_indexes_size(tree.relid)) AS bigint) AS index_bytes,
+           CAST(SUM(pg_total_relation_size(tree.relid)) AS bigint) AS total_bytes
+      FROM unnest(CAST(:tables AS text[])) AS tables (name)
+     CROSS JOIN LATERAL
+           pg_partition_tree(CAST('public.' || tables.name AS regclass)) AS tree
+      JOIN pg_class ON pg_class.oid = tree.relid
+     GROUP BY tables.name
+    """,
+)
+REBUILD = queries.register(
+    "admin.reconcile.rebuild",
+    """
+    INSERT INTO potion_balances (sku, quantity)
+    SELECT sku, SUM(qty_change) FROM potion_records
+     GROUP BY sku
+    ON CONFLICT (sku)
+      DO UPDATE
+            SET quantity = excluded.quantity;
+    UPDATE potion_balances SET quantity = 0
+     WHERE sku NOT IN (SELECT sku FROM potion_records);
+    UPDATE ml_balance
+       SET (red, green, blue, dark) = (
+            SELECT COALESCE(SUM(red), 0), COALESCE(SUM(green), 0),
+                   COALESCE(SUM(blue), 0), COALESCE(SUM(dark), 0)
+              FROM ml_records
+           );
+    UPDATE gold_balance
+       SET gold = (SELECT COALESCE(SUM(change_in_gold), 0) FROM gold_records);
+    UPDATE capacity_balance
+       SET (potion_units, ml_units) = (
+            SELECT COALESCE(SUM(potion_units), 0), COALESCE(SUM(ml_units), 0)
+              FROM capacity_records
+           );
+    """,
+)
+
 
 @router.post("/reset")
 def reset():
@@ -18,17 +151,184 @@ def reset():
     inventory, and all barrels are removed from inventory. Carts are all reset.
     """
     with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text(
-                """
-                DELETE FROM gold_records;
-                INSERT INTO gold_records DEFAULT VALUES;
-                DELETE FROM capacity_records;
-                INSERT INTO capacity_records DEFAULT VALUES;
-                DELETE FROM potion_records;
-                DELETE FROM ml_records;
-                """
+        connection.execute(RESET, {"channel": RESET_CHANNEL, "day": game_clock.day})
+    forget_cached()
+    logger.info("Game state has been reset")
+    return "OK"
+
+
+def forget_cached(payload=None):
+    """
+    Drops the delivery receipts and catalog cached in this process. Also the
+    handler for RESET_CHANNEL, so a reset made by another process drops them
+    here too.
+    """
+    receipts.forget_all()
+    catalog.invalidate()
+
+
+@router.post("/reconcile")
+def reconcile():
+    """
+    Rebuild the running balances from the ledgers. Reports any drift found
+    between the balances and the ledger totals before they were rebuilt.
+    """
+    with db.engine.begin() as connection:
+        # Block ledger writes so the rebuilt balances match a stable snapshot.
+        connection.execute(LOCK_LEDGERS)
+        potion_drift = connection.execute(POTION_DRIFT).mappings().all()
+        totals = connection.execute(TOTALS).one()
+        connection.execute(REBUILD)
+    catalog.invalidate()
+    drift = {
+        "potions": [dict(row) for row in potion_drift],
+        "ml": (
+            {"ledger": totals.ml_ledger, "balance": totals.ml_balance}
+            if totals.ml_ledger != totals.ml_balance
+            else None
+        ),
+        "gold": (
+            {"ledger": totals.gold_ledger, "balance": totals.gold_balance}
+            if totals.gold_ledger != totals.gold_balance
+            else None
+        ),
+        "capacity": (
+            {"ledger": totals.capacity_ledger, "balance": totals.capacity_balance}
+            if totals.capacity_ledger != totals.capacity_balance
+            else None
+        ),
+    }
+    logger.info("Balances reconciled", extra={"drift": drift})
+    return drift
+
+
+@router.post("/compact")
+def compact(keep_days: float = 7):
+    """
+    Fold ledger rows older than keep_days days into one snapshot row per sku
+    or resource. The folded rows are moved to the archive tables, and every
+    ledger total is left unchanged.
+    """
+    return compaction.run(keep_days)
+
+
+@router.post("/refdata")
+async def reload_refdata():
+    """
+    Mark potion_index, potion_strategy and magic_numbers as changed, so every
+    process reloads its copy. Edits to those tables already do this; use it
+    after changes made with the triggers disabled.
+    """
+    async with db.async_engine.begin() as connection:
+        version = await refdata.bump(connection)
+    await refdata.reload()
+    return {"version": refdata.version, "requested": version}
+
+
+@router.get("/storage")
+async def get_storage():
+    """
+    Estimated rows and on-disk bytes of the tables that grow with play, and
+    what this process's cart sweeper has abandoned and how fast.
+    """
+    async with db.async_engine.begin() as connection:
+        sizes = (
+            await connection.execute(TABLE_SIZES, {"tables": STORAGE_TABLES})
+        ).all()
+    return {
+        "tables": {
+            row.name: {
+                "estimated_rows": row.estimated_rows or 0,
+                "table_bytes": row.table_bytes,
+                "index_bytes": row.index_bytes,
+                "total_bytes": row.total_bytes,
+            }
+            for row in sizes
+        },
+        "sweeper": sweeper.throughput(),
+    }
+
+
+@router.get("/export/{table}")
+async def export_table(
+    table: export.export_tables,
+    format: export.export_formats = export.export_formats.ndjson,
+    since: datetime = None,
+    until: datetime = None,
+    sku: str = None,
+):
+    """
+    Stream every row of table as NDJSON or CSV, optionally only those
+    timestamped from since up to until, and for tables with a sku, only that
+    sku. Rows are streamed from a server-side cursor as they are read, in no
+    particular order.
+    """
+    if sku is not None and not export.has_sku(table):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{table.value} has no sku to filter on",
+        )
+    logger.info(
+        "Export started",
+        extra={
+            "table": table.value,
+            "format": format.value,
+            "since": since,
+            "until": until,
+            "sku": sku,
+        },
+    )
+    return StreamingResponse(
+        export.stream(table, format, since, until, sku),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{table.value}.{format.value}"'
             )
+        },
+    )
+
+
+@router.get("/catalog_cache")
+def get_catalog_cache_stats():
+    """Hit and miss counters for the cached catalog."""
+    return catalog.cache_stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Per-route latency histograms, query counts and DB time, per-statement
+    timings and pool checkout waits, in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/queries")
+def get_queries():
+    """Executions, total seconds and slowest run of every registered query."""
+    return queries.stats()
+
+
+@router.post("/queries/{name}/explain")
+async def explain_query(name: str, params: dict = Body(default={})):
+    """
+    EXPLAIN ANALYZE of the registered query name, run with params as its
+    bind parameters. The query really runs, in a transaction that is rolled
+    back afterwards.
+    """
+    if name not in queries.statements:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown query"
         )
-    print("[Log] Game state has been reset.")
-    return "OK"
+    try:
+        plan = await queries.explain(name, params)
+    except sqlalchemy.exc.DBAPIError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error.orig)
+        )
+    return {"query": name, "plan": plan}
+
+
+if __name__ == "__main__":
+    print(reconcile())
@@ -5,9 +5,8 @@ import dotenv
 
 dotenv.load_dotenv()
 
-api_keys = []  
-
-api_keys.append(os.environ.get("API_KEY"))
+# Read once from the environment and never changed, so every worker agrees.
+api_keys = (os.environ.get("API_KEY"),)
 api_key_header = APIKeyHeader(name="access_token", auto_error=False)
 
 
@@ -1,127 +1,153 @@
-import sqlalchemy
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-import numpy as np
-
-from src import database as db
-from src.api import auth
-
-router = APIRouter(
-    prefix="/barrels",
-    tags=["barrels"],
-    dependencies=[Depends(auth.get_api_key)],
-)
-
-
-class Barrel(BaseModel):
-    sku: str
-
-    ml_per_barrel: int
-    potion_type: list[int]
-    price: int
-
-    quantity: int
-
-
-@router.post("/deliver/{order_id}")
-def post_deliver_barrels(barrels_delivered: list[Barrel], order_id: int):
-    """
-    Posts delivery of barrels. order_id is a unique value representing
-    a single delivery.
-    """
-    print(f"[Log] Barrels delivered (ID {order_id}):", barrels_delivered)
-    total_ml = [
-        sum(
-            barrel.potion_type[i] * barrel.quantity * barrel.ml_per_barrel
-            for barrel in barrels_delivered
-        )
-        for i in range(4)
-    ]
-    total_price = sum(barrel.price * barrel.quantity for barrel in barrels_delivered)
-
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO ml_records (red, green, blue, dark)
-                VALUES (:red, :green, :blue, :dark);
-                INSERT INTO gold_records (change_in_gold)
-                VALUES (:price * -1)
-                """
-            ),
-            {
-                "red": total_ml[0],
-                "green": total_ml[1],
-                "blue": total_ml[2],
-                "dark": total_ml[3],
-                "price": total_price,
-            },
-        )
-    return "OK"
-
-
-# Gets called once a day
-@router.post("/plan")
-def get_wholesale_purchase_plan(wholesale_catalog: list[Barrel]):
-    """
-    Gets the plan for purchasing wholesale barrels. The call passes in a catalog of available barrels and the shop returns back which barrels they'd like to purchase and how many.
-    """
-    print("[Log] Barrel catalog:", wholesale_catalog)
-    with db.engine.begin() as connection:
-        res = connection.execute(
-            sqlalchemy.text(
-                """
-                WITH magic (budget, ml_limit) AS (
-                    SELECT per_barrel_budget, per_barrel_ml_limit
-                      FROM magic_numbers
-                     LIMIT 1
-                )
-                SELECT (SELECT SUM(change_in_gold) FROM gold_records) AS gold,
-                       (SELECT SUM(ml_units) * 10000 FROM capacity_records) -
-                            COALESCE(SUM(red + green + blue + dark), 0) AS ml_left,
-                       magic.budget,
-                       ARRAY[
-                            magic.ml_limit - COALESCE(SUM(red), 0),
-                            magic.ml_limit - COALESCE(SUM(green), 0),
-                            magic.ml_limit - COALESCE(SUM(blue), 0),
-                            magic.ml_limit - COALESCE(SUM(dark), 0)
-                        ] AS buyable_ml
-                  FROM ml_records CROSS JOIN magic
-                 GROUP BY budget, ml_limit
-                """
-            )
-        ).one()
-    gold = res.gold
-    ml_left = res.ml_left
-    ranks = np.argsort(res.buyable_ml)[::-1]
-    sorted_catalog = sorted((b for b in wholesale_catalog), key=lambda b: b.ml_per_barrel, reverse=True)  # sort catalog by ml
-    purchase_plan = []
-    for r in ranks:
-        if res.buyable_ml[r] > 0:
-            barrel = next(
-                (
-                    b
-                    for b in sorted_catalog
-                    if b.potion_type[r] == 1
-                    and gold >= b.price
-                    and ml_left >= b.ml_per_barrel
-                ),
-                None,
-            )
-            if barrel:
-                sorted_catalog.remove(barrel)
-                qty = int(
-                    max(
-                        min(
-                            min(res.buyable_ml[r], ml_left) // barrel.ml_per_barrel,
-                            min(res.budget, gold) // barrel.price,
-                            barrel.quantity,
-                        ),
-                        1
-                    ),
-                )
-                gold -= barrel.price * qty
-                ml_left -= barrel.ml_per_barrel * qty
-                purchase_plan.append({"sku": barrel.sku, "quantity": qty})
-    print("[Log] Purchase Plan:", purchase_plan)
-    return purchase_plan
+import logging
+from enum import Enum
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+from src import database as db
+from src import game_clock, logs, planning, queries, receipts, refdata, reservations
+from src.api import auth
+
+router = APIRouter(
+    prefix="/barrels",
+    tags=["barrels"],
+    dependencies=[Depends(auth.get_api_key)],
+)
+
+logger = logging.getLogger(__name__)
+
+
+DELIVER = queries.register(
+    "barrels.deliver",
+    """
+    WITH ml AS (
+        INSERT INTO ml_records (red, green, blue, dark)
+        VALUES (:red, :green, :blue, :dark)
+    )
+    INSERT INTO gold_records (change_in_gold, day_of_week)
+    VALUES (:price * -1, CAST(:day AS text))
+    """,
+)
+PLAN_LIMITS = queries.register(
+    "barrels.plan_limits",
+    """
+    SELECT gold_balance.gold,
+           capacity_balance.ml_units * 10000 AS ml_room,
+           ARRAY[red, green, blue, dark] AS ml_list
+      FROM ml_balance, gold_balance, capacity_balance
+    """,
+)
+
+
+class Barrel(BaseModel):
+    sku: str
+
+    ml_per_barrel: int
+    potion_type: list[int]
+    price: int
+
+    quantity: int
+
+
+@router.post("/deliver/{order_id}")
+async def post_deliver_barrels(barrels_delivered: list[Barrel], order_id: int):
+    """
+    Posts delivery of barrels. order_id is a unique value representing
+    a single delivery.
+    """
+    logger.info(
+        "Barrels delivered",
+        extra={"order_id": order_id, "barrels": logs.summarize(barrels_delivered)},
+    )
+    replay = receipts.lookup("barrels", order_id)
+    if replay is not None:
+        return replay
+    total_ml = [
+        sum(
+            barrel.potion_type[i] * barrel.quantity * barrel.ml_per_barrel
+            for barrel in barrels_delivered
+        )
+        for i in range(4)
+    ]
+    total_price = sum(barrel.price * barrel.quantity for barrel in barrels_delivered)
+
+    async with db.async_engine.begin() as connection:
+        replay = await receipts.claim(connection, "barrels", order_id, "OK")
+        if replay is not None:
+            return replay
+        await reservations.release(
+            connection,
+            "barrels",
+            reservations.plan_key(
+                (barrel.sku, barrel.quantity) for barrel in barrels_delivered
+            ),
+        )
+        await connection.execute(
+            DELIVER,
+            {
+                "red": total_ml[0],
+                "green": total_ml[1],
+                "blue": total_ml[2],
+                "dark": total_ml[3],
+                "price": total_price,
+                "day": game_clock.day,
+            },
+        )
+    receipts.remember("barrels", order_id, "OK")
+    return "OK"
+
+
+class barrel_solvers(str, Enum):
+    greedy = "greedy"
+    optimal = "optimal"
+
+
+# Gets called once a day
+@router.post("/plan")
+async def get_wholesale_purchase_plan(
+    wholesale_catalog: list[Barrel], solver: barrel_solvers = barrel_solvers.greedy
+):
+    """
+    Gets the plan for purchasing wholesale barrels. The call passes in a catalog
+    of available barrels and the shop returns back which barrels they'd like to
+    purchase and how many. The greedy solver is the default; optimal maximizes
+    the ml bought across all barrels.
+    """
+    logger.debug("Barrel catalog", extra={"catalog": logs.summarize(wholesale_catalog)})
+    # Held until commit, so concurrent plans see this one's reservation.
+    async with db.async_engine.begin() as connection:
+        await reservations.lock(connection)
+        res = (await connection.execute(PLAN_LIMITS)).one()
+        reserved = await reservations.outstanding(connection)
+        ml_list = [ml + arriving for ml, arriving in zip(res.ml_list, reserved.ml_in)]
+        buyable_ml = [refdata.magic.per_barrel_ml_limit - ml for ml in ml_list]
+        purchase_plan = planning.BARREL_PLANNERS[solver.value](
+            wholesale_catalog,
+            max(res.gold - reserved.gold, 0),
+            max(res.ml_room - sum(ml_list), 0),
+            refdata.magic.per_barrel_budget,
+            buyable_ml,
+        )
+        barrels = {barrel.sku: barrel for barrel in wholesale_catalog}
+        await reservations.reserve(
+            connection,
+            "barrels",
+            reservations.plan_key(
+                (purchase["sku"], purchase["quantity"]) for purchase in purchase_plan
+            ),
+            gold=sum(
+                barrels[purchase["sku"]].price * purchase["quantity"]
+                for purchase in purchase_plan
+            ),
+            ml_in=[
+                sum(
+                    barrels[purchase["sku"]].potion_type[i]
+                    * barrels[purchase["sku"]].ml_per_barrel
+                    * purchase["quantity"]
+                    for purchase in purchase_plan
+                )
+                for i in range(4)
+            ],
+        )
+    logger.info("Purchase plan", extra={"plan": purchase_plan, "solver": solver.value})
+    return purchase_plan
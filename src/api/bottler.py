@@ -1,163 +1,265 @@
-import sqlalchemy
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-
-from src import database as db
-from src.api import auth
-
-router = APIRouter(
-    prefix="/bottler",
-    tags=["bottler"],
-    dependencies=[Depends(auth.get_api_key)],
-)
-
-
-class PotionInventory(BaseModel):
-    potion_type: list[int]
-    quantity: int
-
-
-@router.post("/deliver/{order_id}")
-def post_deliver_bottles(potions_delivered: list[PotionInventory], order_id: int):
-    """Posts delivery of potions. order_id is a unique value representing a single delivery."""
-    print(f"[Log] Potions delivered: {potions_delivered} Order id: {order_id}")
-    with db.engine.begin() as connection:
-        total_ml = [0, 0, 0, 0]
-        for potion in potions_delivered:
-            for i in range(4):
-                total_ml[i] += potion.potion_type[i] * potion.quantity
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    INSERT INTO potion_records (sku, qty_change)
-                    SELECT sku, :quantity FROM potion_index
-                        WHERE red_pct = :red
-                          AND green_pct = :green
-                          AND blue_pct = :blue
-                          AND dark_pct = :dark
-                    """
-                ),
-                {
-                    "quantity": potion.quantity,
-                    "red": potion.potion_type[0],
-                    "green": potion.potion_type[1],
-                    "blue": potion.potion_type[2],
-                    "dark": potion.potion_type[3],
-                },
-            )
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO ml_records (red, green, blue, dark)
-                     VALUES (:red * -1, :green * -1, :blue * -1, :dark * -1)
-                """
-            ),
-            {
-                "red": total_ml[0],
-                "green": total_ml[1],
-                "blue": total_ml[2],
-                "dark": total_ml[3],
-            },
-        )
-    return "OK"
-
-
-@router.post("/plan")
-def get_bottle_plan():
-    """Gets the plan for bottling potions from barrels."""
-
-    # Each bottle has a quantity of what proportion of red, blue, and
-    # green potion to add.
-    # Expressed in integers from 1 to 100 that must sum up to 100.
-    with db.engine.begin() as connection:
-        todays_potions = (
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    WITH TodayPotions AS (
-                        SELECT potion_index.sku AS potion,
-                               ARRAY[red_pct, green_pct, blue_pct, dark_pct] AS potion_type,
-                               COALESCE(favorability, 1.0) AS favorability
-                          FROM potion_index
-                     LEFT JOIN potion_strategy ON potion_strategy.potion_sku = potion_index.sku
-                           AND potion_strategy.day_of_week::text = TO_CHAR(NOW(), 'fmDay')
-                           AND COALESCE(favorability, 1.0) > 0
-                         WHERE do_bottle = TRUE
-                    ),
-                    RecentAmtSold AS (
-                        SELECT potion, COALESCE(SUM(quantity), 0) AS recent_amt_sold
-                          FROM TodayPotions
-                     LEFT JOIN cart_items ON cart_items.sku = potion
-                           AND timestamp >= (NOW() - INTERVAL '4 hours')
-                      GROUP BY potion
-                    ),
-                    magic (pt_limit) AS (
-                        SELECT per_bottle_limit
-                        FROM magic_numbers
-                        LIMIT 1
-                    )
-                    SELECT DISTINCT potion_type, recent_amt_sold, favorability,
-                                    magic.pt_limit - COALESCE(SUM(qty_change), 0) AS brewable_pt
-                               FROM TodayPotions CROSS JOIN magic
-                               JOIN RecentAmtSold ON RecentAmtSold.potion = TodayPotions.potion
-                          LEFT JOIN potion_records ON potion_records.sku = TodayPotions.potion
-                           GROUP BY potion_type, favorability, recent_amt_sold, pt_limit
-                             HAVING magic.pt_limit > COALESCE(SUM(qty_change), 0) 
-                           ORDER BY recent_amt_sold DESC, favorability DESC, brewable_pt DESC
-                    """
-                )
-            )
-        ).all()
-        limits = (
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    WITH ml (list) AS (
-                        SELECT 
-                            ARRAY[
-                               COALESCE(SUM(red), 0),
-                               COALESCE(SUM(green), 0),
-                               COALESCE(SUM(blue), 0),
-                               COALESCE(SUM(dark), 0)
-                            ]
-                        FROM ml_records
-                    )
-                    SELECT (SELECT SUM(potion_units) * 50 FROM capacity_records) -
-                                (SELECT COALESCE(SUM(qty_change), 0) FROM potion_records) AS potions_left,
-                            ml.list AS ml_list
-                      FROM ml
-                    """
-                )
-            )
-        ).one()
-    ml_list = limits.ml_list
-    potions_left = limits.potions_left
-    bottle_plan = []
-    for potion in todays_potions:
-        qty = int(
-            min(
-                min(
-                    ml_list[i] // potion.potion_type[i]
-                    for i in range(4)
-                    if potion.potion_type[i] > 0
-                ),
-                potions_left,
-                potion.brewable_pt
-            )
-        )
-        if qty > 0:
-            for i in range(4):
-                ml_list[i] -= qty * potion.potion_type[i]
-            potions_left -= qty
-            bottle_plan.append(
-                {
-                    "potion_type": potion.potion_type,
-                    "quantity": qty,
-                }
-            )
-    print("[Log] Bottle Plan:", bottle_plan)
-    return bottle_plan
-
-
-if __name__ == "__main__":
-    print(get_bottle_plan())
+import asyncio
+import logging
+from enum import Enum
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from src import database as db
+from src import forecast, game_clock, logs, planning
+from src import queries, receipts, refdata, reservations
+from src.api import auth, catalog
+
+router = APIRouter(
+    prefix="/bottler",
+    tags=["bottler"],
+    dependencies=[Depends(auth.get_api_key)],
+)
+
+logger = logging.getLogger(__name__)
+
+
+DELIVER = queries.register(
+    "bottler.deliver",
+    """
+    WITH delivered (red, green, blue, dark, quantity) AS (
+        SELECT * FROM unnest(
+            CAST(:red AS integer[]),
+            CAST(:green AS integer[]),
+            CAST(:blue AS integer[]),
+            CAST(:dark AS integer[]),
+            CAST(:quantity AS integer[])
+        )
+    ),
+    potions AS (
+        INSERT INTO potion_records (sku, qty_change, day_of_week)
+        SELECT sku, delivered.quantity, CAST(:day AS text)
+          FROM delivered
+          JOIN potion_index ON red_pct = delivered.red
+           AND green_pct = delivered.green
+           AND blue_pct = delivered.blue
+           AND dark_pct = delivered.dark
+    )
+    INSERT INTO ml_records (red, green, blue, dark)
+    SELECT COALESCE(SUM(red * quantity), 0) * -1,
+           COALESCE(SUM(green * quantity), 0) * -1,
+           COALESCE(SUM(blue * quantity), 0) * -1,
+           COALESCE(SUM(dark * quantity), 0) * -1
+      FROM delivered
+    """,
+)
+
+
+class PotionInventory(BaseModel):
+    potion_type: list[int]
+    quantity: int
+
+
+@router.post("/deliver/{order_id}")
+async def post_deliver_bottles(potions_delivered: list[PotionInventory], order_id: int):
+    """
+    Posts delivery of potions. order_id is a unique value representing a
+    single delivery.
+    """
+    logger.info(
+        "Potions delivered",
+        extra={"order_id": order_id, "potions": logs.summarize(potions_delivered)},
+    )
+    replay = receipts.lookup("bottler", order_id)
+    if replay is not None:
+        return replay
+    # Every potion type is resolved against potion_index in a single join, and
+    # the potion credits and the ml debit are written by one statement.
+    async with db.async_engine.begin() as connection:
+        replay = await receipts.claim(connection, "bottler", order_id, "OK")
+        if replay is not None:
+            return replay
+        await reservations.release(
+            connection,
+            "bottler",
+            reservations.plan_key(
+                (potion.potion_type, potion.quantity) for potion in potions_delivered
+            ),
+        )
+        await connection.execute(
+            DELIVER,
+            {
+                "red": [potion.potion_type[0] for potion in potions_delivered],
+                "green": [potion.potion_type[1] for potion in potions_delivered],
+                "blue": [potion.potion_type[2] for potion in potions_delivered],
+                "dark": [potion.potion_type[3] for potion in potions_delivered],
+                "quantity": [potion.quantity for potion in potions_delivered],
+                "day": game_clock.day,
+            },
+        )
+    catalog.invalidate()
+    receipts.remember("bottler", order_id, "OK")
+    return "OK"
+
+
+class bottle_planners(str, Enum):
+    greedy = "greedy"
+    vectorized = "vectorized"
+    knapsack = "knapsack"
+
+
+# Bottled potions reach the catalog on the next tick, so they are weighed by
+# the demand forecast for the next two.
+FORECAST_TICKS = 2
+
+# How recent_amt_sold is read from sales_rollups: the sales of the last
+# window_hours hours, or this game weekday's average sales per window_hours.
+velocity_sources = {
+    False: queries.register(
+        "bottler.velocity.recent",
+        """
+        SELECT sku, SUM(quantity) AS recent_amt_sold
+          FROM sales_rollups
+         WHERE sku = ANY(CAST(:skus AS text[]))
+           AND hour > date_trunc('hour', now()) - make_interval(hours => :window_hours)
+      GROUP BY sku
+        """,
+    ),
+    True: queries.register(
+        "bottler.velocity.weekday",
+        """
+        SELECT sku,
+               CAST(SUM(quantity) AS double precision) * :window_hours / 24 / GREATEST(
+                   (SELECT COUNT(DISTINCT CAST(hour AS date))
+                      FROM sales_rollups
+                     WHERE day_of_week = :day),
+                   1
+               ) AS recent_amt_sold
+          FROM sales_rollups
+         WHERE sku = ANY(CAST(:skus AS text[]))
+           AND day_of_week = :day
+      GROUP BY sku
+        """,
+    ),
+}
+
+STOCK = queries.register("bottler.stock", "SELECT sku, quantity FROM potion_balances")
+PLAN_LIMITS = queries.register(
+    "bottler.plan_limits",
+    """
+    SELECT capacity_balance.potion_units * 50 AS potion_room,
+           ARRAY[red, green, blue, dark] AS ml_list
+      FROM ml_balance, capacity_balance
+    """,
+)
+
+# Plans are solved without the planning lock and reserved under it if the ml
+# and room they use are still free. A plan overtaken by others this many
+# times is solved while holding the lock.
+PLAN_ATTEMPTS = 3
+
+
+async def available(connection):
+    """Stock, and the ml and potion room not already reserved by other plans."""
+    stock = dict((await connection.execute(STOCK)).all())
+    limits = (await connection.execute(PLAN_LIMITS)).one()
+    reserved = await reservations.outstanding(connection)
+    ml_list = [max(ml - used, 0) for ml, used in zip(limits.ml_list, reserved.ml_out)]
+    potions_left = max(
+        limits.potion_room - sum(stock.values()) - reserved.potions_in, 0
+    )
+    return stock, ml_list, potions_left
+
+
+def usage(bottle_plan):
+    """ml of each colour and potion room a bottle plan takes."""
+    ml_out = [
+        sum(bottle["potion_type"][i] * bottle["quantity"] for bottle in bottle_plan)
+        for i in range(4)
+    ]
+    return ml_out, sum(bottle["quantity"] for bottle in bottle_plan)
+
+
+@router.post("/plan")
+async def get_bottle_plan(
+    planner: bottle_planners = bottle_planners.greedy,
+    window_hours: int = Query(4, ge=1, le=24 * 7),
+    weekday: bool = False,
+):
+    """
+    Gets the plan for bottling potions from barrels. The planner defaults
+    to greedy; vectorized gives the same plan faster on large catalogs, and
+    knapsack maximizes expected revenue exactly. Sales velocity covers the
+    last window_hours hours, or with weekday, the average sales per
+    window_hours on this game weekday. Potions are favored by their
+    forecast demand over the next FORECAST_TICKS ticks.
+    """
+
+    # Each bottle has a quantity of what proportion of red, blue, and
+    # green potion to add.
+    # Expressed in integers from 1 to 100 that must sum up to 100.
+    bottled = [potion for potion in refdata.potions.values() if potion.do_bottle]
+    favorability = forecast.favorability(FORECAST_TICKS)
+    async with db.async_engine.begin() as connection:
+        velocity = dict(
+            (
+                await connection.execute(
+                    velocity_sources[weekday],
+                    {
+                        "skus": [potion.sku for potion in bottled],
+                        "window_hours": window_hours,
+                        "day": game_clock.day,
+                    },
+                )
+            ).all()
+        )
+        free = await available(connection)
+
+    async def solve(stock, ml_list, potions_left):
+        candidates = planning.bottle_candidates(
+            bottled, stock, velocity, favorability, refdata.magic.per_bottle_limit
+        )
+        # The knapsack planner searches for up to KNAPSACK_TIME_LIMIT seconds,
+        # so every planner runs off the event loop.
+        return await run_in_threadpool(
+            planning.BOTTLE_PLANNERS[planner.value], candidates, ml_list, potions_left
+        )
+
+    for attempt in range(PLAN_ATTEMPTS):
+        last_attempt = attempt == PLAN_ATTEMPTS - 1
+        if not last_attempt:
+            bottle_plan = await solve(*free)
+        # Held until commit, so concurrent plans see this one's reservation.
+        async with db.async_engine.begin() as connection:
+            await reservations.lock(connection)
+            free = await available(connection)
+            if last_attempt:
+                bottle_plan = await solve(*free)
+            ml_out, potions_in = usage(bottle_plan)
+            _, ml_list, potions_left = free
+            if potions_in > potions_left or any(
+                used > ml for used, ml in zip(ml_out, ml_list)
+            ):
+                continue
+            await reservations.reserve(
+                connection,
+                "bottler",
+                reservations.plan_key(
+                    (bottle["potion_type"], bottle["quantity"])
+                    for bottle in bottle_plan
+                ),
+                ml_out=ml_out,
+                potions_in=potions_in,
+            )
+        break
+    logger.info(
+        "Bottle plan",
+        extra={"plan": bottle_plan, "planner": planner.value, "attempts": attempt + 1},
+    )
+    return bottle_plan
+
+
+if __name__ == "__main__":
+
+    async def main():
+        await refdata.reload()
+        await forecast.refresh()
+        return await get_bottle_plan(window_hours=4)
+
+    print(asyncio.run(main()))
@@ -1,10 +1,16 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+from datetime import datetime
 from enum import Enum
 
-import sqlalchemy
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from src import database as db
-from src.api import auth
+from src import forecast, game_clock, queries, visits
+from src.api import auth, catalog
 
 router = APIRouter(
     prefix="/carts",
@@ -12,6 +18,120 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = logging.getLogger(__name__)
+
+
+CREATE_CART = queries.register(
+    "carts.create",
+    """
+    INSERT INTO carts (customer_name, customer_class, level, day_of_week)
+            VALUES (:name, :class, :level, CAST(:day AS text))
+        RETURNING carts.id
+    """,
+)
+UPSERT_ITEMS = queries.register(
+    "carts.upsert_items",
+    """
+    WITH touched AS (
+        UPDATE carts SET updated_at = now()
+         WHERE id = :id AND state = 'open'
+     RETURNING id
+    )
+    INSERT INTO cart_items (cart_id, sku, quantity, day_of_week)
+    SELECT touched.id, sku, quantity, CAST(:day AS text)
+      FROM touched,
+           unnest(CAST(:skus AS text[]), CAST(:quantities AS integer[]))
+           AS lines (sku, quantity)
+    ON CONFLICT (cart_id, sku)
+      DO UPDATE
+            SET quantity = excluded.quantity
+    """,
+)
+SET_ITEM = queries.register(
+    "carts.set_item",
+    """
+    WITH touched AS (
+        UPDATE carts SET updated_at = now()
+         WHERE id = :id AND state = 'open'
+     RETURNING id
+    )
+    INSERT INTO cart_items (cart_id, sku, quantity, day_of_week)
+    SELECT touched.id, :sku, :quantity, CAST(:day AS text) FROM touched
+    ON CONFLICT (cart_id, sku)
+      DO UPDATE
+            SET quantity = :quantity
+    """,
+)
+LOCK_CART = queries.register(
+    "carts.lock", "SELECT state FROM carts WHERE id = :cart_id FOR UPDATE"
+)
+CHECKOUT = queries.register(
+    "carts.checkout",
+    """
+    WITH items AS (
+        SELECT cart_items.sku, cart_items.quantity, potion_index.price
+          FROM cart_items
+          JOIN potion_index ON potion_index.sku = cart_items.sku
+         WHERE cart_id = :cart_id
+    ),
+    stock AS (
+        SELECT sku, quantity
+          FROM potion_balances
+         WHERE sku IN (SELECT sku FROM items)
+         ORDER BY sku
+           FOR UPDATE
+    ),
+    checked AS (
+        SELECT COALESCE(
+                   bool_and(
+                       items.quantity >= 0
+                       AND items.quantity <= COALESCE(stock.quantity, 0)
+                   ),
+                   TRUE
+               ) AS in_stock,
+               COALESCE(SUM(items.quantity), 0) AS total_potions,
+               COALESCE(SUM(items.quantity * items.price), 0) AS total_gold
+          FROM items
+     LEFT JOIN stock ON stock.sku = items.sku
+    ),
+    potions AS (
+        INSERT INTO potion_records (sku, qty_change, day_of_week)
+        SELECT sku, quantity * -1, CAST(:day AS text) FROM items
+         WHERE (SELECT in_stock FROM checked)
+    ),
+    gold AS (
+        INSERT INTO gold_records (change_in_gold, day_of_week)
+        SELECT total_gold, CAST(:day AS text) FROM checked
+         WHERE in_stock AND total_potions > 0
+    ),
+    rollup AS (
+        INSERT INTO sales_rollups (sku, hour, day_of_week, quantity)
+        SELECT sku, date_trunc('hour', now()),
+               CAST(:day AS text), quantity
+          FROM items
+         WHERE quantity > 0 AND (SELECT in_stock FROM checked)
+        ON CONFLICT (sku, hour)
+          DO UPDATE
+                SET quantity = sales_rollups.quantity + excluded.quantity
+    ),
+    moved AS (
+        DELETE FROM cart_items
+         WHERE cart_id = :cart_id AND (SELECT in_stock FROM checked)
+     RETURNING item_id, cart_id, sku, quantity, timestamp
+    ),
+    history AS (
+        INSERT INTO cart_item_history (item_id, cart_id, sku, quantity, timestamp)
+        SELECT item_id, cart_id, sku, quantity, timestamp FROM moved
+    ),
+    closed AS (
+        UPDATE carts
+           SET state = 'checked_out', closed_at = now()
+         WHERE id = :cart_id AND (SELECT in_stock FROM checked)
+    )
+    SELECT in_stock, total_potions, total_gold FROM checked
+    """,
+)
+
 
 class search_sort_options(str, Enum):
     customer_name = "customer_name"
@@ -25,8 +145,121 @@ class search_sort_order(str, Enum):
     desc = "desc"
 
 
+# SQL expression each sort column orders (and seeks) by.
+search_sort_columns = {
+    search_sort_options.customer_name: "customer_name",
+    search_sort_options.item_sku: "quantity::text || ' ' || cart_lines.sku",
+    search_sort_options.line_item_total: "quantity * price",
+    search_sort_options.timestamp: "cart_lines.timestamp",
+}
+
+
+def search_statement(
+    sort_col: search_sort_options,
+    ascending: bool,
+    by_name: bool,
+    by_sku: bool,
+    seek: bool,
+):
+    """
+    The search query for one sort and direction, filtered by customer name
+    and/or sku, and seeking past a cursor row or starting at the top. It
+    reads cart_lines, so open and checked-out carts' lines are both found.
+    """
+    sort_expr = search_sort_columns[sort_col]
+    direction = " ASC" if ascending else " DESC"
+    filters = []
+    if by_name:
+        filters.append("LOWER(customer_name) LIKE :c_name")
+    if by_sku:
+        filters.append("LOWER(cart_lines.sku) LIKE :p_sku")
+    if seek:
+        filters.append(
+            f"({sort_expr}, item_id) {'>' if ascending else '<'} (:key, :item_id)"
+        )
+    where_str = " WHERE " + " AND ".join(filters) if filters else ""
+    name = ".".join(
+        ["carts.search", sort_col.value, "asc" if ascending else "desc"]
+        + ["name"] * by_name
+        + ["sku"] * by_sku
+        + ["seek"] * seek
+    )
+    return queries.register(
+        name,
+        """
+        SELECT item_id AS line_item_id,
+               quantity::text || ' ' || cart_lines.sku AS item_sku,
+               customer_name,
+               quantity * price AS line_item_total,
+               cart_lines.timestamp
+          FROM cart_lines
+          JOIN carts ON cart_lines.cart_id = carts.id
+          JOIN potion_index ON cart_lines.sku = potion_index.sku
+        """
+        + where_str
+        + f" ORDER BY {sort_expr}{direction}, item_id{direction}"
+        + " LIMIT 6",
+    )
+
+
+# Every combination search_orders can ask for, built up front.
+search_statements = {
+    key: search_statement(*key)
+    for key in itertools.product(
+        search_sort_options, (True, False), (False, True), (False, True), (False, True)
+    )
+}
+
+
+def encode_search_page(
+    row, direction: str, sort_col: search_sort_options, sort_order: search_sort_order
+):
+    """
+    Builds an opaque page token holding the sort key and item id of the row
+    the next query seeks from, and which side of that row to read.
+    """
+    key = row[sort_col.value]
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    token = {
+        "col": sort_col.value,
+        "order": sort_order.value,
+        "dir": direction,
+        "key": key,
+        "item_id": row["line_item_id"],
+    }
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def decode_search_page(
+    search_page: str, sort_col: search_sort_options, sort_order: search_sort_order
+):
+    """Decodes a page token, or returns None for the first page."""
+    if not search_page:
+        return None
+    try:
+        token = json.loads(base64.urlsafe_b64decode(search_page.encode()))
+        if sort_col == search_sort_options.timestamp:
+            token["key"] = datetime.fromisoformat(token["key"])
+        key_type = int if sort_col == search_sort_options.line_item_total else str
+        valid = (
+            token["col"] == sort_col.value
+            and isinstance(token["key"], (datetime, key_type))
+            and token["order"] == sort_order.value
+            and token["dir"] in ("prev", "next")
+            and isinstance(token["item_id"], int)
+        )
+    except (ValueError, TypeError, KeyError):
+        valid = False
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid search page"
+        )
+    return token
+
+
 @router.get("/search/", tags=["search"])
-def search_orders(
+async def search_orders(
     customer_name: str = "",
     potion_sku: str = "",
     search_page: str = "",
@@ -57,54 +290,48 @@ def search_orders(
     Your results must be paginated, the max results you can return at any
     time is 5 total line items.
     """
-    page = 0 if not search_page else int(search_page)
-    sort_order_str = " ASC" if sort_order == search_sort_order.asc else " DESC"
-    match sort_col:
-        case search_sort_options.customer_name:
-            sort_col_str = " ORDER BY customer_name"
-        case search_sort_options.item_sku:
-            sort_col_str = " ORDER BY item_sku"
-        case search_sort_options.line_item_total:
-            sort_col_str = " ORDER BY line_item_total"
-        case _:
-            sort_col_str = " ORDER BY timestamp"
-
-    with db.engine.begin() as connection:
-        results = (
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    SELECT item_id AS line_item_id,
-                           quantity::text || ' ' || cart_items.sku AS item_sku,
-                           customer_name,
-                           quantity * price AS line_item_total,
-                           cart_items.timestamp
-                      FROM cart_items
-                      JOIN carts ON cart_items.cart_id = carts.id
-                      JOIN potion_index ON cart_items.sku = potion_index.sku
-                     WHERE LOWER(customer_name) LIKE LOWER(:c_name)
-                       AND LOWER(cart_items.sku) LIKE LOWER(:p_sku)
-                    """
-                    + sort_col_str
-                    + sort_order_str
-                    + " LIMIT 6 OFFSET :offset"
-                ),
-                {
-                    "c_name": "%" + customer_name + "%",
-                    "p_sku": "%" + potion_sku + "%",
-                    "offset": page * 5,
-                },
-            )
-            .mappings()
-            .all()
-        )
+    cursor = decode_search_page(search_page, sort_col, sort_order)
+    # Pages before the cursor are read in reverse and flipped back afterwards.
+    backwards = cursor is not None and cursor["dir"] == "prev"
+    ascending = (sort_order == search_sort_order.asc) != backwards
+
+    params = {}
+    if customer_name:
+        params["c_name"] = "%" + customer_name.lower() + "%"
+    if potion_sku:
+        params["p_sku"] = "%" + potion_sku.lower() + "%"
+    if cursor is not None:
+        params["key"] = cursor["key"]
+        params["item_id"] = cursor["item_id"]
+    statement = search_statements[
+        (sort_col, ascending, bool(customer_name), bool(potion_sku), cursor is not None)
+    ]
+
+    async with db.async_engine.begin() as connection:
+        results = (await connection.execute(statement, params)).mappings().all()
 
+    has_more = len(results) > 5
+    results = results[:5]
+    if backwards:
+        results = results[::-1]
+    if not results:
+        return {"previous": "", "next": "", "results": []}
+    # Reading backwards always came from a later page, and reading forwards
+    # from a cursor always came from an earlier one.
+    has_previous = has_more if backwards else cursor is not None
+    has_next = has_more or backwards
     return {
         "previous": (
-            "" if not page else str(page - 1)
+            encode_search_page(results[0], "prev", sort_col, sort_order)
+            if has_previous
+            else ""
         ),
-        "next": "" if len(results) < 6 else str(page + 1),
-        "results": results[:5],
+        "next": (
+            encode_search_page(results[-1], "next", sort_col, sort_order)
+            if has_next
+            else ""
+        ),
+        "results": results,
     }
 
 
@@ -115,76 +342,122 @@ class Customer(BaseModel):
 
 
 @router.post("/visits/{visit_id}")
-def post_visits(visit_id: int, customers: list[Customer]):
+async def post_visits(visit_id: int, customers: list[Customer]):
     """
     Shares the customers that visited the store on that tick. Not all
     customers end up purchasing because they may not like what they see
     in the current catalog.
     """
-    print(f"[Log] Visits this tick (ID {visit_id}):", customers)
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO customer_visits (name, class, level)
-                     VALUES (:name, :class, :level)
-                """
-            ),
-            [
-                {
-                    "name": customer.customer_name,
-                    "class": customer.character_class,
-                    "level": customer.level,
-                }
-                for customer in customers
-            ],
+    forecast.observe_visitors(customer.character_class for customer in customers)
+    try:
+        await visits.enqueue(
+            (
+                customer.customer_name,
+                customer.character_class,
+                customer.level,
+                game_clock.day,
+            )
+            for customer in customers
         )
+    except asyncio.TimeoutError:
+        logger.warning("Visits rejected: buffer full", extra={"visit_id": visit_id})
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Visits are backed up; retry later",
+        )
+    logger.info(
+        "Visits queued", extra={"visit_id": visit_id, "customers": len(customers)}
+    )
     return "OK"
 
 
 @router.post("/")
-def create_cart(new_cart: Customer):
+async def create_cart(new_cart: Customer):
     """Creates a new cart for a specific customer."""
-    with db.engine.begin() as connection:
-        cart_id = connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO carts (customer_name, customer_class, level)
-                        VALUES (:name, :class, :level)
-                    RETURNING carts.id
-                """
-            ),
-            {
-                "name": new_cart.customer_name,
-                "class": new_cart.character_class,
-                "level": new_cart.level,
-            },
+    async with db.async_engine.begin() as connection:
+        cart_id = (
+            await connection.execute(
+                CREATE_CART,
+                {
+                    "name": new_cart.customer_name,
+                    "class": new_cart.character_class,
+                    "level": new_cart.level,
+                    "day": game_clock.day,
+                },
+            )
         ).scalar_one()
-    print(f"[Log] New cart created (ID {cart_id}) for", new_cart)
+    logger.info(
+        "New cart created", extra={"cart_id": cart_id, "customer": new_cart.dict()}
+    )
     return {"cart_id": cart_id}
 
 
+def not_open():
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT, detail="Cart is not open"
+    )
+
+
 class CartItem(BaseModel):
     quantity: int
 
 
+class CartLine(BaseModel):
+    sku: str
+    quantity: int
+
+
+async def upsert_items(connection, cart_id: int, lines: dict[str, int]):
+    """
+    Sets the quantity of every sku in lines with one multi-row upsert.
+    Raises 409 if the cart is no longer open.
+    """
+    upserted = await connection.execute(
+        UPSERT_ITEMS,
+        {
+            "id": cart_id,
+            "skus": list(lines),
+            "quantities": list(lines.values()),
+            "day": game_clock.day,
+        },
+    )
+    if lines and upserted.rowcount == 0:
+        raise not_open()
+
+
 @router.post("/{cart_id}/items/{item_sku}")
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+async def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
     """Updates the quantity of a specific item in a cart."""
-    print(f"[Log] Cart item updated (ID {cart_id}): {item_sku} (x{cart_item.quantity})")
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO cart_items (cart_id, sku, quantity)
-                     VALUES (:id, :sku, :quantity)
-                ON CONFLICT (cart_id, sku)
-                  DO UPDATE
-                        SET quantity = :quantity
-                """
-            ),
-            {"id": cart_id, "sku": item_sku, "quantity": cart_item.quantity},
+    logger.debug(
+        "Cart item updated",
+        extra={"cart_id": cart_id, "sku": item_sku, "quantity": cart_item.quantity},
+    )
+    async with db.async_engine.begin() as connection:
+        upserted = await connection.execute(
+            SET_ITEM,
+            {
+                "id": cart_id,
+                "sku": item_sku,
+                "quantity": cart_item.quantity,
+                "day": game_clock.day,
+            },
         )
+        if upserted.rowcount == 0:
+            raise not_open()
+    return "OK"
+
+
+@router.post("/{cart_id}/items")
+async def set_item_quantities(cart_id: int, cart_lines: list[CartLine]):
+    """
+    Updates the quantities of many items in a cart at once. A sku listed
+    more than once takes its last quantity.
+    """
+    # One upsert can't touch the same row twice, so repeated skus are merged.
+    lines = {line.sku: line.quantity for line in cart_lines}
+    logger.debug("Cart items updated", extra={"cart_id": cart_id, "items": lines})
+    async with db.async_engine.begin() as connection:
+        await upsert_items(connection, cart_id, lines)
     return "OK"
 
 
@@ -192,40 +465,96 @@ class CartCheckout(BaseModel):
     payment: str
 
 
+async def checkout_cart(connection, cart_id: int):
+    """
+    Locks the cart, then its potion balances (in sku order, so concurrent
+    checkouts can't deadlock), checks every line against them, and only then
+    writes the potion debits, gold credit and hourly sales rollup, moves the
+    lines to cart_item_history and closes the cart, all in one statement.
+    Raises 404 or 409 if the cart is missing or no longer open.
+    """
+    # Locked first, so the sweeper can't abandon it under the checkout.
+    state = (await connection.execute(LOCK_CART, {"cart_id": cart_id})).scalar()
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Cart not found"
+        )
+    if state != "open":
+        raise not_open()
+    return (
+        await connection.execute(
+            CHECKOUT,
+            {"cart_id": cart_id, "day": game_clock.day},
+        )
+    ).one()
+
+
 @router.post("/{cart_id}/checkout")
-def checkout(cart_id: int, cart_checkout: CartCheckout):
+async def checkout(cart_id: int, cart_checkout: CartCheckout):
     """Handles the checkout process for a specific cart."""
-    with db.engine.begin() as connection:
-        total_price = connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO potion_records (sku, qty_change)
-                SELECT sku, quantity * -1 FROM cart_items
-                 WHERE cart_id = :cart_id;
-                INSERT INTO gold_records (change_in_gold)
-                SELECT SUM(potion_index.price * cart_items.quantity)
-                  FROM potion_index JOIN cart_items
-                    ON potion_index.sku = cart_items.sku AND cart_id = :cart_id
-                RETURNING change_in_gold;
-                """
-            ),
-            {"cart_id": cart_id},
-        ).scalar_one()
-        total_potions_bought = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT SUM(cart_items.quantity) FROM cart_items
-                 WHERE cart_id = :cart_id
-                """
-            ),
-            {"cart_id": cart_id},
-        ).scalar_one()
+    async with db.async_engine.begin() as connection:
+        result = await checkout_cart(connection, cart_id)
+    if not result.in_stock:
+        logger.warning(
+            "Checkout rejected: insufficient stock", extra={"cart_id": cart_id}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Insufficient stock"
+        )
+    catalog.invalidate()
     checkout = {
-        "total_potions_bought": total_potions_bought,
-        "total_gold_paid": total_price,
+        "total_potions_bought": result.total_potions,
+        "total_gold_paid": result.total_gold,
     }
-    print(
-        f"[Log] Checked out (Cart ID {cart_id}) w/ payment method '{cart_checkout.payment}':",
-        checkout,
+    logger.info(
+        "Checked out",
+        extra={"cart_id": cart_id, "payment": cart_checkout.payment, **checkout},
     )
     return checkout
+
+
+class Purchase(BaseModel):
+    customer: Customer
+    items: list[CartLine]
+    payment: str
+
+
+@router.post("/purchase")
+async def purchase(order: Purchase):
+    """
+    Creates a cart, fills it and checks it out in a single call, for
+    customers that already know what they want. Nothing is kept if any item
+    is out of stock.
+    """
+    lines = {line.sku: line.quantity for line in order.items}
+    async with db.async_engine.begin() as connection:
+        cart_id = (
+            await connection.execute(
+                CREATE_CART,
+                {
+                    "name": order.customer.customer_name,
+                    "class": order.customer.character_class,
+                    "level": order.customer.level,
+                    "day": game_clock.day,
+                },
+            )
+        ).scalar_one()
+        await upsert_items(connection, cart_id, lines)
+        result = await checkout_cart(connection, cart_id)
+        if not result.in_stock:
+            # Leaving the block by raising rolls back the cart and its items.
+            logger.warning(
+                "Purchase rejected: insufficient stock",
+                extra={"customer": order.customer.dict(), "items": lines},
+            )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="Insufficient stock"
+            )
+    catalog.invalidate()
+    checkout = {
+        "cart_id": cart_id,
+        "total_potions_bought": result.total_potions,
+        "total_gold_paid": result.total_gold,
+    }
+    logger.info("Purchased", extra={"payment": order.payment, **checkout})
+    return checkout
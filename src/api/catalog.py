@@ -1,39 +1,110 @@
-import sqlalchemy
-from fastapi import APIRouter
+import hashlib
+import json
+import logging
+
+from fastapi import APIRouter, Request, Response
 from src import database as db
+from src import forecast, logs, planning, queries, refdata
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+# Channel the potion_balances trigger notifies on any stock change.
+CHANNEL = "catalog"
+
+# The computed catalog is kept until a write that can change it calls
+# invalidate() or the reference data is reloaded. Clients revalidate with
+# If-None-Match against its ETag.
+cache = {
+    "rows": None,
+    "etag": None,
+    "generation": 0,
+    "refdata_version": None,
+    "hits": 0,
+    "misses": 0,
+}
+
+
+IN_STOCK = queries.register(
+    "catalog.in_stock",
+    """
+    SELECT sku, quantity
+      FROM potion_balances
+     WHERE quantity > 0
+    """,
+)
+
+
+def invalidate(payload=None):
+    """
+    Drops the cached catalog; the next request recomputes it. Also the
+    handler for CHANNEL, so another process's writes drop it here too.
+    """
+    cache["rows"] = None
+    cache["etag"] = None
+    cache["generation"] += 1
+
+
+def cache_stats():
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "cached": cache["rows"] is not None,
+    }
+
+
+async def compute_catalog():
+    """
+    The six in-stock potions most in demand this tick, then most stocked.
+    Only the balances are queried; prices and types come from the reference
+    data and demand from the forecast.
+    """
+    async with db.async_engine.begin() as connection:
+        stock = (await connection.execute(IN_STOCK)).all()
+    stock = {row.sku: row.quantity for row in stock if row.sku in refdata.potions}
+    listed = planning.rank_catalog(stock, forecast.favorability())
+    return [
+        {
+            "sku": sku,
+            "name": " ".join(word.capitalize() for word in sku.split("_")) + " Potion",
+            "quantity": stock[sku],
+            "price": refdata.potions[sku].price,
+            "potion_type": refdata.potions[sku].potion_type,
+        }
+        for sku in listed
+    ]
+
+
+async def cached_catalog():
+    """Returns the catalog rows and their ETag, computing them on a miss."""
+    if cache["rows"] is not None and cache["refdata_version"] == refdata.version:
+        cache["hits"] += 1
+        return cache["rows"], cache["etag"]
+    cache["misses"] += 1
+    generation = cache["generation"]
+    refdata_version = refdata.version
+    catalog = await compute_catalog()
+    etag = '"' + hashlib.sha1(json.dumps(catalog).encode()).hexdigest() + '"'
+    # Only keep the result if nothing invalidated the cache mid-query.
+    if generation == cache["generation"]:
+        cache["rows"] = catalog
+        cache["etag"] = etag
+        cache["refdata_version"] = refdata_version
+    return catalog, etag
+
 
 @router.get("/catalog/", tags=["catalog"])
-def get_catalog():
+async def get_catalog(request: Request, response: Response):
     """
-    Retrieves the catalog of items. Each unique item combination should have only a single price. You can have at most 6 potion SKUs offered in your catalog at one time.
+    Retrieves the catalog of items. Each unique item combination should have
+    only a single price. You can have at most 6 potion SKUs offered in your
+    catalog at one time.
     """
-    with db.engine.begin() as connection:
-        catalog = connection.execute(
-            sqlalchemy.text(
-                """
-                      WITH st AS (
-                           SELECT potion_sku, favorability
-                             FROM potion_strategy
-                            WHERE potion_strategy.day_of_week::text = TO_CHAR(NOW(), 'fmDay')
-                          )
-                    SELECT potion_index.sku AS sku,
-                           CONCAT(REPLACE(INITCAP(potion_index.sku), '_', ' '), ' Potion') AS name,
-                           COALESCE(SUM(qty_change), 0) AS quantity,
-                           price,
-                           ARRAY[red_pct, green_pct, blue_pct, dark_pct] AS potion_type
-                      FROM potion_index
-                      JOIN potion_records ON potion_index.sku = potion_records.sku
-                 LEFT JOIN st ON potion_index.sku = st.potion_sku
-                     GROUP BY potion_index.sku, st.favorability
-                    HAVING COALESCE(SUM(qty_change), 0) > 0
-                     ORDER BY COALESCE(st.favorability, 1.0) DESC,
-                              quantity DESC
-                     LIMIT 6
-                    """
-            )
-        ).mappings().all()
-    print("[Log] Available Catalog:", catalog)
+    catalog, etag = await cached_catalog()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    logger.debug("Available catalog", extra={"catalog": logs.summarize(catalog)})
     return catalog
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, Request
+import json
+import logging
+
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from src.api import auth
+from src import database as db
+from src import forecast, game_clock
+from src.api import auth, catalog
 
 router = APIRouter(
     prefix="/info",
@@ -8,14 +13,47 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = logging.getLogger(__name__)
+
+
 class Timestamp(BaseModel):
     day: str
     hour: int
 
+
 @router.post("/current_time")
-def post_time(timestamp: Timestamp):
+async def post_time(timestamp: Timestamp):
     """
     Share current time.
     """
-    print(f"[Log] It is {timestamp.hour} o'clock on {timestamp.day}.")
+    logger.info("Current time", extra={"day": timestamp.day, "hour": timestamp.hour})
+    async with db.async_engine.begin() as connection:
+        await game_clock.record(connection, timestamp.day, timestamp.hour)
+    advance(timestamp.day, timestamp.hour)
     return "OK"
+
+
+def on_tick(payload):
+    """Applies a tick another process was told about."""
+    tick = json.loads(payload)
+    advance(tick["day"], tick["hour"])
+
+
+async def catch_up():
+    """Applies the latest recorded tick, which another process may have set."""
+    async with db.async_engine.begin() as connection:
+        tick = await game_clock.latest(connection)
+    if tick is not None:
+        advance(tick.day, tick.hour)
+
+
+def advance(day: str, hour: int):
+    """
+    Moves the clock to a tick. A new tick refits the demand forecast, and
+    the catalog, which is ordered by it, is dropped once the refit is in.
+    """
+    new_tick = (day, hour) != (game_clock.day, game_clock.hour)
+    if game_clock.update(day, hour):
+        catalog.invalidate()
+    if new_tick:
+        forecast.ticked().add_done_callback(lambda task: catalog.invalidate())
@@ -1,8 +1,10 @@
-import sqlalchemy
+import logging
+
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 
 from src import database as db
+from src import game_clock, planning, queries, receipts, refdata, reservations
 from src.api import auth
 
 router = APIRouter(
@@ -11,65 +13,78 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = logging.getLogger(__name__)
+
+
+AUDIT = queries.register(
+    "inventory.audit",
+    """
+    SELECT (SELECT COALESCE(SUM(quantity), 0) FROM potion_balances) AS total_potions,
+           (SELECT red + green + blue + dark FROM ml_balance) AS total_ml,
+           (SELECT gold FROM gold_balance) AS gold
+    """,
+)
+GOLD = queries.register("inventory.gold", "SELECT gold FROM gold_balance")
+CAPACITY = queries.register(
+    "inventory.capacity", "SELECT potion_units, ml_units FROM capacity_balance"
+)
+DELIVER = queries.register(
+    "inventory.deliver",
+    """
+    WITH capacity AS (
+        INSERT INTO capacity_records (potion_units, ml_units)
+             VALUES (:new_pot_units, :new_ml_units)
+    )
+    INSERT INTO gold_records (change_in_gold, day_of_week)
+         VALUES (:new_units * -1000, CAST(:day AS text))
+    """,
+)
+
 
 @router.get("/audit")
-def get_inventory():
+async def get_inventory():
     """
     Return a summary of your current number of potions, ml, and gold.
     """
-    with db.engine.begin() as connection:
-        inventory = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT (SELECT COALESCE(SUM(qty_change), 0) FROM potion_records) AS total_potions,
-                       (SELECT COALESCE(SUM(red + green + blue + dark), 0) FROM ml_records) AS total_ml,
-                       (SELECT SUM(change_in_gold) FROM gold_records) AS gold
-                """
-            )
-        ).one()
+    async with db.async_engine.begin() as connection:
+        inventory = (await connection.execute(AUDIT)).one()
         audit = {
             "number_of_potions": inventory.total_potions,
             "ml_in_barrels": inventory.total_ml,
             "gold": inventory.gold,
         }
-        print("[Log] Audit:", audit)
+        logger.info("Audit", extra=audit)
     return audit
 
 
 # Gets called once a day
 @router.post("/plan")
-def get_capacity_plan():
+async def get_capacity_plan():
     """
-    Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion. Each additional
-    capacity unit costs 1000 gold.
+    Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion.
+    Each additional capacity unit costs 1000 gold.
     """
-    with db.engine.begin() as connection:
-        gold = connection.execute(
-            sqlalchemy.text("SELECT SUM(change_in_gold) FROM gold_records")
-        ).scalar_one()
-        qty_limits = connection.execute(
-            sqlalchemy.text(
-                """
-                WITH limits AS (
-                    SELECT ml_cap_unit_limit AS ml,
-                           pt_cap_unit_limit AS pt
-                      FROM magic_numbers
-                     LIMIT 1
-                )
-                SELECT GREATEST(limits.ml - SUM(ml_units), 0) AS ml_buy_qty,
-                       GREATEST(limits.pt - SUM(potion_units), 0) AS pt_buy_qty
-                FROM capacity_records, limits
-                GROUP BY limits.ml, limits.pt
-                """
-            )
-        ).one()
-        plan = {}
-        pt_qty = int(min(qty_limits.pt_buy_qty, gold // 1000))
-        gold -= pt_qty * 1000
-        plan["potion_capacity"] = pt_qty
-        ml_qty = int(min(qty_limits.ml_buy_qty, gold // 1000))
-        plan["ml_capacity"] = ml_qty
-    print("[Log] Capacity purchase plan:", plan)
+    # Held until commit, so concurrent plans see this one's reservation.
+    async with db.async_engine.begin() as connection:
+        await reservations.lock(connection)
+        gold = (await connection.execute(GOLD)).scalar_one()
+        capacity = (await connection.execute(CAPACITY)).one()
+        gold -= (await reservations.outstanding(connection)).gold
+        plan = planning.capacity_plan(
+            gold,
+            capacity.potion_units,
+            capacity.ml_units,
+            refdata.magic.pt_cap_unit_limit,
+            refdata.magic.ml_cap_unit_limit,
+        )
+        await reservations.reserve(
+            connection,
+            "capacity",
+            reservations.plan_key(plan.items()),
+            gold=(plan["potion_capacity"] + plan["ml_capacity"])
+            * planning.CAPACITY_UNIT_PRICE,
+        )
+    logger.info("Capacity purchase plan", extra=plan)
     return plan
 
 
@@ -80,25 +95,35 @@ class CapacityPurchase(BaseModel):
 
 # Gets called once a day
 @router.post("/deliver/{order_id}")
-def deliver_capacity_plan(capacity_purchase: CapacityPurchase, order_id: int):
+async def deliver_capacity_plan(capacity_purchase: CapacityPurchase, order_id: int):
     """
-    Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion. Each additional
-    capacity unit costs 1000 gold.
+    Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion.
+    Each additional capacity unit costs 1000 gold.
     """
-    print(f"[Log] Capacity delivered (ID {order_id}):", capacity_purchase)
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO capacity_records (potion_units, ml_units)
-                     VALUES (:new_pot_units, :new_ml_units);
-                INSERT INTO gold_records (change_in_gold)
-                     VALUES ((:new_pot_units + :new_ml_units) * -1000)
-                """
-            ),
+    logger.info(
+        "Capacity delivered", extra={"order_id": order_id, **capacity_purchase.dict()}
+    )
+    replay = receipts.lookup("capacity", order_id)
+    if replay is not None:
+        return replay
+    async with db.async_engine.begin() as connection:
+        replay = await receipts.claim(connection, "capacity", order_id, "OK")
+        if replay is not None:
+            return replay
+        await reservations.release(
+            connection,
+            "capacity",
+            reservations.plan_key(capacity_purchase.dict().items()),
+        )
+        await connection.execute(
+            DELIVER,
             {
                 "new_pot_units": capacity_purchase.potion_capacity,
                 "new_ml_units": capacity_purchase.ml_capacity,
+                "new_units": capacity_purchase.potion_capacity
+                + capacity_purchase.ml_capacity,
+                "day": game_clock.day,
             },
         )
+    receipts.remember("capacity", order_id, "OK")
     return "OK"
@@ -1,12 +1,25 @@
 from fastapi import FastAPI, exceptions
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
+from src import database as db
+from src import (
+    forecast,
+    game_clock,
+    listener,
+    logs,
+    metrics,
+    partitions,
+    refdata,
+    sweeper,
+    visits,
+)
 from src.api import carts, catalog, bottler, barrels, admin, info, inventory
-import json
 import logging
-import sys
 from starlette.middleware.cors import CORSMiddleware
 
+logs.setup()
+logger = logging.getLogger(__name__)
+
 description = """
 Central Coast Cauldrons is the premier ecommerce site for all your alchemical desires.
 """
@@ -32,6 +45,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(inventory.router)
 app.include_router(carts.router)
 app.include_router(catalog.router)
@@ -40,17 +55,52 @@ app.include_router(barrels.router)
 app.include_router(admin.router)
 app.include_router(info.router)
 
+
+@app.on_event("startup")
+async def startup():
+    # Subscribed before loading, so a change made meanwhile isn't missed.
+    listener.subscribe(refdata.CHANNEL, refdata.notified)
+    listener.subscribe(game_clock.CHANNEL, info.on_tick)
+    listener.subscribe(catalog.CHANNEL, catalog.invalidate)
+    listener.subscribe(admin.RESET_CHANNEL, admin.forget_cached)
+    listener.on_reconnect(resync)
+    await listener.start()
+    async with db.async_engine.begin() as connection:
+        await game_clock.load(connection)
+    await refdata.reload()
+    await forecast.refresh()
+    visits.start()
+    sweeper.start()
+    partitions.start()
+
+
+async def resync():
+    """Catches up on whatever was notified while the LISTEN connection was down."""
+    await info.catch_up()
+    await refdata.reload()
+    admin.forget_cached()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await partitions.stop()
+    await sweeper.stop()
+    await visits.stop()
+    await listener.stop()
+
+
 @app.exception_handler(exceptions.RequestValidationError)
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request, exc):
-    logging.error(f"The client sent invalid data!: {exc}")
-    exc_json = json.loads(exc.json())
+    errors = exc.errors()
+    logger.error("The client sent invalid data", extra={"errors": errors})
     response = {"message": [], "data": None}
-    for error in exc_json:
-        response['message'].append(f"{error['loc']}: {error['msg']}")
+    for error in errors:
+        response["message"].append(f"{list(error['loc'])}: {error['msg']}")
 
     return JSONResponse(response, status_code=422)
 
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Central Coast Cauldrons."}
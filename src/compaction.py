@@ -0,0 +1,165 @@
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+# Every total the planners, audit and balances are built from. Compaction must
+# leave all of these unchanged. A sku whose rows net to zero gets no snapshot
+# row, so only skus with stock are compared.
+TOTALS = """
+    SELECT (SELECT COALESCE(json_object_agg(sku, quantity ORDER BY sku), '{}')
+              FROM (SELECT sku, SUM(qty_change) AS quantity
+                      FROM potion_records
+                     GROUP BY sku
+                    HAVING SUM(qty_change) <> 0) AS potions) AS potions,
+           (SELECT ARRAY[COALESCE(SUM(red), 0), COALESCE(SUM(green), 0),
+                         COALESCE(SUM(blue), 0), COALESCE(SUM(dark), 0)]
+              FROM ml_records) AS ml,
+           (SELECT COALESCE(SUM(change_in_gold), 0) FROM gold_records) AS gold,
+           (SELECT ARRAY[COALESCE(SUM(potion_units), 0), COALESCE(SUM(ml_units), 0)]
+              FROM capacity_records) AS capacity
+"""
+
+# Each statement removes the rows older than the watermark, archives the ones
+# that are not themselves earlier snapshots, and writes back a single snapshot
+# row (one per sku for potions) carrying their net total.
+FOLDS = {
+    "potion_records": """
+        WITH folded AS (
+            DELETE FROM potion_records
+             WHERE timestamp < :watermark
+         RETURNING *
+        ),
+        archived AS (
+            INSERT INTO potion_records_archive
+            SELECT * FROM folded WHERE NOT snapshot
+        ),
+        snapshots AS (
+            INSERT INTO potion_records (sku, qty_change, timestamp, snapshot)
+            SELECT sku, SUM(qty_change), MAX(timestamp), TRUE
+              FROM folded
+             GROUP BY sku
+            HAVING SUM(qty_change) <> 0
+        )
+        SELECT COUNT(*) FROM folded
+    """,
+    "ml_records": """
+        WITH folded AS (
+            DELETE FROM ml_records
+             WHERE timestamp < :watermark
+         RETURNING *
+        ),
+        archived AS (
+            INSERT INTO ml_records_archive
+            SELECT * FROM folded WHERE NOT snapshot
+        ),
+        snapshots AS (
+            INSERT INTO ml_records (red, green, blue, dark, timestamp, snapshot)
+            SELECT SUM(red), SUM(green), SUM(blue), SUM(dark), MAX(timestamp), TRUE
+              FROM folded
+            HAVING COUNT(*) > 0
+        )
+        SELECT COUNT(*) FROM folded
+    """,
+    "gold_records": """
+        WITH folded AS (
+            DELETE FROM gold_records
+             WHERE timestamp < :watermark
+         RETURNING *
+        ),
+        archived AS (
+            INSERT INTO gold_records_archive
+            SELECT * FROM folded WHERE NOT snapshot
+        ),
+        snapshots AS (
+            INSERT INTO gold_records (change_in_gold, timestamp, snapshot)
+            SELECT SUM(change_in_gold), MAX(timestamp), TRUE
+              FROM folded
+            HAVING COUNT(*) > 0
+        )
+        SELECT COUNT(*) FROM folded
+    """,
+    "capacity_records": """
+        WITH folded AS (
+            DELETE FROM capacity_records
+             WHERE timestamp < :watermark
+         RETURNING *
+        ),
+        archived AS (
+            INSERT INTO capacity_records_archive
+            SELECT * FROM folded WHERE NOT snapshot
+        ),
+        snapshots AS (
+            INSERT INTO capacity_records (potion_units, ml_units, timestamp, snapshot)
+            SELECT SUM(potion_units), SUM(ml_units), MAX(timestamp), TRUE
+              FROM folded
+            HAVING COUNT(*) > 0
+        )
+        SELECT COUNT(*) FROM folded
+    """,
+}
+
+
+def totals(connection):
+    """
+    The TOTALS row. Each is a full scan of a ledger, so it is left to the
+    tests and benchmarks rather than checked on every compaction.
+    """
+    return tuple(connection.execute(sqlalchemy.text(TOTALS)).one())
+
+
+def compact(connection, watermark):
+    """
+    Folds every ledger row older than watermark into snapshot rows, moving
+    the originals to the *_records_archive tables. Returns the number of
+    rows folded per ledger.
+    """
+    # Ledger writes wait until the fold commits; reads carry on.
+    connection.execute(
+        sqlalchemy.text(
+            """
+            LOCK TABLE potion_records, ml_records, gold_records, capacity_records
+               IN SHARE ROW EXCLUSIVE MODE
+            """
+        )
+    )
+    # The totals are unchanged, so the running balances must not be touched.
+    connection.execute(sqlalchemy.text("SET LOCAL potionshop.compacting = 'on'"))
+    folded = {
+        ledger: connection.execute(
+            sqlalchemy.text(statement), {"watermark": watermark}
+        ).scalar_one()
+        for ledger, statement in FOLDS.items()
+    }
+    connection.execute(sqlalchemy.text("SET LOCAL potionshop.compacting = 'off'"))
+    return folded
+
+
+def run(keep_days):
+    """Compacts every ledger row older than keep_days days."""
+    watermark = datetime.now(timezone.utc) - timedelta(days=keep_days)
+    with db.engine.begin() as connection:
+        folded = compact(connection, watermark)
+    logger.info(
+        "Ledgers compacted",
+        extra={"watermark": watermark.isoformat(), "folded": folded},
+    )
+    return {"watermark": watermark.isoformat(), "folded": folded}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fold old ledger rows into snapshot rows."
+    )
+    parser.add_argument(
+        "--keep-days",
+        type=float,
+        default=7,
+        help="ledger rows newer than this many days are left as they are",
+    )
+    print(run(parser.parse_args().keep_days))
@@ -1,6 +1,11 @@
 import os
 import dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from src import metrics
 
 
 def database_connection_url():
@@ -9,4 +14,50 @@ def database_connection_url():
     return os.environ.get("POSTGRES_URI")
 
 
-engine = create_engine(database_connection_url(), pool_pre_ping=True)
+def pool_options():
+    """Connection pool settings shared by both engines, read from the environment."""
+    dotenv.load_dotenv()
+
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def create_async_database_engine():
+    """
+    Builds the asyncpg engine from the same POSTGRES_URI as the sync engine.
+    asyncpg takes ssl as a connect argument rather than libpq's sslmode.
+    Each connection keeps up to DB_PREPARED_STATEMENT_CACHE_SIZE statements
+    prepared, so the registered queries are parsed and planned once per
+    connection rather than on every call.
+    """
+    url = make_url(database_connection_url())
+    sslmode = url.query.get("sslmode")
+    url = (
+        url.set(drivername="postgresql+asyncpg")
+        .difference_update_query(["sslmode"])
+        .update_query_dict(
+            {
+                "prepared_statement_cache_size": os.environ.get(
+                    "DB_PREPARED_STATEMENT_CACHE_SIZE", "256"
+                )
+            }
+        )
+    )
+    connect_args = {"ssl": sslmode} if sslmode and sslmode != "disable" else {}
+    return create_async_engine(
+        url,
+        connect_args=connect_args,
+        poolclass=metrics.timed_pool(AsyncAdaptedQueuePool),
+        **pool_options(),
+    )
+
+
+engine = create_engine(
+    database_connection_url(), poolclass=metrics.timed_pool(QueuePool), **pool_options()
+)
+async_engine = create_async_database_engine()
+metrics.instrument(engine)
+metrics.instrument(async_engine.sync_engine)
@@ -0,0 +1,159 @@
+"""
+Full dumps of the sales history and ledgers, streamed as NDJSON or CSV.
+
+Rows are read through a server-side cursor EXPORT_BATCH at a time and each
+batch is encoded and handed on before the next is fetched, so memory stays
+the same whatever the table's size. Time-range and sku filters are part of
+the SQL, with one prebuilt statement per combination so each one gets its
+own plan and the ledgers' monthly partitions are pruned. Rows come out in
+storage order, not sorted.
+"""
+import csv
+import io
+import itertools
+import json
+import os
+from datetime import datetime
+from enum import Enum
+
+import dotenv
+
+from src import database as db
+from src import queries
+
+dotenv.load_dotenv()
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", 10_000))
+
+
+class export_tables(str, Enum):
+    cart_items = "cart_items"
+    potion_records = "potion_records"
+    gold_records = "gold_records"
+    customer_visits = "customer_visits"
+
+
+class export_formats(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+# What each export selects, the timestamp its time range filters on, and the
+# sku column, for the tables that have one. cart_items covers every line
+# item, open or checked out, with the customer who ordered it.
+SOURCES = {
+    export_tables.cart_items: {
+        "select": """
+            SELECT cart_lines.item_id, cart_lines.cart_id, carts.customer_name,
+                   carts.customer_class, cart_lines.sku, cart_lines.quantity,
+                   cart_lines.timestamp
+              FROM cart_lines
+              JOIN carts ON carts.id = cart_lines.cart_id
+        """,
+        "timestamp": "cart_lines.timestamp",
+        "sku": "cart_lines.sku",
+    },
+    export_tables.potion_records: {
+        "select": """
+            SELECT id, sku, qty_change, timestamp, snapshot FROM potion_records
+        """,
+        "timestamp": "timestamp",
+        "sku": "sku",
+    },
+    export_tables.gold_records: {
+        "select": """
+            SELECT id, change_in_gold, timestamp, snapshot FROM gold_records
+        """,
+        "timestamp": "timestamp",
+        "sku": None,
+    },
+    export_tables.customer_visits: {
+        "select": """
+            SELECT id, name, class, level, day_of_week, timestamp FROM customer_visits
+        """,
+        "timestamp": "timestamp",
+        "sku": None,
+    },
+}
+
+MEDIA_TYPES = {
+    export_formats.ndjson: "application/x-ndjson",
+    export_formats.csv: "text/csv",
+}
+
+
+def export_statement(table: export_tables, since: bool, until: bool, sku: bool):
+    source = SOURCES[table]
+    filters = []
+    if since:
+        filters.append(f"{source['timestamp']} >= :since")
+    if until:
+        filters.append(f"{source['timestamp']} < :until")
+    if sku:
+        filters.append(f"{source['sku']} = :sku")
+    name = ".".join(
+        ["export", table.value] + ["since"] * since + ["until"] * until + ["sku"] * sku
+    )
+    where_str = " WHERE " + " AND ".join(filters) if filters else ""
+    return queries.register(name, source["select"] + where_str)
+
+
+statements = {
+    (table, since, until, sku): export_statement(table, since, until, sku)
+    for table in export_tables
+    for since, until, sku in itertools.product((False, True), repeat=3)
+    if SOURCES[table]["sku"] or not sku
+}
+
+
+def has_sku(table: export_tables):
+    return SOURCES[table]["sku"] is not None
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson(columns, rows):
+    return "".join(
+        json.dumps(dict(zip(columns, map(_value, row)))) + "\n" for row in rows
+    )
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def stream(
+    table: export_tables,
+    format: export_formats,
+    since: datetime = None,
+    until: datetime = None,
+    sku: str = None,
+):
+    """
+    Yields table's rows from since (inclusive) to until (exclusive), for sku
+    if given, encoded as format a batch at a time; CSV starts with a header.
+    """
+    statement = statements[
+        (table, since is not None, until is not None, sku is not None)
+    ]
+    params = {
+        key: value
+        for key, value in {"since": since, "until": until, "sku": sku}.items()
+        if value is not None
+    }
+    async with db.async_engine.connect() as connection:
+        # asyncpg only keeps a server-side cursor open inside a transaction.
+        async with connection.begin(), connection.stream(
+            statement, params, execution_options={"yield_per": EXPORT_BATCH}
+        ) as result:
+            columns = list(result.keys())
+            if format == export_formats.csv:
+                yield _csv([columns])
+            async for rows in result.partitions():
+                if format == export_formats.csv:
+                    yield _csv(rows)
+                else:
+                    yield _ndjson(columns, rows)
@@ -0,0 +1,347 @@
+"""
+Demand forecast per sku, game weekday, two-hour slot and customer class.
+
+The model is a set of decayed counts: potions put in carts by each class at
+each (weekday, slot), the visits of each class there, and how many ticks of
+each (weekday, slot) have been seen. Rates are their ratios, so fitting is
+only adding the new rows in with np.add.at, and each tick refits with just
+the rows recorded since the last one. Rows are placed in game time through
+game_ticks.
+
+What a refit has read is tracked by row id rather than timestamp: ids are
+assigned as rows are written, so visits a delayed flush writes long after
+their timestamp are still read (see Watermark).
+
+The catalog and the bottler weigh potions with favorability(), which is the
+forecast in place of the static potion_strategy once the model has seen
+MIN_VISITS visits.
+"""
+import asyncio
+import logging
+import os
+import dotenv
+import numpy as np
+import sqlalchemy
+
+from src import database as db
+from src import game_clock, refdata
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+# Counts lose half their weight over this many days.
+HALF_LIFE_DAYS = float(os.environ.get("FORECAST_HALF_LIFE_DAYS", 14))
+# The model is used once it has seen this many visits.
+MIN_VISITS = int(os.environ.get("FORECAST_MIN_VISITS", 100))
+# Added to every sku's forecast before weighting, so unseen potions keep a
+# small positive weight.
+SMOOTHING = 0.1
+
+SLOTS = 12
+DAY_SECONDS = 24 * 60 * 60
+
+
+class Watermark:
+    """
+    The rows of one table a refit has added, by id. Each refit reads the ids
+    above `after`. A transaction may commit after one that took higher ids,
+    so `after` only moves up to the highest id the previous refit read: ids
+    above it are read once more, and the ones already added are skipped.
+    """
+
+    def __init__(self):
+        self.after = 0
+        self.latest = 0
+        self.added = set()
+
+    def advance(self, rows):
+        """The rows not added yet, out of rows read with ids above after."""
+        fresh = [row for row in rows if row.id not in self.added]
+        self.after = self.latest
+        self.latest = max([self.latest] + [row.id for row in rows])
+        self.added = {row.id for row in rows if row.id > self.after}
+        return fresh
+
+
+class DemandModel:
+    def __init__(self):
+        self.skus = {}
+        self.classes = {}
+        # [sku, weekday, slot, class] potions put in carts.
+        self.sales = np.zeros((0, len(game_clock.DAYS), SLOTS, 0))
+        # [weekday, slot, class] visits.
+        self.visits = np.zeros((len(game_clock.DAYS), SLOTS, 0))
+        # [weekday, slot] ticks seen.
+        self.ticks = np.zeros((len(game_clock.DAYS), SLOTS))
+        # Epoch seconds of the last decay.
+        self.fitted_until = None
+        # What refits have read of game_ticks, customer_visits and cart_lines.
+        self.watermarks = {
+            "ticks": Watermark(),
+            "visits": Watermark(),
+            "sales": Watermark(),
+        }
+        # Game ticks as parallel arrays: epoch seconds, weekday index, slot.
+        self.tick_times = np.zeros(0)
+        self.tick_days = np.zeros(0, dtype=np.int64)
+        self.tick_slots = np.zeros(0, dtype=np.int64)
+
+    def index(self, names, mapping, axis):
+        """Indexes of names in mapping, growing the count arrays for new ones."""
+        new = [name for name in dict.fromkeys(names) if name not in mapping]
+        for name in new:
+            mapping[name] = len(mapping)
+        if new and axis == "sku":
+            self.sales = np.pad(self.sales, ((0, len(new)), (0, 0), (0, 0), (0, 0)))
+        elif new:
+            self.sales = np.pad(self.sales, ((0, 0), (0, 0), (0, 0), (0, len(new))))
+            self.visits = np.pad(self.visits, ((0, 0), (0, 0), (0, len(new))))
+        return np.array([mapping[name] for name in names], dtype=np.int64)
+
+    def add_ticks(self, times, days, hours):
+        """Records game ticks (epoch seconds, weekdays, hours), oldest first."""
+        day_index = np.array(
+            [game_clock.DAYS.index(d) if d in game_clock.DAYS else -1 for d in days],
+            dtype=np.int64,
+        )
+        known = day_index >= 0
+        slots = np.asarray(hours, dtype=np.int64) // 2 % SLOTS
+        np.add.at(self.ticks, (day_index[known], slots[known]), 1)
+        self.tick_times = np.append(
+            self.tick_times, np.asarray(times, dtype=np.float64)
+        )
+        self.tick_days = np.append(self.tick_days, day_index)
+        self.tick_slots = np.append(self.tick_slots, slots)
+
+    def place(self, times):
+        """(weekday, slot, mask) of the game tick each epoch time falls in."""
+        latest = np.searchsorted(self.tick_times, np.asarray(times), side="right") - 1
+        if not self.tick_times.size:
+            nowhere = np.zeros(len(latest), dtype=np.int64)
+            return nowhere, nowhere, np.zeros(len(latest), dtype=bool)
+        valid = latest >= 0
+        latest = np.maximum(latest, 0)
+        days = self.tick_days[latest]
+        return days, self.tick_slots[latest], valid & (days >= 0)
+
+    def decay(self, until):
+        """Ages every count to epoch time until."""
+        if self.fitted_until is not None and until > self.fitted_until:
+            days = (until - self.fitted_until) / DAY_SECONDS
+            factor = 0.5 ** (days / HALF_LIFE_DAYS)
+            self.sales *= factor
+            self.visits *= factor
+            self.ticks *= factor
+        self.fitted_until = until
+
+    def add_sales(self, times, skus, classes, quantities):
+        days, slots, valid = self.place(times)
+        sku_index = self.index(list(skus), self.skus, "sku")
+        class_index = self.index(list(classes), self.classes, "class")
+        np.add.at(
+            self.sales,
+            (sku_index[valid], days[valid], slots[valid], class_index[valid]),
+            np.asarray(quantities, dtype=np.float64)[valid],
+        )
+
+    def add_visits(self, times, classes, counts):
+        days, slots, valid = self.place(times)
+        class_index = self.index(list(classes), self.classes, "class")
+        np.add.at(
+            self.visits,
+            (days[valid], slots[valid], class_index[valid]),
+            np.asarray(counts, dtype=np.float64)[valid],
+        )
+
+    def demand(self, day, hour, visitors=None):
+        """
+        Expected potions per sku (in self.skus order) wanted in the tick at
+        day and hour. With visitors ({class: count}) it is each class's
+        potions per visit times its visitors; otherwise the slot's average
+        per tick.
+        """
+        if day not in game_clock.DAYS:
+            return np.zeros(len(self.skus))
+        d = game_clock.DAYS.index(day)
+        s = hour // 2 % SLOTS
+        sales = self.sales[:, d, s, :]
+        if visitors:
+            per_visit = sales / np.maximum(self.visits[d, s, :], 1e-9)
+            arriving = np.zeros(len(self.classes))
+            for name, count in visitors.items():
+                if name in self.classes:
+                    arriving[self.classes[name]] = count
+            return per_visit @ arriving
+        return sales.sum(axis=1) / max(self.ticks[d, s], 1e-9)
+
+    def weights(self, day, hour, ticks=1, visitors=None, skus=None):
+        """
+        {sku: weight} for the next ticks ticks from day and hour, scaled so
+        the average potion weighs 1.0, as potion_strategy favorability does.
+        visitors only applies to the first of them. skus defaults to every
+        sku seen; ones never sold get the least weight.
+        """
+        total = np.zeros(len(self.skus))
+        d = game_clock.DAYS.index(day) if day in game_clock.DAYS else 0
+        for tick in range(ticks):
+            slot = hour // 2 + tick
+            total += self.demand(
+                game_clock.DAYS[(d + slot // SLOTS) % len(game_clock.DAYS)],
+                slot % SLOTS * 2,
+                visitors if tick == 0 else None,
+            )
+        if skus is None:
+            skus = list(self.skus)
+        total = np.array(
+            [total[self.skus[sku]] if sku in self.skus else 0.0 for sku in skus]
+        )
+        total += SMOOTHING
+        total /= total.mean() if total.size else 1.0
+        return dict(zip(skus, total.tolist()))
+
+    def ready(self):
+        return self.visits.sum() >= MIN_VISITS
+
+
+model = DemandModel()
+# {class: count} of the customers who visited on the current tick.
+visitors = {}
+# Refits run one at a time; a tick arriving mid-refit waits for it.
+_fitting = None
+
+
+def observe_visitors(customers):
+    """
+    Remembers the classes of the current tick's visitors. Only the worker
+    the visits were posted to knows them; the others use slot averages.
+    """
+    global visitors
+    counts = {}
+    for customer_class in customers:
+        counts[customer_class] = counts.get(customer_class, 0) + 1
+    visitors = counts
+
+
+def favorability(ticks=1):
+    """
+    {sku: weight} of expected demand over the next ticks ticks, or the
+    potion_strategy favorability of the day until the model is ready.
+    """
+    if game_clock.strategy_day() is None or not model.ready():
+        return refdata.favorability(game_clock.strategy_day())
+    return model.weights(
+        game_clock.day, game_clock.hour or 0, ticks, visitors, list(refdata.potions)
+    )
+
+
+async def refit(connection):
+    """Adds every tick, visit and cart line recorded since the last fit."""
+    global _fitting
+    if _fitting is None:
+        _fitting = asyncio.Lock()
+    async with _fitting:
+        await _refit(connection)
+
+
+async def _refit(connection):
+    until = (await connection.execute(sqlalchemy.text("SELECT now()"))).scalar_one()
+    watermarks = model.watermarks
+    ticks = watermarks["ticks"].advance(
+        (
+            await connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT id, extract(epoch FROM timestamp) AS time, day, hour
+                      FROM game_ticks
+                     WHERE id > :after
+                  ORDER BY timestamp
+                    """
+                ),
+                {"after": watermarks["ticks"].after},
+            )
+        ).all()
+    )
+    visit_rows = watermarks["visits"].advance(
+        (
+            await connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT id, extract(epoch FROM timestamp) AS time,
+                           class AS customer_class
+                      FROM customer_visits
+                     WHERE id > :after
+                    """
+                ),
+                {"after": watermarks["visits"].after},
+            )
+        ).all()
+    )
+    sales = watermarks["sales"].advance(
+        (
+            await connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT cart_lines.item_id AS id,
+                           extract(epoch FROM cart_lines.timestamp) AS time,
+                           cart_lines.sku, carts.customer_class, cart_lines.quantity
+                      FROM cart_lines
+                      JOIN carts ON carts.id = cart_lines.cart_id
+                     WHERE cart_lines.item_id > :after
+                    """
+                ),
+                {"after": watermarks["sales"].after},
+            )
+        ).all()
+    )
+    model.decay(until.timestamp())
+    if ticks:
+        model.add_ticks(
+            [float(row.time) for row in ticks],
+            [row.day for row in ticks],
+            [row.hour for row in ticks],
+        )
+    if visit_rows:
+        model.add_visits(
+            [float(row.time) for row in visit_rows],
+            [row.customer_class for row in visit_rows],
+            [1] * len(visit_rows),
+        )
+    if sales:
+        model.add_sales(
+            [float(row.time) for row in sales],
+            [row.sku for row in sales],
+            [row.customer_class for row in sales],
+            [row.quantity for row in sales],
+        )
+    logger.info(
+        "Forecast refit",
+        extra={
+            "ticks": len(ticks),
+            "visits": len(visit_rows),
+            "cart_items": len(sales),
+            "skus": len(model.skus),
+            "classes": len(model.classes),
+        },
+    )
+
+
+async def refresh():
+    async with db.async_engine.begin() as connection:
+        await refit(connection)
+
+
+def ticked():
+    """
+    Forgets the last tick's visitors and schedules a refit, returning its
+    task so the caller can act on the new forecast once it is in.
+    """
+    global visitors
+    visitors = {}
+    task = asyncio.get_running_loop().create_task(refresh())
+    task.add_done_callback(_refitted)
+    return task
+
+
+def _refitted(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Forecast refit failed", exc_info=task.exception())
@@ -0,0 +1,80 @@
+"""
+The game's current day and hour, as last reported to /info/current_time.
+Queries bind these as parameters instead of deriving the day from NOW().
+"""
+import json
+
+import sqlalchemy
+
+# Weekdays of the Potion Exchange world, in order; the labels of the
+# potion_strategy day_of_week enum.
+DAYS = (
+    "Edgeday",
+    "Bloomday",
+    "Arcanaday",
+    "Hearthday",
+    "Crownday",
+    "Blesseday",
+    "Soulday",
+)
+
+# Notification channel each tick is announced on.
+CHANNEL = "game_clock"
+
+day = None
+hour = None
+
+
+def update(new_day: str, new_hour: int):
+    """Sets the current game time. Returns True if the day changed."""
+    global day, hour
+    rolled_over = new_day != day
+    day = new_day
+    hour = new_hour
+    return rolled_over
+
+
+def strategy_day():
+    """The current day as a potion_strategy label, or None if it isn't one."""
+    return day if day in DAYS else None
+
+
+async def record(connection, new_day: str, new_hour: int):
+    """
+    Persists a tick so the clock survives restarts, and announces it on
+    CHANNEL to every process once the caller's transaction commits.
+    """
+    await connection.execute(
+        sqlalchemy.text(
+            """
+            WITH tick AS (
+                INSERT INTO game_ticks (day, hour) VALUES (:day, :hour)
+            )
+            SELECT pg_notify(:channel, :payload)
+            """
+        ),
+        {
+            "day": new_day,
+            "hour": new_hour,
+            "channel": CHANNEL,
+            "payload": json.dumps({"day": new_day, "hour": new_hour}),
+        },
+    )
+
+
+async def latest(connection):
+    """The latest recorded tick's day and hour, or None before the first."""
+    return (
+        await connection.execute(
+            sqlalchemy.text(
+                "SELECT day, hour FROM game_ticks ORDER BY timestamp DESC LIMIT 1"
+            )
+        )
+    ).first()
+
+
+async def load(connection):
+    """Restores the clock from the latest recorded tick, if there is one."""
+    tick = await latest(connection)
+    if tick is not None:
+        update(tick.day, tick.hour)
@@ -0,0 +1,129 @@
+"""
+One LISTEN connection per process, shared by every channel the process
+subscribes to. Workers use it to hear about changes another worker made:
+reference data edits, new game ticks, potion stock changes and resets.
+
+The connection is its own, outside the worker's pool (serve.py leaves room
+for it). A background task watches it: when Postgres closes it, or it stops
+answering HEALTH_INTERVAL pings, the task reconnects with backoff, LISTENs
+again and runs the on_reconnect callbacks, since whatever was notified while
+it was down is lost.
+"""
+import asyncio
+import logging
+import os
+
+import asyncpg
+import dotenv
+from sqlalchemy.engine import make_url
+
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+# Seconds between pings of an otherwise idle connection, and how long one
+# may take before the connection counts as lost.
+HEALTH_INTERVAL = float(os.environ.get("LISTEN_HEALTH_INTERVAL", 30))
+HEALTH_TIMEOUT = 5.0
+# Reconnect backoff, doubling from the first delay up to the last.
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 30.0
+
+# channel -> callbacks taking the notification payload.
+_subscribers = {}
+# Coroutine functions awaited after every reconnect.
+_resyncs = []
+_connection = None
+_watcher = None
+
+
+def subscribe(channel: str, callback):
+    """Calls callback(payload) for every notification on channel; before start()."""
+    _subscribers.setdefault(channel, []).append(callback)
+
+
+def on_reconnect(callback):
+    """Awaits callback() after every reconnect, to catch up on missed changes."""
+    _resyncs.append(callback)
+
+
+def _dispatch(connection, pid, channel, payload):
+    for callback in _subscribers.get(channel, []):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Notification handler failed", extra={"channel": channel})
+
+
+def _dsn():
+    """POSTGRES_URI as the plain libpq URL asyncpg connects with."""
+    url = make_url(db.database_connection_url()).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+async def _connect():
+    connection = await asyncpg.connect(_dsn())
+    for channel in _subscribers:
+        await connection.add_listener(channel, _dispatch)
+    return connection
+
+
+async def start():
+    """Connects and LISTENs on every subscribed channel, then keeps it up."""
+    global _connection, _watcher
+    _connection = await _connect()
+    _watcher = asyncio.create_task(_listen_forever())
+
+
+async def stop():
+    global _connection, _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except asyncio.CancelledError:
+            pass
+        _watcher = None
+    if _connection is not None:
+        await _connection.close()
+        _connection = None
+
+
+async def _watch(connection):
+    """Returns once connection is closed or stops answering pings."""
+    lost = asyncio.Event()
+    connection.add_termination_listener(lambda _: lost.set())
+    while not lost.is_set():
+        try:
+            await asyncio.wait_for(lost.wait(), HEALTH_INTERVAL)
+        except asyncio.TimeoutError:
+            try:
+                await asyncio.wait_for(connection.fetchval("SELECT 1"), HEALTH_TIMEOUT)
+            except Exception:
+                return
+
+
+async def _reconnect():
+    delay = RECONNECT_MIN
+    while True:
+        try:
+            return await _connect()
+        except Exception:
+            logger.exception("LISTEN reconnect failed", extra={"retry_in": delay})
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX)
+
+
+async def _listen_forever():
+    global _connection
+    while True:
+        await _watch(_connection)
+        logger.warning("LISTEN connection lost, reconnecting")
+        _connection.terminate()
+        _connection = await _reconnect()
+        for resync in _resyncs:
+            try:
+                await resync()
+            except Exception:
+                logger.exception("Resync after reconnect failed")
@@ -0,0 +1,88 @@
+"""
+Structured logging for the shop. Handlers only enqueue records; a
+QueueListener thread formats them as JSON lines and writes them to stdout,
+so request handlers never block on formatting or I/O.
+
+LOG_LEVEL sets the default level, and LOG_LEVELS overrides it per router,
+e.g. LOG_LEVELS="carts=WARNING,barrels=DEBUG".
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+import dotenv
+
+# Attributes every LogRecord has; anything else was passed through extra=.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records untouched, leaving all formatting to the listener."""
+
+    def prepare(self, record):
+        return record
+
+
+def summarize(payload, sample=3):
+    """
+    Cuts a request payload down to something cheap to log: lists become
+    their length plus the first few items, and models become dicts.
+    """
+    if isinstance(payload, (list, tuple)):
+        return {
+            "count": len(payload),
+            "sample": [summarize(item, sample) for item in payload[:sample]],
+        }
+    if hasattr(payload, "dict"):
+        return payload.dict()
+    return payload
+
+
+def setup():
+    """Routes the src.* loggers through the background writer. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+    dotenv.load_dotenv()
+
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger("src")
+    logger.addHandler(DeferredQueueHandler(records))
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    for override in filter(None, os.environ.get("LOG_LEVELS", "").split(",")):
+        name, level = override.split("=")
+        name = name.strip()
+        if not name.startswith("src."):
+            name = "src.api." + name
+        logging.getLogger(name).setLevel(level.strip().upper())
@@ -0,0 +1,296 @@
+"""
+Request and database instrumentation, rendered in the Prometheus text format
+on /admin/metrics.
+
+MetricsMiddleware times every request and attributes the queries it runs to
+its route; instrument() hooks an engine's cursor events to time each
+statement, labelled with its name when it comes from the queries registry;
+timed_pool() measures how long checkouts wait on the pool.
+Statements slower than SLOW_QUERY_SECONDS are logged with their route.
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+import dotenv
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 0.5))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+# (method, route, status) -> latency histogram
+request_latency = defaultdict(Histogram)
+# (method, route) -> [queries, seconds]
+request_db = defaultdict(lambda: [0, 0.0])
+# (route, statement) -> [executions, seconds, slowest]
+statements = defaultdict(lambda: [0, 0.0, 0.0])
+# registered query name -> [executions, seconds, slowest]
+queries = defaultdict(lambda: [0, 0.0, 0.0])
+pool_wait = Histogram()
+# Buffered visits dropped to keep the buffer bounded after failed flushes.
+visits_dropped = 0
+
+
+class RequestStats:
+    """Queries run so far by the request in the current context."""
+
+    def __init__(self, scope, route_of):
+        self.scope = scope
+        self.route_of = route_of
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self):
+        return self.route_of(self.scope)
+
+
+def normalize(statement):
+    """Collapses a statement's whitespace so it can be used as a label."""
+    return re.sub(r"\s+", " ", statement).strip()[:200]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    route = stats.route if stats is not None else "-"
+    name = context.execution_options.get("query_name") if context else None
+    sql = name or normalize(statement)
+    with _lock:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        counted = [statements[(route, sql)]]
+        if name:
+            counted.append(queries[name])
+        for totals in counted:
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] = max(totals[2], elapsed)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        logger.warning(
+            "Slow query", extra={"route": route, "seconds": elapsed, "statement": sql}
+        )
+
+
+def query_stats():
+    """{name: (executions, seconds, slowest)} of every registered query run."""
+    with _lock:
+        return {name: tuple(totals) for name, totals in queries.items()}
+
+
+def instrument(engine):
+    """Times every statement the (sync) engine runs."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def timed_pool(pool_class):
+    """A subclass of pool_class that records how long each checkout waits."""
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                elapsed = time.perf_counter() - start
+                with _lock:
+                    pool_wait.observe(elapsed)
+
+    TimedPool.__name__ = "Timed" + pool_class.__name__
+    return TimedPool
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency and DB time per route."""
+
+    def __init__(self, app):
+        self.app = app
+        self.templates = None
+
+    def route_of(self, scope):
+        if self.templates is None:
+            self.templates = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self.templates.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope, self.route_of)
+        token = _current.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            method = scope["method"]
+            route = self.route_of(scope)
+            with _lock:
+                request_latency[(method, route, status[0])].observe(elapsed)
+                db_totals = request_db[(method, route)]
+                db_totals[0] += stats.queries
+                db_totals[1] += stats.db_seconds
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+def drop_visits(count):
+    global visits_dropped
+    with _lock:
+        visits_dropped += count
+
+
+def _header(name, kind, help_text):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _histogram_lines(name, histogram, **labels):
+    lines = []
+    for bound, count in zip(BUCKETS, histogram.counts):
+        lines.append(f"{name}_bucket{{{_labels(**labels, le=bound)}}} {count}")
+    lines.append(f"{name}_bucket{{{_labels(**labels, le='+Inf')}}} {histogram.count}")
+    suffix = f"{{{_labels(**labels)}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        lines = _header(
+            "potionshop_request_seconds", "histogram", "Request latency by route."
+        )
+        for (method, route, status), histogram in sorted(request_latency.items()):
+            lines += _histogram_lines(
+                "potionshop_request_seconds",
+                histogram,
+                method=method,
+                route=route,
+                status=status,
+            )
+
+        per_route = [
+            (
+                "potionshop_request_db_queries_total",
+                "Queries run by requests to a route.",
+            ),
+            (
+                "potionshop_request_db_seconds_total",
+                "Time requests to a route spent in queries.",
+            ),
+        ]
+        for i, (name, help_text) in enumerate(per_route):
+            lines += _header(name, "counter", help_text)
+            for (method, route), totals in sorted(request_db.items()):
+                lines.append(
+                    f"{name}{{{_labels(method=method, route=route)}}} {totals[i]}"
+                )
+
+        per_statement = [
+            (
+                "potionshop_statement_executions_total",
+                "counter",
+                "Executions of each statement, by route.",
+            ),
+            (
+                "potionshop_statement_seconds_total",
+                "counter",
+                "Time spent in each statement, by route.",
+            ),
+            (
+                "potionshop_statement_max_seconds",
+                "gauge",
+                "Slowest execution of each statement, by route.",
+            ),
+        ]
+        for i, (name, kind, help_text) in enumerate(per_statement):
+            lines += _header(name, kind, help_text)
+            for (route, sql), totals in sorted(statements.items()):
+                lines.append(
+                    f"{name}{{{_labels(route=route, statement=sql)}}} {totals[i]}"
+                )
+
+        per_query = [
+            (
+                "potionshop_query_executions_total",
+                "counter",
+                "Executions of each registered query.",
+            ),
+            (
+                "potionshop_query_seconds_total",
+                "counter",
+                "Time spent in each registered query.",
+            ),
+            (
+                "potionshop_query_max_seconds",
+                "gauge",
+                "Slowest execution of each registered query.",
+            ),
+        ]
+        for i, (name, kind, help_text) in enumerate(per_query):
+            lines += _header(name, kind, help_text)
+            for query, totals in sorted(queries.items()):
+                lines.append(f"{name}{{{_labels(query=query)}}} {totals[i]}")
+
+        lines += _header(
+            "potionshop_pool_wait_seconds",
+            "histogram",
+            "Time spent waiting for a pooled connection.",
+        )
+        lines += _histogram_lines("potionshop_pool_wait_seconds", pool_wait)
+
+        lines += _header(
+            "potionshop_visits_dropped_total",
+            "counter",
+            "Buffered visits dropped after failed flushes.",
+        )
+        lines.append(f"potionshop_visits_dropped_total {visits_dropped}")
+    return "\n".join(lines) + "\n"
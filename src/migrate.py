@@ -0,0 +1,129 @@
+"""
+Applies the versioned SQL files in migrations/ on top of schema.sql, then
+creates the ledgers' upcoming monthly partitions (see partitions.py).
+
+    python -m src.migrate
+
+test/test_query_plans.py checks that the registered queries use the
+indexes and partitions these migrations add.
+"""
+import logging
+import pathlib
+
+import sqlalchemy
+
+from src import database as db
+from src import partitions
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = pathlib.Path(__file__).resolve().parent.parent / "migrations"
+
+# Versions recorded under the files' names before they were renumbered into
+# dependency order, and the names they have now.
+RENUMBERED = {
+    "0000_ledger_balances": "0001_ledger_balances",
+    "0000_search_indexes": "0002_search_indexes",
+    "0000_potion_type_index": "0003_potion_type_index",
+    "0000_delivery_receipts": "0004_delivery_receipts",
+    "0000_ledger_snapshots": "0005_ledger_snapshots",
+    "0001_partition_ledgers": "0006_partition_ledgers",
+    "0002_access_path_indexes": "0007_access_path_indexes",
+    "0003_sales_rollups": "0008_sales_rollups",
+    "0004_refdata_version": "0009_refdata_version",
+    "0005_planning_reservations": "0010_planning_reservations",
+    "0006_cart_lifecycle": "0011_cart_lifecycle",
+    "0007_game_days": "0012_game_days",
+    "0008_partition_default_rows": "0013_partition_default_rows",
+}
+# Made in schema.sql before they had migrations of their own. A database that
+# partitioned its ledgers before these files existed already has them.
+IN_SCHEMA = [
+    "0001_ledger_balances",
+    "0002_search_indexes",
+    "0003_potion_type_index",
+    "0004_delivery_receipts",
+    "0005_ledger_snapshots",
+]
+
+
+def applied(connection):
+    """Versions already applied, under the names their files have now."""
+    connection.execute(
+        sqlalchemy.text(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version text PRIMARY KEY,
+                applied_at timestamp with time zone NOT NULL DEFAULT now()
+            )
+            """
+        )
+    )
+    connection.execute(
+        sqlalchemy.text(
+            """
+            UPDATE schema_migrations
+               SET version = renumbered.new
+              FROM unnest(CAST(:old AS text[]), CAST(:new AS text[]))
+                       AS renumbered (old, new)
+             WHERE version = renumbered.old
+            """
+        ),
+        {"old": list(RENUMBERED), "new": list(RENUMBERED.values())},
+    )
+    connection.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO schema_migrations (version)
+            SELECT unnest(CAST(:versions AS text[]))
+             WHERE EXISTS (SELECT FROM schema_migrations
+                            WHERE version = '0006_partition_ledgers')
+                ON CONFLICT (version) DO NOTHING
+            """
+        ),
+        {"versions": IN_SCHEMA},
+    )
+    return set(
+        connection.execute(sqlalchemy.text("SELECT version FROM schema_migrations"))
+        .scalars()
+        .all()
+    )
+
+
+def migrate():
+    """Applies every pending migration in order, each in its own transaction."""
+    with db.engine.begin() as connection:
+        done = applied(connection)
+    versions = []
+    for path in sorted(MIGRATIONS.glob("*.sql")):
+        version = path.stem
+        if version in done:
+            continue
+        with db.engine.begin() as connection:
+            # Two deploys starting at once must not apply the same file twice.
+            connection.execute(
+                sqlalchemy.text(
+                    "SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"
+                )
+            )
+            if version in applied(connection):
+                continue
+            # Sent as-is: migrations hold plpgsql bodies and literal % signs
+            # that must not go through parameter substitution.
+            connection.connection.cursor().execute(path.read_text())
+            connection.execute(
+                sqlalchemy.text(
+                    "INSERT INTO schema_migrations (version) VALUES (:version)"
+                ),
+                {"version": version},
+            )
+        logger.info("Migration applied", extra={"version": version})
+        versions.append(version)
+    with db.engine.begin() as connection:
+        for table in partitions.params():
+            connection.execute(partitions.ENSURE, table)
+    return versions
+
+
+if __name__ == "__main__":
+    print(migrate())
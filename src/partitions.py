@@ -0,0 +1,80 @@
+"""
+Keeps the ledgers' monthly partitions MONTHS_AHEAD months ahead of the
+current one. The migration runner does it after migrating, and every worker
+at startup and then every PARTITION_INTERVAL seconds, so a month always has
+its partition before its first row is written, even if migrations haven't
+run since the month turned. Rows that already went to a *_default partition
+are moved into the new month's partition by ensure_monthly_partitions (see
+migrations/0013_partition_default_rows.sql).
+"""
+import asyncio
+import logging
+import os
+
+import dotenv
+
+from src import database as db
+from src import queries
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+MONTHS_AHEAD = 3
+PARTITION_INTERVAL = float(os.environ.get("PARTITION_INTERVAL", 6 * 60 * 60))
+
+PARTITIONED_TABLES = [
+    "potion_records",
+    "ml_records",
+    "gold_records",
+    "capacity_records",
+    "customer_visits",
+]
+
+ENSURE = queries.register(
+    "partitions.ensure",
+    "SELECT ensure_monthly_partitions(CAST(:table AS regclass), :months)",
+)
+
+_keeper = None
+
+
+def params():
+    """ENSURE's parameters for each partitioned table."""
+    return [
+        {"table": f"public.{table}", "months": MONTHS_AHEAD}
+        for table in PARTITIONED_TABLES
+    ]
+
+
+async def ensure():
+    """Creates any partitions missing from this month to MONTHS_AHEAD ahead."""
+    for table in params():
+        async with db.async_engine.begin() as connection:
+            await connection.execute(ENSURE, table)
+
+
+def start():
+    """Starts keeping partitions ahead on the running event loop."""
+    global _keeper
+    if _keeper is None:
+        _keeper = asyncio.create_task(_ensure_forever())
+
+
+async def stop():
+    global _keeper
+    if _keeper is not None:
+        _keeper.cancel()
+        try:
+            await _keeper
+        except asyncio.CancelledError:
+            pass
+        _keeper = None
+
+
+async def _ensure_forever():
+    while True:
+        try:
+            await ensure()
+        except Exception:
+            logger.exception("Creating ledger partitions failed")
+        await asyncio.sleep(PARTITION_INTERVAL)
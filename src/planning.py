@@ -0,0 +1,330 @@
+"""
+Planners that turn the shop's stock into bottling and barrel purchasing
+decisions. Every mode of a planner takes the same inputs, so the endpoints
+can switch between them and anything replaying their decisions can reuse
+them without a database.
+
+Potions are rows with potion_type, brewable_pt, recent_amt_sold,
+favorability and price, listed in the order the greedy planner walks them.
+Barrels are rows with sku, ml_per_barrel, potion_type, price and quantity.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+
+NO_LIMIT = np.iinfo(np.int64).max
+# Seconds the knapsack planner may search before settling for its best plan.
+KNAPSACK_TIME_LIMIT = 2.0
+# Most potions the knapsack planner branches over on large catalogs.
+KNAPSACK_CANDIDATES = 256
+# Barrels per colour, by ml per gold, the optimal barrel solver considers.
+BARREL_CANDIDATES = 64
+# Most potions the catalog lists at once.
+CATALOG_SIZE = 6
+# Gold per unit of potion or ml capacity, and what one unit holds.
+CAPACITY_UNIT_PRICE = 1000
+POTIONS_PER_UNIT = 50
+ML_PER_UNIT = 10000
+
+# A potion the bottling planners can choose from.
+BottleCandidate = namedtuple(
+    "BottleCandidate",
+    ["potion_type", "price", "recent_amt_sold", "favorability", "brewable_pt"],
+)
+
+
+def rank_catalog(stock, favorability):
+    """
+    Skus of the in-stock potions to list, most favored first, then most
+    stocked. stock maps sku to quantity; favorability maps sku to its
+    strategy weight, 1.0 when missing.
+    """
+    in_stock = [sku for sku, quantity in stock.items() if quantity > 0]
+    in_stock.sort(key=lambda sku: (-favorability.get(sku, 1.0), -stock[sku]))
+    return in_stock[:CATALOG_SIZE]
+
+
+def bottle_candidates(potions, stock, velocity, favorability, pt_limit):
+    """
+    BottleCandidates for every bottled potion still under pt_limit in stock,
+    in the order the greedy planner walks them: best sellers, then most
+    favored, then most room. potions are rows with sku, price, potion_type
+    and do_bottle; stock and velocity map sku to quantity.
+    """
+    candidates = []
+    for potion in potions:
+        if not potion.do_bottle:
+            continue
+        in_stock = stock.get(potion.sku, 0)
+        if in_stock >= pt_limit:
+            continue
+        # Potions the strategy rates at zero or below count as neutral.
+        potion_favorability = favorability.get(potion.sku, 1.0)
+        candidates.append(
+            BottleCandidate(
+                potion.potion_type,
+                potion.price,
+                velocity.get(potion.sku, 0),
+                potion_favorability if potion_favorability > 0 else 1.0,
+                pt_limit - in_stock,
+            )
+        )
+    candidates.sort(
+        key=lambda potion: (
+            -potion.recent_amt_sold,
+            -potion.favorability,
+            -potion.brewable_pt,
+        )
+    )
+    return candidates
+
+
+def capacity_plan(gold, potion_units, ml_units, pt_unit_limit, ml_unit_limit):
+    """Potion capacity first, then ml capacity, up to each limit and the gold."""
+    gold = max(gold, 0)
+    pt_qty = int(min(max(pt_unit_limit - potion_units, 0), gold // CAPACITY_UNIT_PRICE))
+    gold -= pt_qty * CAPACITY_UNIT_PRICE
+    ml_qty = int(min(max(ml_unit_limit - ml_units, 0), gold // CAPACITY_UNIT_PRICE))
+    return {"potion_capacity": pt_qty, "ml_capacity": ml_qty}
+
+
+def greedy_bottle_plan(potions, ml_list, potions_left):
+    """Bottles as many of each potion as still fits, in the order given."""
+    ml_list = list(ml_list)
+    bottle_plan = []
+    for potion in potions:
+        qty = int(
+            min(
+                min(
+                    ml_list[i] // potion.potion_type[i]
+                    for i in range(4)
+                    if potion.potion_type[i] > 0
+                ),
+                potions_left,
+                potion.brewable_pt,
+            )
+        )
+        if qty > 0:
+            for i in range(4):
+                ml_list[i] -= qty * potion.potion_type[i]
+            potions_left -= qty
+            bottle_plan.append(
+                {
+                    "potion_type": potion.potion_type,
+                    "quantity": qty,
+                }
+            )
+    return bottle_plan
+
+
+def vectorized_bottle_plan(potions, ml_list, potions_left):
+    """
+    Same plan as greedy_bottle_plan, but each step evaluates every remaining
+    potion at once. Potions that can't be bottled are dropped for good, since
+    ml and room only shrink, so there is one step per potion actually bottled.
+    """
+    if not potions:
+        return []
+    types = np.array([potion.potion_type for potion in potions], dtype=np.int64)
+    brewable = np.array([potion.brewable_pt for potion in potions], dtype=np.int64)
+    ml = np.array(ml_list, dtype=np.int64)
+    remaining = np.arange(len(potions))
+    bottle_plan = []
+    while remaining.size and potions_left > 0:
+        needed = types[remaining]
+        fits = np.where(needed > 0, ml // np.maximum(needed, 1), NO_LIMIT).min(axis=1)
+        qty = np.minimum(np.minimum(fits, brewable[remaining]), potions_left)
+        feasible = qty > 0
+        if not feasible.any():
+            break
+        first = int(np.argmax(feasible))
+        chosen = remaining[first]
+        chosen_qty = int(qty[first])
+        ml -= chosen_qty * types[chosen]
+        potions_left -= chosen_qty
+        bottle_plan.append(
+            {"potion_type": potions[chosen].potion_type, "quantity": chosen_qty}
+        )
+        remaining = remaining[first + 1 :][feasible[first + 1 :]]
+    return bottle_plan
+
+
+def expected_revenue(potions):
+    """Value of one bottle of each potion: price weighted by demand and strategy."""
+    return np.array(
+        [
+            potion.price * potion.favorability * (1 + potion.recent_amt_sold)
+            for potion in potions
+        ],
+        dtype=np.float64,
+    )
+
+
+def knapsack_bottle_plan(potions, ml_list, potions_left):
+    """
+    Integer program maximizing expected revenue subject to the ml of each
+    colour, the room left for potions and each potion's brewable limit.
+
+    The LP relaxation is solved over every potion first; the integer program
+    then only branches over the KNAPSACK_CANDIDATES potions with the best
+    reduced costs, which keeps large catalogs tractable. Falls back to the
+    vectorized greedy plan if the solver finds no plan in time.
+    """
+    if not potions or potions_left <= 0:
+        return []
+    types = np.array([potion.potion_type for potion in potions], dtype=np.float64)
+    brewable = np.maximum(
+        np.array([potion.brewable_pt for potion in potions], dtype=np.float64), 0
+    )
+    revenue = expected_revenue(potions)
+    usage = np.vstack([types.T, np.ones(len(potions))])
+    limits = np.append(np.asarray(ml_list, dtype=np.float64), potions_left)
+
+    candidates = np.arange(len(potions))
+    if len(potions) > KNAPSACK_CANDIDATES:
+        relaxed = linprog(
+            -revenue,
+            A_ub=usage,
+            b_ub=limits,
+            bounds=np.column_stack([np.zeros(len(potions)), brewable]),
+            method="highs",
+        )
+        if relaxed.status == 0:
+            reduced_cost = relaxed.lower.marginals + relaxed.upper.marginals
+            candidates = np.argsort(reduced_cost)[:KNAPSACK_CANDIDATES]
+
+    result = milp(
+        -revenue[candidates],
+        constraints=LinearConstraint(usage[:, candidates], ub=limits),
+        integrality=np.ones(len(candidates)),
+        bounds=Bounds(0, brewable[candidates]),
+        options={"time_limit": KNAPSACK_TIME_LIMIT},
+    )
+    if result.x is None:
+        return vectorized_bottle_plan(potions, ml_list, potions_left)
+    quantities = np.round(result.x).astype(np.int64)
+    return [
+        {"potion_type": potions[i].potion_type, "quantity": int(qty)}
+        for i, qty in zip(candidates, quantities)
+        if qty > 0
+    ]
+
+
+BOTTLE_PLANNERS = {
+    "greedy": greedy_bottle_plan,
+    "vectorized": vectorized_bottle_plan,
+    "knapsack": knapsack_bottle_plan,
+}
+
+
+def barrels_by_colour(catalog):
+    """Indexes of the catalog's barrels for each colour, most ml first."""
+    by_colour = [[] for _ in range(4)]
+    for i in sorted(
+        range(len(catalog)), key=lambda i: catalog[i].ml_per_barrel, reverse=True
+    ):
+        for colour in range(4):
+            if catalog[i].potion_type[colour] == 1:
+                by_colour[colour].append(i)
+    return by_colour
+
+
+def greedy_barrel_plan(catalog, gold, ml_left, budget, buyable_ml):
+    """
+    For each colour, most needed first, buys the largest single-colour barrel
+    that is affordable and fits, as many as the colour's limit and the
+    per-barrel budget allow (at least one).
+    """
+    by_colour = barrels_by_colour(catalog)
+    bought = set()
+    purchase_plan = []
+    for r in np.argsort(buyable_ml)[::-1]:
+        if buyable_ml[r] <= 0:
+            continue
+        chosen = next(
+            (
+                i
+                for i in by_colour[r]
+                if i not in bought
+                and gold >= catalog[i].price
+                and ml_left >= catalog[i].ml_per_barrel
+            ),
+            None,
+        )
+        if chosen is not None:
+            bought.add(chosen)
+            barrel = catalog[chosen]
+            qty = int(
+                max(
+                    min(
+                        min(buyable_ml[r], ml_left) // barrel.ml_per_barrel,
+                        min(budget, gold) // barrel.price,
+                        barrel.quantity,
+                    ),
+                    1,
+                ),
+            )
+            gold -= barrel.price * qty
+            ml_left -= barrel.ml_per_barrel * qty
+            purchase_plan.append({"sku": barrel.sku, "quantity": qty})
+    return purchase_plan
+
+
+def optimal_barrel_plan(catalog, gold, ml_left, budget, buyable_ml):
+    """
+    Integer program maximizing the ml bought, mixed-colour barrels included,
+    subject to gold, the per-barrel budget, ml_left and each colour's
+    buyable ml. Only the BARREL_CANDIDATES barrels with the most ml per gold
+    in each colour are considered. Falls back to the greedy plan if the
+    solver finds no plan in time.
+    """
+    if not catalog:
+        return []
+    colour_ml = (
+        np.array([barrel.potion_type for barrel in catalog], dtype=np.float64)
+        * np.array([barrel.ml_per_barrel for barrel in catalog], dtype=np.float64)[
+            :, None
+        ]
+    )
+    price = np.array([barrel.price for barrel in catalog], dtype=np.float64)
+    available = np.array([barrel.quantity for barrel in catalog], dtype=np.float64)
+    total_ml = colour_ml.sum(axis=1)
+    ml_per_gold = total_ml / np.maximum(price, 1)
+
+    affordable = price <= min(budget, gold)
+    candidates = set()
+    for colour in range(4):
+        in_colour = np.flatnonzero((colour_ml[:, colour] > 0) & affordable)
+        best = in_colour[np.argsort(-ml_per_gold[in_colour], kind="stable")]
+        candidates.update(best[:BARREL_CANDIDATES].tolist())
+    if not candidates:
+        return []
+    candidates = np.array(sorted(candidates))
+    upper = np.minimum(available[candidates], min(budget, gold) // price[candidates])
+    result = milp(
+        -total_ml[candidates],
+        constraints=LinearConstraint(
+            np.vstack(
+                [price[candidates], total_ml[candidates], colour_ml[candidates].T]
+            ),
+            ub=np.concatenate([[gold, ml_left], np.maximum(buyable_ml, 0)]),
+        ),
+        integrality=np.ones(candidates.size),
+        bounds=Bounds(0, np.maximum(upper, 0)),
+        options={"time_limit": KNAPSACK_TIME_LIMIT},
+    )
+    if result.x is None:
+        return greedy_barrel_plan(catalog, gold, ml_left, budget, buyable_ml)
+    quantities = np.round(result.x).astype(np.int64)
+    return [
+        {"sku": catalog[i].sku, "quantity": int(qty)}
+        for i, qty in zip(candidates, quantities)
+        if qty > 0
+    ]
+
+
+BARREL_PLANNERS = {
+    "greedy": greedy_barrel_plan,
+    "optimal": optimal_barrel_plan,
+}
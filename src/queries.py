@@ -0,0 +1,58 @@
+"""
+Registry of the statements the API runs. Each is built once, at import, by
+register() in the module that runs it, and carries its name as the
+query_name execution option, which metrics counts executions and time by.
+
+On the async engine, asyncpg prepares a statement server-side the first
+time a pooled connection runs it and reuses the prepared statement, and
+with it Postgres's cached plan, from then on. The dialect keeps
+DB_PREPARED_STATEMENT_CACHE_SIZE of them per connection (see database.py),
+enough for every registered statement. psycopg2 has no server-side prepare,
+so the sync admin statements only skip being rebuilt and recompiled.
+"""
+import sqlalchemy
+
+from src import database as db
+from src import metrics
+
+# name -> TextClause
+statements = {}
+
+
+def register(name: str, sql: str):
+    """Builds the statement for sql once and files it under name."""
+    if name in statements:
+        raise ValueError(f"Query {name} is already registered")
+    statement = sqlalchemy.text(sql).execution_options(query_name=name)
+    statements[name] = statement
+    return statement
+
+
+def stats():
+    """Executions, total and slowest seconds of every registered statement."""
+    counted = metrics.query_stats()
+    fields = ("executions", "seconds", "max_seconds")
+    return {
+        name: dict(zip(fields, counted.get(name, (0, 0.0, 0.0))))
+        for name in sorted(statements)
+    }
+
+
+async def explain(name: str, params=None):
+    """
+    EXPLAIN ANALYZE output, one line per element, of the statement registered
+    as name run with params. ANALYZE really runs it, so it is run in a
+    transaction that is always rolled back. Raises KeyError for an unknown
+    name.
+    """
+    statement = statements[name]
+    async with db.async_engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            plan = await connection.execute(
+                sqlalchemy.text("EXPLAIN (ANALYZE, BUFFERS) " + statement.text),
+                params or {},
+            )
+            return [row[0] for row in plan]
+        finally:
+            await transaction.rollback()
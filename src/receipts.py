@@ -0,0 +1,84 @@
+"""
+Delivery receipts keyed on the game server's order_id. Retried deliveries
+are answered with the response recorded the first time instead of writing
+their ledger rows again.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from src import queries
+
+CACHE_SIZE = 1024
+
+_lock = threading.Lock()
+_recent = OrderedDict()
+
+CLAIM = queries.register(
+    "receipts.claim",
+    """
+    INSERT INTO delivery_receipts (endpoint, order_id, response)
+         VALUES (:endpoint, :order_id, :response)
+    ON CONFLICT (endpoint, order_id) DO NOTHING
+      RETURNING order_id
+    """,
+)
+RECORDED = queries.register(
+    "receipts.recorded",
+    """
+    SELECT response FROM delivery_receipts
+     WHERE endpoint = :endpoint AND order_id = :order_id
+    """,
+)
+
+
+def lookup(endpoint: str, order_id: int):
+    """Returns the cached response for a recently seen delivery, or None."""
+    key = (endpoint, order_id)
+    with _lock:
+        if key not in _recent:
+            return None
+        _recent.move_to_end(key)
+        return _recent[key]
+
+
+def remember(endpoint: str, order_id: int, response):
+    with _lock:
+        _recent[(endpoint, order_id)] = response
+        _recent.move_to_end((endpoint, order_id))
+        if len(_recent) > CACHE_SIZE:
+            _recent.popitem(last=False)
+
+
+def forget_all():
+    with _lock:
+        _recent.clear()
+
+
+async def claim(connection, endpoint: str, order_id: int, response):
+    """
+    Records the receipt for a delivery inside the caller's transaction.
+    Returns None if this is the first time the delivery is seen, otherwise
+    the response recorded for it, in which case nothing should be written.
+    """
+    claimed = (
+        await connection.execute(
+            CLAIM,
+            {
+                "endpoint": endpoint,
+                "order_id": order_id,
+                "response": json.dumps(response),
+            },
+        )
+    ).first()
+    if claimed is not None:
+        return None
+    previous = json.loads(
+        (
+            await connection.execute(
+                RECORDED, {"endpoint": endpoint, "order_id": order_id}
+            )
+        ).scalar_one()
+    )
+    remember(endpoint, order_id, previous)
+    return previous
@@ -0,0 +1,134 @@
+"""
+In-process copy of the reference tables: potion_index, potion_strategy and
+magic_numbers. They change rarely, so the read paths look them up here and
+only query the ledgers and balances.
+
+Every change to those tables bumps refdata_version and sends it on the
+refdata channel (see migrations/0009_refdata_version.sql). Each process
+subscribes notified() to it and reloads, so the copy is at most one
+notification behind.
+"""
+import asyncio
+import logging
+from collections import namedtuple
+
+import sqlalchemy
+
+from src import database as db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "refdata"
+
+Potion = namedtuple("Potion", ["sku", "price", "potion_type", "do_bottle"])
+MagicNumbers = namedtuple(
+    "MagicNumbers",
+    [
+        "per_barrel_budget",
+        "per_barrel_ml_limit",
+        "ml_cap_unit_limit",
+        "pt_cap_unit_limit",
+        "per_bottle_limit",
+    ],
+)
+
+# sku -> Potion, in sku order.
+potions = {}
+# (red, green, blue, dark) -> sku.
+skus_by_type = {}
+# game weekday -> {sku: favorability}.
+strategy = {}
+magic = None
+# refdata_version the copy was loaded at; None until the first load.
+version = None
+
+
+async def load(connection):
+    """Replaces the in-process copy with the tables as of this transaction."""
+    global potions, skus_by_type, strategy, magic, version
+    loaded_version = (
+        await connection.execute(sqlalchemy.text("SELECT version FROM refdata_version"))
+    ).scalar_one()
+    index = (
+        await connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT sku, price, do_bottle,
+                       ARRAY[red_pct, green_pct, blue_pct, dark_pct] AS potion_type
+                  FROM potion_index
+                 ORDER BY sku
+                """
+            )
+        )
+    ).all()
+    strategy_rows = (
+        await connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT CAST(day_of_week AS text) AS day, potion_sku, favorability
+                  FROM potion_strategy
+                """
+            )
+        )
+    ).all()
+    magic_row = (
+        await connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT per_barrel_budget, per_barrel_ml_limit, ml_cap_unit_limit,
+                       pt_cap_unit_limit, per_bottle_limit
+                  FROM magic_numbers
+                 LIMIT 1
+                """
+            )
+        )
+    ).one_or_none()
+
+    new_strategy = {}
+    for row in strategy_rows:
+        new_strategy.setdefault(row.day, {})[row.potion_sku] = row.favorability
+    # Swapped in together, so a reader never sees half of a reload.
+    potions, skus_by_type, strategy, magic, version = (
+        {
+            row.sku: Potion(row.sku, row.price, list(row.potion_type), row.do_bottle)
+            for row in index
+        },
+        {tuple(row.potion_type): row.sku for row in index},
+        new_strategy,
+        MagicNumbers(*magic_row) if magic_row is not None else None,
+        loaded_version,
+    )
+    logger.info(
+        "Reference data loaded",
+        extra={"version": version, "potions": len(potions), "days": len(strategy)},
+    )
+
+
+async def reload():
+    async with db.async_engine.begin() as connection:
+        await load(connection)
+
+
+async def bump(connection):
+    """Marks the reference data changed, so every process reloads it."""
+    return (
+        await connection.execute(sqlalchemy.text("SELECT bump_refdata_version()"))
+    ).scalar_one()
+
+
+def favorability(day):
+    """{sku: favorability} for a game weekday; empty when it has no strategy."""
+    return strategy.get(day, {})
+
+
+def notified(payload):
+    """Reloads when another process reports a newer version than this copy."""
+    if version is not None and int(payload) <= version:
+        return
+    task = asyncio.get_running_loop().create_task(reload())
+    task.add_done_callback(_reloaded)
+
+
+def _reloaded(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Reference data reload failed", exc_info=task.exception())
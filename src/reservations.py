@@ -0,0 +1,132 @@
+"""
+Serializes the planners across worker processes and reserves what each plan
+will spend until it is delivered.
+
+A plan takes the planning advisory lock for its transaction, reads the
+balances less everything still reserved, and records its own reservation
+before committing. The matching delivery releases it in the transaction that
+writes the ledger rows, so at any moment a plan sees either the reservation
+or the delivered balances, never both and never neither.
+
+The game gives a plan no id until it is delivered, so a reservation is keyed
+by plan_key() of what the plan asks for, and a delivery only releases a live
+reservation of its kind with the key of what was delivered. A late delivery
+of an expired plan releases nothing, and never another plan's reservation.
+"""
+import json
+import os
+from collections import namedtuple
+
+import dotenv
+
+from src import queries
+
+dotenv.load_dotenv()
+
+# Arbitrary, but fixed: every process must lock the same key.
+PLANNING_LOCK = 0x706F74696F6E
+# Plans the game never delivers stop holding gold and ml after this long.
+RESERVATION_SECONDS = int(os.environ.get("PLAN_RESERVATION_SECONDS", 300))
+
+Outstanding = namedtuple("Outstanding", ["gold", "ml_in", "ml_out", "potions_in"])
+
+LOCK = queries.register("reservations.lock", "SELECT pg_advisory_xact_lock(:key)")
+OUTSTANDING = queries.register(
+    "reservations.outstanding",
+    """
+    SELECT COALESCE(SUM(gold), 0) AS gold,
+           ARRAY[
+                COALESCE(SUM(ml_in[1]), 0), COALESCE(SUM(ml_in[2]), 0),
+                COALESCE(SUM(ml_in[3]), 0), COALESCE(SUM(ml_in[4]), 0)
+           ] AS ml_in,
+           ARRAY[
+                COALESCE(SUM(ml_out[1]), 0), COALESCE(SUM(ml_out[2]), 0),
+                COALESCE(SUM(ml_out[3]), 0), COALESCE(SUM(ml_out[4]), 0)
+           ] AS ml_out,
+           COALESCE(SUM(potions_in), 0) AS potions_in
+      FROM plan_reservations
+     WHERE expires_at > now()
+    """,
+)
+RESERVE = queries.register(
+    "reservations.reserve",
+    """
+    WITH expired AS (
+        DELETE FROM plan_reservations WHERE expires_at <= now()
+    )
+    INSERT INTO plan_reservations
+                (kind, plan, gold, ml_in, ml_out, potions_in, expires_at)
+         VALUES (:kind, :plan, :gold, CAST(:ml_in AS integer[]),
+                 CAST(:ml_out AS integer[]), :potions_in,
+                 now() + make_interval(secs => :seconds))
+    """,
+)
+RELEASE = queries.register(
+    "reservations.release",
+    """
+    DELETE FROM plan_reservations
+     WHERE id = (
+            SELECT id FROM plan_reservations
+             WHERE kind = :kind
+               AND plan = :plan
+               AND expires_at > now()
+             ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+           )
+    """,
+)
+
+
+def plan_key(lines):
+    """
+    Identifies a plan by its (item, quantity) lines, in any order, so the
+    delivery listing the same lines finds its reservation.
+    """
+    return json.dumps(sorted([item, quantity] for item, quantity in lines if quantity))
+
+
+async def lock(connection):
+    """Waits for the planning lock, held until the caller's transaction ends."""
+    await connection.execute(LOCK, {"key": PLANNING_LOCK})
+
+
+async def outstanding(connection):
+    """
+    Totals of every live reservation: gold to be spent, ml per colour to
+    arrive and to be used, and potions to be bottled.
+    """
+    row = (await connection.execute(OUTSTANDING)).one()
+    return Outstanding(row.gold, list(row.ml_in), list(row.ml_out), row.potions_in)
+
+
+async def reserve(
+    connection,
+    kind: str,
+    plan: str,
+    gold=0,
+    ml_in=(0, 0, 0, 0),
+    ml_out=(0, 0, 0, 0),
+    potions_in=0,
+):
+    """
+    Records what a plan of kind, keyed by plan_key(), will spend; call while
+    holding the lock.
+    """
+    await connection.execute(
+        RESERVE,
+        {
+            "kind": kind,
+            "plan": plan,
+            "gold": gold,
+            "ml_in": list(ml_in),
+            "ml_out": list(ml_out),
+            "potions_in": potions_in,
+            "seconds": RESERVATION_SECONDS,
+        },
+    )
+
+
+async def release(connection, kind: str, plan: str):
+    """Drops the live reservation of the plan of kind that has been delivered."""
+    await connection.execute(RELEASE, {"kind": kind, "plan": plan})
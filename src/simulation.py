@@ -0,0 +1,429 @@
+"""
+Offline simulator for tuning magic_numbers, potion_strategy and the planner
+modes without touching production.
+
+A snapshot of the recorded demand (cart_lines and customer_visits, bucketed
+into ticks), the reference tables and the game weekdays is loaded into NumPy
+arrays once. Each configuration then replays it tick by tick from a fresh
+shop through the same planning functions the endpoints call: capacity once
+a day, barrels and bottling on alternate ticks, and the catalog every tick,
+with customers buying what the recorded demand asks for out of what is
+listed and in stock. Potions are weighed as the endpoints weigh them, with
+forecast.favorability(): potion_strategy until a demand model fitted on the
+demand replayed so far has seen forecast.MIN_VISITS visits, its weights from
+then on. The model counts every visitor as one class, since the snapshot
+keeps no classes.
+
+The *_records ledgers are not part of the snapshot: every configuration
+starts a fresh shop with STARTING_GOLD and nothing in stock, and its gold,
+ml and potions follow from what it buys, bottles and sells. Recorded demand
+is all the replay needs.
+
+Grids of configurations run across a process pool:
+
+    python -m src.simulation --days 30 --grid per_bottle_limit=20,50,100 \\
+        --grid bottle_planner=greedy,knapsack
+"""
+import argparse
+import itertools
+import math
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import sqlalchemy
+
+from src import database as db
+from src import forecast, game_clock, planning
+from src.api.bottler import FORECAST_TICKS
+from src.refdata import MagicNumbers, Potion
+
+TICK_SECONDS = 2 * 60 * 60
+TICKS_PER_DAY = 12
+STARTING_GOLD = 100
+
+Barrel = namedtuple(
+    "Barrel", ["sku", "ml_per_barrel", "potion_type", "price", "quantity"]
+)
+
+# The wholesale catalog offered on every barrel tick; the game's real one is
+# not recorded.
+DEFAULT_BARRELS = [
+    Barrel(f"{size}_{colour}_BARREL", ml, potion_type, price, 10)
+    for colour, potion_type in [
+        ("RED", [1, 0, 0, 0]),
+        ("GREEN", [0, 1, 0, 0]),
+        ("BLUE", [0, 0, 1, 0]),
+        ("DARK", [0, 0, 0, 1]),
+    ]
+    for size, ml, price in [
+        ("SMALL", 500, 100),
+        ("MEDIUM", 2500, 250),
+        ("LARGE", 10000, 500),
+    ]
+]
+
+# Used when magic_numbers is empty.
+DEFAULT_MAGIC = MagicNumbers(
+    per_barrel_budget=500,
+    per_barrel_ml_limit=10000,
+    ml_cap_unit_limit=1,
+    pt_cap_unit_limit=1,
+    per_bottle_limit=10,
+)
+
+# potions in sku order; demand[tick, potion] and visits[tick] are counts;
+# days[tick] is the game weekday of each recorded tick.
+Snapshot = namedtuple(
+    "Snapshot", ["potions", "strategy", "magic", "demand", "visits", "days"]
+)
+
+# Configuration keys besides the MagicNumbers fields, with their defaults.
+DEFAULT_CONFIG = {
+    "bottle_planner": "greedy",
+    "barrel_solver": "greedy",
+    "window_hours": 4,
+    # False plans and lists as if potion_strategy were empty.
+    "use_strategy": True,
+    # False weighs potions by potion_strategy alone, without the forecast.
+    "use_forecast": True,
+}
+
+# The one customer class the simulator's demand model knows.
+ANY_CLASS = "any"
+
+
+def load_snapshot(since=None, until=None):
+    """Loads recorded demand between since and until (timestamps, optional)."""
+    window = {"since": since, "until": until}
+    bounds = """
+        WHERE (CAST(:since AS timestamptz) IS NULL OR timestamp >= :since)
+          AND (CAST(:until AS timestamptz) IS NULL OR timestamp < :until)
+    """
+    with db.engine.begin() as connection:
+        potions = [
+            Potion(row.sku, row.price, list(row.potion_type), row.do_bottle)
+            for row in connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT sku, price, do_bottle,
+                           ARRAY[red_pct, green_pct, blue_pct, dark_pct] AS potion_type
+                      FROM potion_index
+                     ORDER BY sku
+                    """
+                )
+            )
+        ]
+        strategy = {}
+        for row in connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT CAST(day_of_week AS text) AS day, potion_sku, favorability
+                  FROM potion_strategy
+                """
+            )
+        ):
+            strategy.setdefault(row.day, {})[row.potion_sku] = row.favorability
+        magic_row = connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT per_barrel_budget, per_barrel_ml_limit, ml_cap_unit_limit,
+                       pt_cap_unit_limit, per_bottle_limit
+                  FROM magic_numbers
+                 LIMIT 1
+                """
+            )
+        ).one_or_none()
+        sales = connection.execute(
+            sqlalchemy.text(
+                f"""
+                SELECT CAST(floor(extract(epoch FROM timestamp) / :tick) AS bigint)
+                           AS tick,
+                       sku, SUM(quantity) AS quantity
+                  FROM cart_lines
+                {bounds}
+              GROUP BY 1, 2
+                """
+            ),
+            {"tick": TICK_SECONDS, **window},
+        ).all()
+        visit_counts = connection.execute(
+            sqlalchemy.text(
+                f"""
+                SELECT CAST(floor(extract(epoch FROM timestamp) / :tick) AS bigint)
+                           AS tick,
+                       COUNT(*) AS visits
+                  FROM customer_visits
+                {bounds}
+              GROUP BY 1
+                """
+            ),
+            {"tick": TICK_SECONDS, **window},
+        ).all()
+        game_ticks = connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT CAST(floor(extract(epoch FROM timestamp) / :tick) AS bigint)
+                           AS tick,
+                       day
+                  FROM game_ticks
+              ORDER BY timestamp
+                """
+            ),
+            {"tick": TICK_SECONDS},
+        ).all()
+
+    ticks = [row.tick for row in sales] + [row.tick for row in visit_counts]
+    if not ticks:
+        raise ValueError("no recorded carts or visits to simulate")
+    first = min(ticks)
+    length = max(ticks) - first + 1
+    index = {potion.sku: i for i, potion in enumerate(potions)}
+
+    demand = np.zeros((length, len(potions)), dtype=np.int64)
+    known = [row for row in sales if row.sku in index]
+    np.add.at(
+        demand,
+        (
+            np.array([row.tick - first for row in known], dtype=np.int64),
+            np.array([index[row.sku] for row in known], dtype=np.int64),
+        ),
+        np.array([row.quantity for row in known], dtype=np.int64),
+    )
+    visits = np.zeros(length, dtype=np.int64)
+    visits[[row.tick - first for row in visit_counts]] = [
+        row.visits for row in visit_counts
+    ]
+
+    # Each recorded tick takes the weekday of the latest game tick before it;
+    # without any, weekdays simply follow each other from the first tick.
+    absolute = np.arange(first, first + length)
+    if game_ticks:
+        reported = np.array([row.tick for row in game_ticks])
+        latest = np.maximum(np.searchsorted(reported, absolute, side="right") - 1, 0)
+        days = [game_ticks[i].day for i in latest]
+    else:
+        days = [
+            game_clock.DAYS[(tick // TICKS_PER_DAY) % len(game_clock.DAYS)]
+            for tick in range(length)
+        ]
+
+    return Snapshot(
+        potions,
+        strategy,
+        MagicNumbers(*magic_row) if magic_row is not None else DEFAULT_MAGIC,
+        demand,
+        visits,
+        days,
+    )
+
+
+def simulate(snapshot, config, days, barrels=DEFAULT_BARRELS):
+    """
+    Runs a fresh shop for days game days under config, replaying the
+    snapshot's demand (repeated if it is shorter), and returns the outcome.
+    """
+    settings = {**DEFAULT_CONFIG, **config}
+    magic = snapshot.magic._replace(
+        **{key: value for key, value in config.items() if key in MagicNumbers._fields}
+    )
+    bottle = planning.BOTTLE_PLANNERS[settings["bottle_planner"]]
+    buy = planning.BARREL_PLANNERS[settings["barrel_solver"]]
+    window = max(math.ceil(settings["window_hours"] * 3600 / TICK_SECONDS), 1)
+
+    potions = snapshot.potions
+    skus = [potion.sku for potion in potions]
+    index_by_type = {tuple(potion.potion_type): i for i, potion in enumerate(potions)}
+    price = np.array([potion.price for potion in potions], dtype=np.int64)
+    barrel_ml = np.array(
+        [np.array(barrel.potion_type) * barrel.ml_per_barrel for barrel in barrels],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    barrel_index = {barrel.sku: i for i, barrel in enumerate(barrels)}
+
+    ticks = days * TICKS_PER_DAY
+    recorded = len(snapshot.demand)
+    gold = STARTING_GOLD
+    ml = np.zeros(4, dtype=np.int64)
+    stock = np.zeros(len(potions), dtype=np.int64)
+    potion_units = ml_units = 1
+    sold = np.zeros((ticks, len(potions)), dtype=np.int64)
+    unmet = np.zeros(ticks, dtype=np.int64)
+    visits = 0
+    model = forecast.DemandModel()
+
+    def favorability(day, hour, ahead):
+        if settings["use_forecast"] and model.ready():
+            return model.weights(day, hour, ahead, skus=skus)
+        return snapshot.strategy.get(day, {}) if settings["use_strategy"] else {}
+
+    for tick in range(ticks):
+        day = snapshot.days[tick % recorded]
+        hour = tick % TICKS_PER_DAY * 2
+        now = tick * TICK_SECONDS
+        model.add_ticks([now], [day], [hour])
+
+        if tick % TICKS_PER_DAY == 0:
+            plan = planning.capacity_plan(
+                gold,
+                potion_units,
+                ml_units,
+                magic.pt_cap_unit_limit,
+                magic.ml_cap_unit_limit,
+            )
+            gold -= (
+                plan["potion_capacity"] + plan["ml_capacity"]
+            ) * planning.CAPACITY_UNIT_PRICE
+            potion_units += plan["potion_capacity"]
+            ml_units += plan["ml_capacity"]
+
+        if tick % 2:
+            plan = buy(
+                barrels,
+                gold,
+                ml_units * planning.ML_PER_UNIT - int(ml.sum()),
+                magic.per_barrel_budget,
+                magic.per_barrel_ml_limit - ml,
+            )
+            for purchase in plan:
+                i = barrel_index[purchase["sku"]]
+                gold -= barrels[i].price * purchase["quantity"]
+                ml += barrel_ml[i] * purchase["quantity"]
+        else:
+            recent = sold[max(tick - window, 0) : tick].sum(axis=0)
+            candidates = planning.bottle_candidates(
+                potions,
+                dict(zip(skus, stock.tolist())),
+                {skus[i]: int(recent[i]) for i in np.flatnonzero(recent)},
+                favorability(day, hour, FORECAST_TICKS),
+                magic.per_bottle_limit,
+            )
+            plan = bottle(
+                candidates,
+                ml.tolist(),
+                potion_units * planning.POTIONS_PER_UNIT - int(stock.sum()),
+            )
+            for bottled in plan:
+                stock[index_by_type[tuple(bottled["potion_type"])]] += bottled[
+                    "quantity"
+                ]
+                ml -= np.array(bottled["potion_type"]) * bottled["quantity"]
+
+        listed = np.zeros(len(potions), dtype=bool)
+        in_stock = {skus[i]: int(stock[i]) for i in np.flatnonzero(stock)}
+        for sku in planning.rank_catalog(in_stock, favorability(day, hour, 1)):
+            listed[skus.index(sku)] = True
+        wanted = snapshot.demand[tick % recorded]
+        bought = np.where(listed, np.minimum(wanted, stock), 0)
+        sold[tick] = bought
+        unmet[tick] = (wanted - bought).sum()
+        stock -= bought
+        gold += int(price @ bought)
+        visitors = int(snapshot.visits[tick % recorded])
+        visits += visitors
+
+        # The next tick's refit: what this tick's customers wanted.
+        carted = np.flatnonzero(wanted)
+        model.decay(now)
+        model.add_visits([now], [ANY_CLASS], [visitors])
+        model.add_sales(
+            [now] * len(carted),
+            [skus[i] for i in carted],
+            [ANY_CLASS] * len(carted),
+            wanted[carted],
+        )
+
+    potions_sold = int(sold.sum())
+    return {
+        "config": config,
+        "gold": int(gold),
+        "revenue": int((sold * price).sum()),
+        "potions_sold": potions_sold,
+        "stockouts": int(unmet.sum()),
+        "stockout_ticks": int((unmet > 0).sum()),
+        "potions_left": int(stock.sum()),
+        "ml_left": ml.tolist(),
+        "sold_per_visit": potions_sold / visits if visits else None,
+    }
+
+
+_snapshot = None
+
+
+def _share(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+
+def _simulate_shared(args):
+    config, days = args
+    return simulate(_snapshot, config, days)
+
+
+def sweep(snapshot, grid, days, processes=None):
+    """
+    Simulates every combination of the values in grid (key -> list), in
+    parallel. The snapshot is sent to each worker process once.
+    """
+    keys = list(grid)
+    configs = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    with ProcessPoolExecutor(
+        processes, initializer=_share, initargs=(snapshot,)
+    ) as pool:
+        return list(pool.map(_simulate_shared, [(config, days) for config in configs]))
+
+
+def parse_value(text):
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def parse_grid(options):
+    """Turns ["key=v1,v2", ...] into {key: [v1, v2], ...}."""
+    grid = {}
+    for option in options:
+        key, _, values = option.partition("=")
+        grid[key] = [parse_value(value) for value in values.split(",")]
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded demand through the planners offline."
+    )
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--since", help="only replay demand from this timestamp on")
+    parser.add_argument("--until", help="only replay demand before this timestamp")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="KEY=V1,V2",
+        help="a magic number or " + ", ".join(DEFAULT_CONFIG) + " to sweep",
+    )
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.since, args.until)
+    start = time.perf_counter()
+    results = sweep(snapshot, parse_grid(args.grid), args.days, args.processes)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(results)} configurations x {args.days} days "
+        f"({args.days * TICKS_PER_DAY} ticks) in {elapsed:.1f}s"
+    )
+    print(f"{'gold':>10} {'sold':>8} {'stockouts':>10} {'out ticks':>10}  config")
+    for result in sorted(results, key=lambda result: -result["gold"]):
+        print(
+            f"{result['gold']:>10} {result['potions_sold']:>8} "
+            f"{result['stockouts']:>10} {result['stockout_ticks']:>10}  "
+            f"{result['config']}"
+        )
@@ -0,0 +1,130 @@
+"""
+Abandons open carts left untouched for CART_TTL_SECONDS, so cart_items only
+holds the carts in flight; every item change bumps a cart's updated_at.
+Every SWEEP_INTERVAL seconds a background task closes stale carts
+SWEEP_BATCH at a time, each batch in its own short transaction, deleting
+their line items. Carts a checkout or item update has locked are skipped and
+picked up by a later sweep.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import dotenv
+
+from src import database as db
+from src import queries
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+CART_TTL_SECONDS = int(os.environ.get("CART_TTL_SECONDS", 30 * 60))
+SWEEP_BATCH = int(os.environ.get("SWEEP_BATCH", 1000))
+SWEEP_INTERVAL = float(os.environ.get("SWEEP_INTERVAL", 60))
+
+ABANDON = queries.register(
+    "sweeper.abandon",
+    """
+    WITH stale AS (
+        SELECT id FROM carts
+         WHERE state = 'open'
+           AND updated_at < now() - make_interval(secs => :ttl)
+         ORDER BY updated_at
+         LIMIT :batch
+           FOR UPDATE SKIP LOCKED
+    ),
+    items AS (
+        DELETE FROM cart_items
+         WHERE cart_id IN (SELECT id FROM stale)
+     RETURNING 1
+    ),
+    closed AS (
+        UPDATE carts
+           SET state = 'abandoned', closed_at = now()
+         WHERE id IN (SELECT id FROM stale)
+     RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM closed) AS carts, (SELECT COUNT(*) FROM items) AS items
+    """,
+)
+
+# Totals for this process since it started.
+stats = {
+    "sweeps": 0,
+    "batches": 0,
+    "carts": 0,
+    "items": 0,
+    "seconds": 0.0,
+    "last_sweep": None,
+}
+
+_sweeper = None
+
+
+def start():
+    """Starts the background sweeper on the running event loop."""
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.create_task(_sweep_forever())
+
+
+async def stop():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
+
+
+async def sweep():
+    """Abandons every stale open cart, a batch per transaction; returns the counts."""
+    start_time = time.perf_counter()
+    carts = items = 0
+    while True:
+        async with db.async_engine.begin() as connection:
+            batch = (
+                await connection.execute(
+                    ABANDON, {"ttl": CART_TTL_SECONDS, "batch": SWEEP_BATCH}
+                )
+            ).one()
+        stats["batches"] += 1
+        carts += batch.carts
+        items += batch.items
+        if batch.carts < SWEEP_BATCH:
+            break
+    elapsed = time.perf_counter() - start_time
+    stats["sweeps"] += 1
+    stats["carts"] += carts
+    stats["items"] += items
+    stats["seconds"] += elapsed
+    stats["last_sweep"] = datetime.now(timezone.utc).isoformat()
+    if carts:
+        logger.info(
+            "Carts abandoned",
+            extra={"carts": carts, "items": items, "seconds": elapsed},
+        )
+    return carts, items
+
+
+def throughput():
+    """stats, plus the carts and line items swept per second spent sweeping."""
+    seconds = stats["seconds"]
+    return {
+        **stats,
+        "carts_per_second": stats["carts"] / seconds if seconds else 0.0,
+        "items_per_second": stats["items"] / seconds if seconds else 0.0,
+    }
+
+
+async def _sweep_forever():
+    while True:
+        try:
+            await sweep()
+        except Exception:
+            logger.exception("Cart sweep failed")
+        await asyncio.sleep(SWEEP_INTERVAL)
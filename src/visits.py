@@ -0,0 +1,118 @@
+"""
+Buffers customer visits in process and writes them to customer_visits in
+batches with COPY, so /carts/visits returns as soon as a tick is queued.
+
+The buffer is bounded: once MAX_BUFFERED rows are waiting, enqueue() waits
+up to ENQUEUE_TIMEOUT seconds for the flusher to make room. Rows a failed
+flush puts back are kept up to MAX_BUFFERED too, dropping the oldest.
+Buffered rows are flushed every FLUSH_INTERVAL seconds, as soon as
+FLUSH_ROWS are waiting, and on shutdown.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+import dotenv
+
+from src import database as db
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+dotenv.load_dotenv()
+MAX_BUFFERED = 200_000
+FLUSH_ROWS = 10_000
+FLUSH_INTERVAL = 2.0
+ENQUEUE_TIMEOUT = float(os.environ.get("VISITS_ENQUEUE_TIMEOUT", 5.0))
+COLUMNS = ["name", "class", "level", "day_of_week", "timestamp"]
+
+_buffer = []
+_changed = None
+_flusher = None
+
+
+def start():
+    """Starts the background flusher on the running event loop."""
+    global _changed, _flusher
+    if _flusher is None:
+        _changed = asyncio.Condition()
+        _flusher = asyncio.create_task(_flush_forever())
+
+
+async def stop():
+    """Stops the flusher and writes out everything still buffered."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    await flush()
+
+
+async def enqueue(visits):
+    """
+    Buffers (name, class, level, day_of_week) tuples stamped with the time
+    they arrived, waiting for room if the buffer is full. Raises
+    asyncio.TimeoutError if there is still no room after ENQUEUE_TIMEOUT
+    seconds.
+    """
+    start()
+    now = datetime.now(timezone.utc)
+    rows = [(*visit, now) for visit in visits]
+    async with _changed:
+        await asyncio.wait_for(
+            _changed.wait_for(
+                lambda: not _buffer or len(_buffer) + len(rows) <= MAX_BUFFERED
+            ),
+            ENQUEUE_TIMEOUT,
+        )
+        _buffer.extend(rows)
+        if len(_buffer) >= FLUSH_ROWS:
+            _changed.notify_all()
+
+
+async def flush():
+    """Writes every buffered visit with a single COPY."""
+    global _buffer
+    rows, _buffer = _buffer, []
+    if rows:
+        try:
+            async with db.async_engine.connect() as connection:
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    "customer_visits", records=rows, columns=COLUMNS
+                )
+        except Exception:
+            # Keep the rows for the next flush rather than dropping a tick,
+            # as many as fit.
+            _buffer = rows + _buffer
+            dropped = len(_buffer) - MAX_BUFFERED
+            if dropped > 0:
+                del _buffer[:dropped]
+                metrics.drop_visits(dropped)
+                logger.warning("Visits dropped", extra={"dropped": dropped})
+            raise
+    if _changed is not None:
+        async with _changed:
+            _changed.notify_all()
+    return len(rows)
+
+
+async def _flush_forever():
+    while True:
+        async with _changed:
+            try:
+                await asyncio.wait_for(
+                    _changed.wait_for(lambda: len(_buffer) >= FLUSH_ROWS),
+                    FLUSH_INTERVAL,
+                )
+            except asyncio.TimeoutError:
+                pass
+        try:
+            await flush()
+        except Exception:
+            logger.exception("Failed to flush visits", extra={"buffered": len(_buffer)})
@@ -0,0 +1,82 @@
+import os
+
+import dotenv
+import pytest
+import sqlalchemy
+
+dotenv.load_dotenv()
+
+# Tests that query take the database fixture and run against
+# TEST_POSTGRES_URI, a scratch database of their own, never the POSTGRES_URI
+# the app is configured with. src.database builds its engines from
+# POSTGRES_URI at import, which only needs a URL; nothing connects until a
+# query runs, so without a test database the fixture skips those tests.
+DATABASE_URI = os.environ.get("TEST_POSTGRES_URI")
+os.environ["POSTGRES_URI"] = DATABASE_URI or "postgresql://no-test-database/test"
+
+
+@pytest.fixture(scope="session")
+def database():
+    """src.database, once a connection to TEST_POSTGRES_URI has succeeded."""
+    if not DATABASE_URI:
+        pytest.skip("TEST_POSTGRES_URI is not set")
+    from src import database as db
+
+    try:
+        with db.engine.connect():
+            pass
+    except sqlalchemy.exc.OperationalError as error:
+        pytest.skip(f"database is unreachable: {error.orig}")
+    return db
+
+
+class FakeResult:
+    """A result whose rows, row or scalar are all the scripted value."""
+
+    def __init__(self, value, rowcount):
+        self.value = value
+        self.rowcount = rowcount
+
+    def all(self):
+        return self.value
+
+    def one(self):
+        return self.value
+
+    def scalar_one(self):
+        return self.value
+
+
+class FakeConnection:
+    """
+    Stands in for db.async_engine and the connections it hands out. Every
+    execute is recorded in executed and answered with the next of results,
+    or no rows once they run out; each touches rowcount rows.
+    """
+
+    def __init__(self, results=(), rowcount=1):
+        self.results = list(results)
+        self.rowcount = rowcount
+        self.executed = []
+        self.transactions = 0
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        self.transactions += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        value = self.results.pop(0) if self.results else []
+        return FakeResult(value, self.rowcount)
+
+
+@pytest.fixture
+def fake_connection():
+    """FakeConnection, for tests of code that runs queries without a database."""
+    return FakeConnection
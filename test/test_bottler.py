@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from src import forecast, planning, refdata, reservations
+from src.api import bottler
+
+
+@pytest.fixture
+def shop(monkeypatch, fake_connection):
+    """One red potion to bottle, with free ml and room read from a queue."""
+    # Only the velocity read is left to run; it finds no sales.
+    monkeypatch.setattr(bottler.db, "async_engine", fake_connection())
+    monkeypatch.setattr(
+        refdata, "potions", {"RED": refdata.Potion("RED", 50, [100, 0, 0, 0], True)}
+    )
+    monkeypatch.setattr(refdata, "magic", refdata.MagicNumbers(0, 0, 0, 0, 10))
+    monkeypatch.setattr(forecast, "favorability", lambda ticks: {})
+    free = []
+
+    async def available(connection):
+        return free.pop(0)
+
+    async def lock(connection):
+        pass
+
+    reserved = []
+
+    async def reserve(connection, kind, plan, **amounts):
+        reserved.append(amounts)
+
+    monkeypatch.setattr(bottler, "available", available)
+    monkeypatch.setattr(reservations, "lock", lock)
+    monkeypatch.setattr(reservations, "reserve", reserve)
+    return free, reserved
+
+
+def test_plans_off_the_event_loop(shop, monkeypatch):
+    free, reserved = shop
+    free.extend([({}, [1000, 0, 0, 0], 50)] * 2)
+    threads = []
+
+    def greedy(*args):
+        threads.append(threading.current_thread())
+        return planning.greedy_bottle_plan(*args)
+
+    monkeypatch.setitem(planning.BOTTLE_PLANNERS, "greedy", greedy)
+    plan = asyncio.run(bottler.get_bottle_plan(window_hours=4))
+    assert plan == [{"potion_type": [100, 0, 0, 0], "quantity": 10}]
+    assert threading.main_thread() not in threads
+    assert reserved == [{"ml_out": [1000, 0, 0, 0], "potions_in": 10}]
+
+
+def test_overtaken_plan_is_solved_again(shop):
+    free, reserved = shop
+    # Another plan reserves most of the red between solving and locking.
+    free.extend([({}, [1000, 0, 0, 0], 50)] + [({}, [300, 0, 0, 0], 50)] * 2)
+    plan = asyncio.run(bottler.get_bottle_plan(window_hours=4))
+    assert plan == [{"potion_type": [100, 0, 0, 0], "quantity": 3}]
+    assert reserved == [{"ml_out": [300, 0, 0, 0], "potions_in": 3}]
+
+
+def test_plan_still_overtaken_is_solved_under_the_lock(shop):
+    free, reserved = shop
+    free.extend(
+        [({}, [1000, 0, 0, 0], 50)]
+        + [({}, [600 - 200 * i, 0, 0, 0], 50) for i in range(bottler.PLAN_ATTEMPTS)]
+    )
+    plan = asyncio.run(bottler.get_bottle_plan(window_hours=4))
+    assert reserved == [{"ml_out": [200, 0, 0, 0], "potions_in": 2}]
+    assert plan == [{"potion_type": [100, 0, 0, 0], "quantity": 2}]
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from src.api import carts
+
+ROW = {
+    "line_item_id": 42,
+    "customer_name": "Ada",
+    "item_sku": "3 RED_POTION",
+    "line_item_total": 150,
+    "timestamp": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+}
+
+
+@pytest.mark.parametrize("sort_col", list(carts.search_sort_options))
+@pytest.mark.parametrize("sort_order", list(carts.search_sort_order))
+@pytest.mark.parametrize("direction", ["prev", "next"])
+def test_search_page_round_trips(sort_col, sort_order, direction):
+    token = carts.encode_search_page(ROW, direction, sort_col, sort_order)
+    cursor = carts.decode_search_page(token, sort_col, sort_order)
+    assert cursor == {
+        "col": sort_col.value,
+        "order": sort_order.value,
+        "dir": direction,
+        "key": ROW[sort_col.value],
+        "item_id": ROW["line_item_id"],
+    }
+
+
+def test_first_page_has_no_cursor():
+    assert (
+        carts.decode_search_page(
+            "", carts.search_sort_options.timestamp, carts.search_sort_order.desc
+        )
+        is None
+    )
+
+
+def test_search_page_is_tied_to_its_sort():
+    token = carts.encode_search_page(
+        ROW, "next", carts.search_sort_options.timestamp, carts.search_sort_order.desc
+    )
+    for sort_col, sort_order in [
+        (carts.search_sort_options.customer_name, carts.search_sort_order.desc),
+        (carts.search_sort_options.timestamp, carts.search_sort_order.asc),
+    ]:
+        with pytest.raises(HTTPException) as error:
+            carts.decode_search_page(token, sort_col, sort_order)
+        assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "search_page", ["not a token", "e30=", "bnVsbA==", "W10=", "eyJjb2wiOiAxfQ=="]
+)
+def test_malformed_search_page_is_rejected(search_page):
+    with pytest.raises(HTTPException) as error:
+        carts.decode_search_page(
+            search_page,
+            carts.search_sort_options.customer_name,
+            carts.search_sort_order.asc,
+        )
+    assert error.value.status_code == 400
+
+
+def test_batch_items_are_upserted_in_one_statement(monkeypatch, fake_connection):
+    connection = fake_connection(rowcount=2)
+    monkeypatch.setattr(carts.db, "async_engine", connection)
+    lines = [
+        carts.CartLine(sku="RED", quantity=1),
+        carts.CartLine(sku="GREEN", quantity=2),
+        carts.CartLine(sku="RED", quantity=3),
+    ]
+    assert asyncio.run(carts.set_item_quantities(7, lines)) == "OK"
+    [(statement, params)] = connection.executed
+    assert statement is carts.UPSERT_ITEMS
+    assert params["id"] == 7
+    # A repeated sku takes its last quantity.
+    assert dict(zip(params["skus"], params["quantities"])) == {"RED": 3, "GREEN": 2}
+
+
+def test_batch_items_on_a_closed_cart_conflict(fake_connection):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(carts.upsert_items(fake_connection(rowcount=0), 7, {"RED": 1}))
+    assert error.value.status_code == 409
+    # Nothing to set is not a conflict.
+    asyncio.run(carts.upsert_items(fake_connection(rowcount=0), 7, {}))
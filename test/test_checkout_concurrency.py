@@ -0,0 +1,95 @@
+import asyncio
+import sqlalchemy
+from fastapi import HTTPException
+
+from src.api import carts
+
+SKU = "TEST_CHECKOUT"
+STOCK = 20
+CARTS = 60
+
+# Removes only what this test wrote: its carts and their lines, and its
+# scratch sku's ledger rows. Each checkout's gold row is written in the same
+# statement as its potion rows, so it shares their now() timestamp.
+CLEAN_UP = """
+    DELETE FROM cart_item_history WHERE cart_id = ANY(CAST(:cart_ids AS bigint[]));
+    DELETE FROM cart_items WHERE cart_id = ANY(CAST(:cart_ids AS bigint[]));
+    DELETE FROM carts WHERE id = ANY(CAST(:cart_ids AS bigint[]));
+    DELETE FROM gold_records
+     WHERE change_in_gold = 0
+       AND timestamp IN (SELECT timestamp FROM potion_records
+                          WHERE sku = :sku AND qty_change < 0);
+    DELETE FROM sales_rollups WHERE sku = :sku;
+    DELETE FROM potion_records WHERE sku = :sku;
+    DELETE FROM potion_balances WHERE sku = :sku;
+    DELETE FROM potion_index WHERE sku = :sku;
+"""
+
+
+async def checkout_all(database, cart_ids):
+    for i in range(CARTS):
+        customer = carts.Customer(
+            customer_name=f"test-checkout-{i}", character_class="Test", level=1
+        )
+        cart_id = (await carts.create_cart(customer))["cart_id"]
+        await carts.set_item_quantity(cart_id, SKU, carts.CartItem(quantity=1))
+        cart_ids.append(cart_id)
+
+    async def attempt(cart_id):
+        try:
+            await carts.checkout(cart_id, carts.CartCheckout(payment="test"))
+            return True
+        except HTTPException as error:
+            assert error.status_code == 409
+            return False
+
+    try:
+        return await asyncio.gather(*(attempt(cart_id) for cart_id in cart_ids))
+    finally:
+        # The pool's connections belong to this event loop.
+        await database.async_engine.dispose()
+
+
+def test_concurrent_checkouts_never_oversell(database):
+    cart_ids = []
+    try:
+        with database.engine.begin() as connection:
+            # Free, so the checkouts' gold rows are zero and easy to remove.
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potion_index (sku, price, do_bottle)
+                         VALUES (:sku, 0, FALSE);
+                    INSERT INTO potion_records (sku, qty_change)
+                         VALUES (:sku, :stock);
+                    """
+                ),
+                {"sku": SKU, "stock": STOCK},
+            )
+
+        outcomes = asyncio.run(checkout_all(database, cart_ids))
+
+        with database.engine.connect() as connection:
+            after = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT (SELECT quantity FROM potion_balances WHERE sku = :sku)
+                               AS balance,
+                           (SELECT SUM(qty_change) FROM potion_records WHERE sku = :sku)
+                               AS ledger,
+                           (SELECT COUNT(*) FROM carts
+                             WHERE id = ANY(CAST(:cart_ids AS bigint[]))
+                               AND state = 'checked_out') AS checked_out
+                    """
+                ),
+                {"sku": SKU, "cart_ids": cart_ids},
+            ).one()
+        assert sum(outcomes) == STOCK
+        assert after.checked_out == STOCK
+        assert after.balance == 0
+        assert after.ledger == after.balance
+    finally:
+        with database.engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text(CLEAN_UP), {"sku": SKU, "cart_ids": cart_ids}
+            )
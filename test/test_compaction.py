@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+
+from src import compaction
+
+BALANCES = """
+    SELECT (SELECT COALESCE(json_object_agg(sku, quantity ORDER BY sku), '{}')
+              FROM potion_balances
+             WHERE quantity <> 0) AS potions,
+           (SELECT ARRAY[red, green, blue, dark] FROM ml_balance) AS ml,
+           (SELECT gold FROM gold_balance) AS gold,
+           (SELECT ARRAY[potion_units, ml_units] FROM capacity_balance) AS capacity
+"""
+
+
+def test_compaction_leaves_totals_and_balances_unchanged(database):
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # A sku whose rows all net to zero folds into no snapshot row.
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potion_index (sku, do_bottle)
+                         VALUES ('TEST_COMPACTION', FALSE);
+                    INSERT INTO potion_records (sku, qty_change, timestamp)
+                         VALUES ('TEST_COMPACTION', 5, :old),
+                                ('TEST_COMPACTION', -5, :old);
+                    INSERT INTO ml_records (red, green, blue, dark, timestamp)
+                         VALUES (100, 0, 0, 0, :old), (0, 0, 0, 50, :old);
+                    INSERT INTO gold_records (change_in_gold, timestamp)
+                         VALUES (10, :old), (-3, :old);
+                    INSERT INTO capacity_records (potion_units, ml_units, timestamp)
+                         VALUES (1, 0, :old);
+                    """
+                ),
+                {"old": old},
+            )
+            before = compaction.totals(connection)
+            balances = connection.execute(sqlalchemy.text(BALANCES)).one()
+
+            folded = compaction.compact(connection, old + timedelta(days=1))
+
+            assert compaction.totals(connection) == before
+            assert connection.execute(sqlalchemy.text(BALANCES)).one() == balances
+            assert folded["potion_records"] >= 2
+            assert folded["ml_records"] >= 2
+            archived = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT COUNT(*) FROM potion_records_archive
+                     WHERE sku = 'TEST_COMPACTION'
+                    """
+                )
+            ).scalar_one()
+            assert archived == 2
+            remaining = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT COUNT(*) FROM potion_records
+                     WHERE sku = 'TEST_COMPACTION'
+                    """
+                )
+            ).scalar_one()
+            assert remaining == 0
+        finally:
+            transaction.rollback()
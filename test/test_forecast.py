@@ -0,0 +1,140 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from src import forecast, game_clock
+
+Tick = namedtuple("Tick", ["id", "time", "day", "hour"])
+Visit = namedtuple("Visit", ["id", "time", "customer_class"])
+Sale = namedtuple("Sale", ["id", "time", "sku", "customer_class", "quantity"])
+
+START = 1_700_000_000.0
+HOUR = 60 * 60
+MONDAY = game_clock.DAYS[1]
+
+
+def fitted():
+    """A model that has seen two ticks: Warriors buy red, Wizards blue."""
+    model = forecast.DemandModel()
+    model.add_ticks([START, START + 2 * HOUR], [MONDAY, MONDAY], [0, 2])
+    model.add_visits([START, START + 60], ["Warrior", "Wizard"], [4, 2])
+    model.add_sales(
+        [START + 30, START + 90, START + 2 * HOUR + 5],
+        ["RED", "BLUE", "RED"],
+        ["Warrior", "Wizard", "Warrior"],
+        [2, 3, 1],
+    )
+    return model
+
+
+def test_rows_are_placed_in_the_tick_they_fall_in():
+    model = fitted()
+    days, slots, valid = model.place([START - 1, START + 10, START + 3 * HOUR])
+    assert valid.tolist() == [False, True, True]
+    assert days[1:].tolist() == [1, 1]
+    assert slots[1:].tolist() == [0, 1]
+
+
+def test_rows_before_any_tick_are_dropped():
+    model = forecast.DemandModel()
+    model.add_visits([START], ["Warrior"], [5])
+    assert model.visits.sum() == 0
+    assert "Warrior" in model.classes
+
+
+def test_demand_per_slot_and_per_visitor():
+    model = fitted()
+    red, blue = model.skus["RED"], model.skus["BLUE"]
+    average = model.demand(MONDAY, 0)
+    assert average[red] == pytest.approx(2)
+    assert average[blue] == pytest.approx(3)
+    # Per visit: a Warrior buys 0.5 red, a Wizard 1.5 blue.
+    expected = model.demand(MONDAY, 1, {"Warrior": 2, "Wizard": 4})
+    assert expected[red] == pytest.approx(1)
+    assert expected[blue] == pytest.approx(6)
+    assert model.demand("Someday", 0).tolist() == [0, 0]
+
+
+def test_weights_average_one_and_rank_by_demand():
+    model = fitted()
+    weights = model.weights(MONDAY, 0, skus=["RED", "BLUE", "GREEN"])
+    assert np.mean(list(weights.values())) == pytest.approx(1)
+    assert weights["BLUE"] > weights["RED"] > weights["GREEN"] > 0
+
+
+def test_weights_look_ahead_across_the_day():
+    model = fitted()
+    model.add_ticks([START + 24 * HOUR], [game_clock.DAYS[2]], [0])
+    model.add_sales([START + 24 * HOUR + 1], ["GREEN"], ["Warrior"], [10])
+    # From Monday's last slot, two ticks reach into the next day's first.
+    late = model.weights(MONDAY, 22, ticks=2)
+    assert max(late, key=late.get) == "GREEN"
+
+
+def test_decay_halves_counts_every_half_life():
+    model = fitted()
+    model.decay(START)
+    model.decay(START + forecast.HALF_LIFE_DAYS * forecast.DAY_SECONDS)
+    assert model.visits.sum() == pytest.approx(3)
+    assert model.ticks.sum() == pytest.approx(1)
+    assert model.sales.sum() == pytest.approx(3)
+
+
+def test_ready_after_min_visits(monkeypatch):
+    monkeypatch.setattr(forecast, "MIN_VISITS", 6)
+    model = forecast.DemandModel()
+    model.add_ticks([START], [MONDAY], [0])
+    model.add_visits([START], ["Warrior"], [5])
+    assert not model.ready()
+    model.add_visits([START + 1], ["Warrior"], [1])
+    assert model.ready()
+
+
+def refit(fake_connection, until, ticks=(), visits=(), sales=()):
+    """Runs _refit on answers to its queries; returns the ids each read after."""
+    connection = fake_connection([until, list(ticks), list(visits), list(sales)])
+    asyncio.run(forecast._refit(connection))
+    return [params["after"] for _, params in connection.executed if params]
+
+
+def test_watermark_reads_late_commits_once():
+    Row = namedtuple("Row", ["id"])
+    watermark = forecast.Watermark()
+    assert watermark.advance([Row(1), Row(3)]) == [Row(1), Row(3)]
+    # 2 committed after 3; both are read again and only 2 is new.
+    assert watermark.after == 0
+    assert watermark.advance([Row(1), Row(2), Row(3), Row(4)]) == [Row(2), Row(4)]
+    assert watermark.after == 3
+    assert watermark.advance([Row(4), Row(5)]) == [Row(5)]
+    assert watermark.after == 4
+
+
+def test_refit_reads_each_row_once(monkeypatch, fake_connection):
+    monkeypatch.setattr(forecast, "model", forecast.DemandModel())
+    first = datetime.fromtimestamp(START + HOUR, timezone.utc)
+    visits = [Visit(i, START, "Warrior") for i in range(1, 5)]
+    after = refit(
+        fake_connection,
+        first,
+        ticks=[Tick(1, START, MONDAY, 0)],
+        visits=visits,
+        sales=[Sale(1, START + 30, "RED", "Warrior", 2)],
+    )
+    assert after == [0, 0, 0]
+    assert forecast.model.visits.sum() == 4
+
+    # A flush that failed and was retried lands visits stamped an hour ago.
+    second = first + timedelta(hours=1)
+    late = Visit(5, START + 60, "Warrior")
+    after = refit(fake_connection, second, visits=visits + [late])
+    decayed = 4 * 0.5 ** (1 / 24 / forecast.HALF_LIFE_DAYS)
+    assert after == [0, 0, 0]
+    assert forecast.model.visits.sum() == pytest.approx(decayed + 1)
+    assert forecast.model.fitted_until == second.timestamp()
+
+    after = refit(fake_connection, second, visits=[late])
+    assert after == [1, 4, 1]
+    assert forecast.model.visits.sum() == pytest.approx(decayed + 1)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from src import listener
+
+
+class Connection:
+    """Stands in for the asyncpg LISTEN connection."""
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.on_terminate = []
+        self.terminated = False
+
+    def add_termination_listener(self, callback):
+        self.on_terminate.append(callback)
+
+    def drop(self):
+        for callback in self.on_terminate:
+            callback(self)
+
+    async def fetchval(self, query):
+        if not self.healthy:
+            raise ConnectionError("connection reset")
+        return 1
+
+    def terminate(self):
+        self.terminated = True
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Connections listener._connect hands out, in order; None fails."""
+    queue = []
+
+    async def connect():
+        connection = queue.pop(0)
+        if connection is None:
+            raise OSError("connection refused")
+        return connection
+
+    monkeypatch.setattr(listener, "_connect", connect)
+    monkeypatch.setattr(listener, "_resyncs", [])
+    monkeypatch.setattr(listener, "RECONNECT_MIN", 0.01)
+    monkeypatch.setattr(listener, "HEALTH_INTERVAL", 0.01)
+    return queue
+
+
+async def until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_reconnects_and_resyncs_when_postgres_drops_it(connections):
+    first, second = Connection(), Connection()
+    connections.extend([first, None, second])
+    resynced = []
+
+    async def resync():
+        resynced.append(listener._connection)
+
+    async def run():
+        listener.on_reconnect(resync)
+        await listener.start()
+        try:
+            assert listener._connection is first
+            await until(lambda: first.on_terminate)
+            first.drop()
+            await until(lambda: resynced)
+        finally:
+            await listener.stop()
+
+    asyncio.run(run())
+    assert first.terminated
+    assert resynced == [second]
+
+
+def test_reconnects_when_pings_fail(connections):
+    stale, fresh = Connection(healthy=False), Connection()
+    connections.extend([stale, fresh])
+
+    async def run():
+        await listener.start()
+        try:
+            await until(lambda: listener._connection is fresh)
+        finally:
+            await listener.stop()
+
+    asyncio.run(run())
+    assert stale.terminated
+    assert listener._watcher is None
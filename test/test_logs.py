@@ -0,0 +1,38 @@
+from pydantic import BaseModel
+
+from src import logs
+
+
+class Barrel(BaseModel):
+    sku: str
+    quantity: int
+
+
+def test_summarize_keeps_the_first_items_and_the_count():
+    summary = logs.summarize(list(range(10)))
+    assert summary == {"count": 10, "sample": [0, 1, 2]}
+    assert logs.summarize(("a", "b"), sample=1) == {"count": 2, "sample": ["a"]}
+
+
+def test_summarize_turns_models_into_dicts():
+    barrels = [Barrel(sku=f"BARREL_{i}", quantity=i) for i in range(5)]
+    assert logs.summarize(barrels, sample=2) == {
+        "count": 5,
+        "sample": [
+            {"sku": "BARREL_0", "quantity": 0},
+            {"sku": "BARREL_1", "quantity": 1},
+        ],
+    }
+
+
+def test_summarize_nested_lists():
+    assert logs.summarize([[1, 2, 3, 4]], sample=2) == {
+        "count": 1,
+        "sample": [{"count": 4, "sample": [1, 2]}],
+    }
+
+
+def test_summarize_leaves_other_values_alone():
+    assert logs.summarize({"sku": "RED"}) == {"sku": "RED"}
+    assert logs.summarize(None) is None
+    assert logs.summarize([]) == {"count": 0, "sample": []}
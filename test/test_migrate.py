@@ -0,0 +1,23 @@
+from src import migrate
+
+
+def versions():
+    return [path.stem for path in sorted(migrate.MIGRATIONS.glob("*.sql"))]
+
+
+def test_migrations_have_unique_numbers():
+    numbers = [version.split("_", 1)[0] for version in versions()]
+    assert len(set(numbers)) == len(numbers)
+
+
+def test_renumbered_versions_name_existing_files():
+    assert set(migrate.RENUMBERED.values()) <= set(versions())
+    assert set(migrate.IN_SCHEMA) <= set(versions())
+    # An old name is never reused by a different file.
+    assert not set(migrate.RENUMBERED) & set(versions())
+
+
+def test_ledger_changes_come_before_partitioning():
+    order = versions()
+    for version in migrate.IN_SCHEMA:
+        assert order.index(version) < order.index("0006_partition_ledgers")
@@ -0,0 +1,160 @@
+from collections import namedtuple
+
+import pytest
+
+from src import planning
+
+Potion = namedtuple("Potion", ["sku", "price", "potion_type", "do_bottle"])
+
+POTIONS = [
+    Potion("RED", 50, [100, 0, 0, 0], True),
+    Potion("GREEN", 40, [0, 100, 0, 0], True),
+    Potion("PURPLE", 80, [50, 0, 50, 0], True),
+    Potion("DARK", 90, [0, 0, 0, 100], False),
+]
+
+
+def candidates(stock=None, velocity=None, favorability=None, pt_limit=10):
+    return planning.bottle_candidates(
+        POTIONS, stock or {}, velocity or {}, favorability or {}, pt_limit
+    )
+
+
+def ml_used(plan):
+    return [
+        sum(line["quantity"] * line["potion_type"][i] for line in plan)
+        for i in range(4)
+    ]
+
+
+def test_rank_catalog_lists_favored_then_stocked_potions():
+    stock = {f"P{i}": i for i in range(10)}
+    ranked = planning.rank_catalog(stock, {"P1": 2.0, "P3": 0.5})
+    assert ranked == ["P1", "P9", "P8", "P7", "P6", "P5"]
+    assert "P0" not in planning.rank_catalog({"P0": 0}, {})
+
+
+def test_bottle_candidates_skip_unbottled_and_full_potions():
+    found = candidates(stock={"GREEN": 10, "RED": 4})
+    assert [c.potion_type for c in found] == [[50, 0, 50, 0], [100, 0, 0, 0]]
+    assert [c.brewable_pt for c in found] == [10, 6]
+
+
+def test_bottle_candidates_order_and_neutral_favorability():
+    found = candidates(velocity={"GREEN": 3}, favorability={"RED": -1, "PURPLE": 2})
+    assert [c.potion_type for c in found] == [
+        [0, 100, 0, 0],
+        [50, 0, 50, 0],
+        [100, 0, 0, 0],
+    ]
+    assert found[2].favorability == 1.0
+
+
+def test_capacity_plan_buys_potion_capacity_first():
+    plan = planning.capacity_plan(2500, 1, 1, 2, 5)
+    assert plan == {"potion_capacity": 1, "ml_capacity": 1}
+    assert planning.capacity_plan(-10, 0, 0, 5, 5) == {
+        "potion_capacity": 0,
+        "ml_capacity": 0,
+    }
+
+
+@pytest.mark.parametrize("potions_left", [0, 3, 8, 50])
+def test_vectorized_bottle_plan_matches_greedy(potions_left):
+    found = candidates(velocity={"PURPLE": 5})
+    ml_list = [600, 250, 300, 0]
+    assert planning.vectorized_bottle_plan(
+        found, ml_list, potions_left
+    ) == planning.greedy_bottle_plan(found, ml_list, potions_left)
+
+
+@pytest.mark.parametrize("mode", sorted(planning.BOTTLE_PLANNERS))
+def test_bottle_plans_fit_ml_room_and_limits(mode):
+    found = candidates(stock={"RED": 8})
+    ml_list = [600, 250, 300, 0]
+    plan = planning.BOTTLE_PLANNERS[mode](found, ml_list, 6)
+    assert all(used <= ml for used, ml in zip(ml_used(plan), ml_list))
+    assert sum(line["quantity"] for line in plan) <= 6
+    brewable = {tuple(c.potion_type): c.brewable_pt for c in found}
+    for line in plan:
+        assert 0 < line["quantity"] <= brewable[tuple(line["potion_type"])]
+    assert ml_list == [600, 250, 300, 0]
+
+
+def test_knapsack_bottle_plan_beats_greedy_order():
+    # Greedy spends the red on the cheap potion it walks first.
+    found = [
+        planning.BottleCandidate([100, 0, 0, 0], 10, 5, 1.0, 10),
+        planning.BottleCandidate([50, 0, 50, 0], 100, 0, 1.0, 10),
+    ]
+    ml_list = [200, 0, 200, 0]
+    greedy = planning.greedy_bottle_plan(found, ml_list, 10)
+    knapsack = planning.knapsack_bottle_plan(found, ml_list, 10)
+    assert greedy == [{"potion_type": [100, 0, 0, 0], "quantity": 2}]
+    assert knapsack == [{"potion_type": [50, 0, 50, 0], "quantity": 4}]
+
+
+def test_bottle_planners_handle_nothing_to_bottle():
+    for planner in planning.BOTTLE_PLANNERS.values():
+        assert planner([], [100, 100, 100, 100], 10) == []
+
+
+Barrel = namedtuple(
+    "Barrel", ["sku", "ml_per_barrel", "potion_type", "price", "quantity"]
+)
+
+BARRELS = [
+    Barrel("SMALL_RED", 500, [1, 0, 0, 0], 100, 10),
+    Barrel("MEDIUM_RED", 2500, [1, 0, 0, 0], 250, 10),
+    Barrel("SMALL_GREEN", 500, [0, 1, 0, 0], 100, 10),
+    Barrel("MIXED", 1000, [1, 0, 1, 0], 120, 5),
+]
+
+
+def barrel_ml(plan):
+    by_sku = {barrel.sku: barrel for barrel in BARRELS}
+    return [
+        sum(
+            line["quantity"]
+            * by_sku[line["sku"]].ml_per_barrel
+            * by_sku[line["sku"]].potion_type[i]
+            for line in plan
+        )
+        for i in range(4)
+    ]
+
+
+def test_barrels_by_colour_lists_most_ml_first():
+    assert planning.barrels_by_colour(BARRELS) == [[1, 3, 0], [2], [3], []]
+
+
+def test_greedy_barrel_plan_buys_largest_barrel_of_most_needed_colour():
+    plan = planning.greedy_barrel_plan(BARRELS, 1000, 20000, 1000, [5000, 500, 0, 0])
+    assert plan == [
+        {"sku": "MEDIUM_RED", "quantity": 2},
+        {"sku": "SMALL_GREEN", "quantity": 1},
+    ]
+
+
+@pytest.mark.parametrize("mode", sorted(planning.BARREL_PLANNERS))
+def test_barrel_plans_fit_gold_and_ml(mode):
+    gold, ml_left = 700, 6000
+    plan = planning.BARREL_PLANNERS[mode](
+        BARRELS, gold, ml_left, gold, [5000, 1000, 0, 0]
+    )
+    by_sku = {barrel.sku: barrel for barrel in BARRELS}
+    assert sum(line["quantity"] * by_sku[line["sku"]].price for line in plan) <= gold
+    assert sum(barrel_ml(plan)) <= ml_left
+    for line in plan:
+        assert 0 < line["quantity"] <= by_sku[line["sku"]].quantity
+
+
+def test_optimal_barrel_plan_respects_each_colours_need():
+    plan = planning.optimal_barrel_plan(BARRELS, 10000, 20000, 10000, [3000, 500, 0, 0])
+    assert all(ml <= need for ml, need in zip(barrel_ml(plan), [3000, 500, 0, 0]))
+    assert sum(barrel_ml(plan)) == 3500
+
+
+def test_optimal_barrel_plan_buys_nothing_unaffordable():
+    assert planning.optimal_barrel_plan(BARRELS, 50, 20000, 50, [5000] * 4) == []
+    assert planning.optimal_barrel_plan([], 1000, 20000, 1000, [5000] * 4) == []
@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy
+
+from src import export, queries, sweeper  # noqa: F401 registers statements
+from src.api import bottler, carts  # noqa: F401
+
+NOW = datetime.now(timezone.utc)
+
+# Registered statements the shop runs on every tick or request, with
+# parameters to plan them with. "indexed" names a table every scan of which
+# must go through an index; "pruned" names a partition the plan must not
+# touch.
+PLANS = {
+    "bottler.velocity.recent": {
+        "params": {"skus": ["RED", "GREEN"], "window_hours": 4},
+        "indexed": "sales_rollups",
+    },
+    "export.potion_records.sku": {
+        "params": {"sku": "RED"},
+        "indexed": "potion_records",
+    },
+    "carts.search.timestamp.desc.name": {
+        "params": {"c_name": "%bench%"},
+        "indexed": "carts",
+    },
+    "carts.search.timestamp.desc": {
+        "params": {},
+        "indexed": "cart_item_history",
+    },
+    "sweeper.abandon": {
+        "params": {"ttl": 30 * 60, "batch": 1000},
+        "indexed": "carts",
+    },
+    "export.gold_records.since": {
+        "params": {"since": NOW - timedelta(days=1)},
+        "pruned": "gold_records_history",
+    },
+    "export.customer_visits.since.until": {
+        "params": {"since": NOW - timedelta(hours=2), "until": NOW},
+        "pruned": "customer_visits_history",
+    },
+}
+
+
+def scans(plan):
+    """Yields (node type, relation) for every scan node in a JSON plan."""
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+@pytest.fixture(scope="module")
+def connection(database):
+    """
+    A connection that plans without sequential scans, which on small tables
+    are cheaper and would hide whether an index is usable at all.
+    """
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        connection.execute(sqlalchemy.text("SET LOCAL enable_seqscan = off"))
+        yield connection
+        transaction.rollback()
+
+
+def plan_scans(connection, name, params):
+    plan = connection.execute(
+        sqlalchemy.text("EXPLAIN (FORMAT JSON) " + queries.statements[name].text),
+        params,
+    ).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(scans(plan[0]["Plan"]))
+
+
+@pytest.mark.parametrize("name", sorted(PLANS))
+def test_query_plan(connection, name):
+    spec = PLANS[name]
+    nodes = plan_scans(connection, name, spec["params"])
+    if "indexed" in spec:
+        table = spec["indexed"]
+        assert not [
+            relation
+            for node_type, relation in nodes
+            if node_type == "Seq Scan"
+            and (relation == table or relation.startswith(table + "_"))
+        ], f"{name} scans {table} sequentially: {nodes}"
+    if "pruned" in spec:
+        assert spec["pruned"] not in [
+            relation for _, relation in nodes
+        ], f"{name} scans {spec['pruned']}: {nodes}"
+
+
+def test_planned_statements_are_registered():
+    assert set(PLANS) <= set(queries.statements)
@@ -0,0 +1,58 @@
+import asyncio
+
+import sqlalchemy
+
+from src import reservations
+
+
+def test_plan_key_ignores_order_and_empty_lines():
+    plan = [{"sku": "SMALL_RED", "quantity": 2}, {"sku": "SMALL_BLUE", "quantity": 1}]
+    delivered = [("SMALL_BLUE", 1), ("SMALL_GREEN", 0), ("SMALL_RED", 2)]
+    assert reservations.plan_key(
+        (line["sku"], line["quantity"]) for line in plan
+    ) == reservations.plan_key(delivered)
+
+
+def test_plan_key_tells_plans_apart():
+    assert reservations.plan_key([([100, 0, 0, 0], 5)]) != reservations.plan_key(
+        [([100, 0, 0, 0], 4)]
+    )
+    assert reservations.plan_key(
+        {"potion_capacity": 1, "ml_capacity": 0}.items()
+    ) != reservations.plan_key({"potion_capacity": 0, "ml_capacity": 1}.items())
+
+
+LIVE = """
+    SELECT plan FROM plan_reservations
+     WHERE kind = 'test' AND expires_at > now()
+  ORDER BY id
+"""
+
+
+async def deliver_out_of_order(database, monkeypatch):
+    first = reservations.plan_key([("SMALL_RED", 1)])
+    second = reservations.plan_key([("SMALL_BLUE", 1)])
+    expired = reservations.plan_key([("SMALL_GREEN", 1)])
+    try:
+        async with database.async_engine.connect() as connection:
+            transaction = await connection.begin()
+            monkeypatch.setattr(reservations, "RESERVATION_SECONDS", -1)
+            await reservations.reserve(connection, "test", expired, gold=100)
+            monkeypatch.setattr(reservations, "RESERVATION_SECONDS", 300)
+            await reservations.reserve(connection, "test", first, gold=100)
+            await reservations.reserve(connection, "test", second, gold=100)
+
+            # A late delivery of the expired plan, and a repeat of the second.
+            await reservations.release(connection, "test", expired)
+            await reservations.release(connection, "test", second)
+            await reservations.release(connection, "test", second)
+            live = (await connection.execute(sqlalchemy.text(LIVE))).scalars().all()
+            await transaction.rollback()
+        return live, first
+    finally:
+        await database.async_engine.dispose()
+
+
+def test_delivery_releases_only_its_own_live_plan(database, monkeypatch):
+    live, first = asyncio.run(deliver_out_of_order(database, monkeypatch))
+    assert live == [first]
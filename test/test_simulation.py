@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from src import game_clock, simulation
+from src.refdata import Potion
+
+
+@pytest.mark.parametrize(
+    "text, value",
+    [("10", 10), ("-3", -3), ("0.5", 0.5), ("True", True), ("false", False)],
+)
+def test_parse_value(text, value):
+    assert simulation.parse_value(text) == value
+    assert type(simulation.parse_value(text)) is type(value)
+
+
+def test_parse_value_keeps_other_text():
+    assert simulation.parse_value("knapsack") == "knapsack"
+    assert simulation.parse_value("") == ""
+
+
+def test_parse_grid():
+    grid = simulation.parse_grid(
+        [
+            "per_bottle_limit=20,50",
+            "bottle_planner=greedy,knapsack",
+            "use_forecast=false",
+        ]
+    )
+    assert grid == {
+        "per_bottle_limit": [20, 50],
+        "bottle_planner": ["greedy", "knapsack"],
+        "use_forecast": [False],
+    }
+
+
+def test_parse_grid_last_option_for_a_key_wins():
+    assert simulation.parse_grid(["window_hours=2", "window_hours=4,8"]) == {
+        "window_hours": [4, 8]
+    }
+
+
+def snapshot(ticks=simulation.TICKS_PER_DAY):
+    potions = [
+        Potion("RED", 50, [100, 0, 0, 0], True),
+        Potion("GREEN", 40, [0, 100, 0, 0], True),
+    ]
+    demand = np.tile(np.array([[2, 1]], dtype=np.int64), (ticks, 1))
+    return simulation.Snapshot(
+        potions,
+        {},
+        simulation.DEFAULT_MAGIC,
+        demand,
+        np.full(ticks, 3, dtype=np.int64),
+        [game_clock.DAYS[0]] * ticks,
+    )
+
+
+@pytest.mark.parametrize("bottle_planner", sorted(simulation.planning.BOTTLE_PLANNERS))
+def test_simulate_sells_only_what_is_wanted(bottle_planner):
+    barrels = [
+        simulation.Barrel("SMALL_RED_BARREL", 500, [1, 0, 0, 0], 100, 10),
+        simulation.Barrel("SMALL_GREEN_BARREL", 500, [0, 1, 0, 0], 100, 10),
+    ]
+    outcome = simulation.simulate(
+        snapshot(), {"bottle_planner": bottle_planner}, 2, barrels
+    )
+    ticks = 2 * simulation.TICKS_PER_DAY
+    assert outcome["potions_sold"] + outcome["stockouts"] == 3 * ticks
+    assert outcome["potions_sold"] > 0
+    assert outcome["gold"] >= 0
+    assert outcome["sold_per_visit"] == outcome["potions_sold"] / (3 * ticks)
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+
+import pytest
+import sqlalchemy
+
+from src import sweeper
+from src.api import carts
+
+Batch = namedtuple("Batch", ["carts", "items"])
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    fresh = {
+        "sweeps": 0,
+        "batches": 0,
+        "carts": 0,
+        "items": 0,
+        "seconds": 0.0,
+        "last_sweep": None,
+    }
+    monkeypatch.setattr(sweeper, "stats", fresh)
+    monkeypatch.setattr(sweeper, "SWEEP_BATCH", 2)
+    monkeypatch.setattr(sweeper, "CART_TTL_SECONDS", 60)
+    return sweeper.stats
+
+
+def test_sweep_runs_batches_until_one_is_short(monkeypatch, stats, fake_connection):
+    engine = fake_connection([Batch(2, 5), Batch(2, 1), Batch(1, 0)])
+    monkeypatch.setattr(sweeper.db, "async_engine", engine)
+    assert asyncio.run(sweeper.sweep()) == (5, 6)
+    # A transaction per batch.
+    assert engine.transactions == 3
+    assert engine.executed == [(sweeper.ABANDON, {"ttl": 60, "batch": 2})] * 3
+    assert stats["batches"] == 3
+    assert stats["sweeps"] == 1
+    assert (stats["carts"], stats["items"]) == (5, 6)
+    assert stats["last_sweep"] is not None
+
+
+def test_sweep_with_nothing_stale(monkeypatch, stats, fake_connection):
+    engine = fake_connection([Batch(0, 0)])
+    monkeypatch.setattr(sweeper.db, "async_engine", engine)
+    assert asyncio.run(sweeper.sweep()) == (0, 0)
+    assert stats["batches"] == 1
+
+
+def test_throughput(stats):
+    assert sweeper.throughput()["carts_per_second"] == 0.0
+    stats.update(carts=10, items=30, seconds=2.0)
+    rates = sweeper.throughput()
+    assert rates["carts_per_second"] == 5.0
+    assert rates["items_per_second"] == 15.0
+    assert rates["carts"] == 10
+
+
+def test_recently_changed_old_cart_survives(database):
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            busy, idle = connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potion_index (sku, do_bottle)
+                         VALUES ('TEST_SWEEPER', FALSE);
+                    INSERT INTO carts (customer_name, customer_class, level,
+                                       timestamp, updated_at)
+                         VALUES ('test-sweeper-busy', 'Test', 1, :old, :old),
+                                ('test-sweeper-idle', 'Test', 1, :old, :old)
+                      RETURNING id
+                    """
+                ),
+                {"old": datetime.now(timezone.utc) - timedelta(hours=2)},
+            ).scalars()
+            # Created two hours ago, but the customer is still adding items.
+            connection.execute(
+                carts.SET_ITEM,
+                {"id": busy, "sku": "TEST_SWEEPER", "quantity": 1, "day": None},
+            )
+            connection.execute(sweeper.ABANDON, {"ttl": 30 * 60, "batch": 1000})
+            states = dict(
+                connection.execute(
+                    sqlalchemy.text(
+                        "SELECT id, state FROM carts WHERE id IN (:busy, :idle)"
+                    ),
+                    {"busy": busy, "idle": idle},
+                ).all()
+            )
+            assert states == {busy: "open", idle: "abandoned"}
+        finally:
+            transaction.rollback()
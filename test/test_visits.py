@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from src import metrics, visits
+
+
+class Unreachable:
+    """An engine whose connections fail, after arriving visits are queued."""
+
+    def __init__(self, arriving=()):
+        self.arriving = arriving
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        await visits.enqueue(self.arriving)
+        raise ConnectionError("database is down")
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    monkeypatch.setattr(visits, "_buffer", [])
+    monkeypatch.setattr(visits, "_changed", None)
+    monkeypatch.setattr(visits, "_flusher", None)
+    monkeypatch.setattr(visits, "MAX_BUFFERED", 5)
+    # Left to the test to flush.
+    monkeypatch.setattr(visits, "FLUSH_ROWS", 1000)
+    monkeypatch.setattr(visits, "FLUSH_INTERVAL", 1000)
+    monkeypatch.setattr(visits.db, "async_engine", Unreachable())
+
+
+def visit(i):
+    return (f"customer-{i}", "Test", 1, "Edgeday")
+
+
+async def stop_flusher():
+    visits._flusher.cancel()
+    try:
+        await visits._flusher
+    except asyncio.CancelledError:
+        pass
+
+
+def test_failed_flush_keeps_the_newest_rows_up_to_the_cap(buffer, monkeypatch):
+    # Four visits arrive while three are being flushed.
+    monkeypatch.setattr(
+        visits.db, "async_engine", Unreachable([visit(i) for i in range(3, 7)])
+    )
+
+    async def run():
+        await visits.enqueue([visit(i) for i in range(3)])
+        try:
+            with pytest.raises(ConnectionError):
+                await visits.flush()
+        finally:
+            await stop_flusher()
+
+    dropped = metrics.visits_dropped
+    asyncio.run(run())
+    assert [row[0] for row in visits._buffer] == [f"customer-{i}" for i in range(2, 7)]
+    assert metrics.visits_dropped == dropped + 2
+
+
+def test_enqueue_times_out_while_the_buffer_is_full(buffer, monkeypatch):
+    monkeypatch.setattr(visits, "ENQUEUE_TIMEOUT", 0.01)
+
+    async def run():
+        await visits.enqueue([visit(i) for i in range(5)])
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await visits.enqueue([visit(5)])
+        finally:
+            await stop_flusher()
+
+    asyncio.run(run())
+    assert len(visits._buffer) == 5